@@ -1,24 +1,24 @@
 import streamlit as st
 import os
 import time
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import json
-from dotenv import load_dotenv
+
+from progress import StreamlitProgress
+
+# Heavy modules (chromadb, langchain, openai, logfire, pandas, plotly) are
+# imported inside the code paths that need them so the first paint is not
+# blocked on them. Run `python -m benchmarks.startup` after touching imports.
 
 # Load environment variables from .env file
 #load_dotenv()
 
-for key, value in st.secrets.items():
-    os.environ[key] = value
-
-from scraper import SamsaraCustomerScraper
-from rag_engine import RAGEngine
-from vector_store import VectorStore
-from observability import ObservabilityTracker
-from evaluation import EvaluationMetrics
+try:
+    for key, value in st.secrets.items():
+        os.environ[key] = value
+except FileNotFoundError:
+    # No secrets.toml; rely on the process environment
+    pass
 
 # Page configuration
 st.set_page_config(
@@ -27,45 +27,37 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
+# Initialize session state (per-session state is only chat history and config;
+# the engine, vector store and trackers are shared process-wide)
 if 'initialized' not in st.session_state:
     st.session_state.initialized = False
     st.session_state.messages = []
     st.session_state.query_history = []
-    st.session_state.performance_data = []
+
+def get_resources():
+    """Get the engine resources shared by all sessions"""
+    from resources import get_shared_resources
+    return get_shared_resources()
 
 def initialize_app():
     """Initialize the application components"""
     if not st.session_state.initialized:
         with st.spinner("Initializing application..."):
             try:
-                # Initialize observability tracker
-                st.session_state.obs_tracker = ObservabilityTracker()
+                vector_store = get_resources().vector_store
                 
-                # Initialize vector store
-                st.session_state.vector_store = VectorStore()
+                # Read-only serving processes use whatever index the writer has built
+                if vector_store.read_only:
+                    st.session_state.initialized = True
+                    return True
                 
-                # Initialize RAG engine
-                st.session_state.rag_engine = RAGEngine(
-                    vector_store=st.session_state.vector_store,
-                    obs_tracker=st.session_state.obs_tracker
-                )
-                
-                # Initialize evaluation metrics
-                st.session_state.evaluator = EvaluationMetrics()
-                
-                # Check if data exists, if not scrape it
-                if not st.session_state.vector_store.is_populated():
-                    st.info("No existing data found. Scraping Samsara customer stories...")
-                    scraper = SamsaraCustomerScraper()
-                    stories = scraper.scrape_customer_stories()
-                    
-                    if stories:
-                        st.session_state.vector_store.populate_store(stories)
-                        st.success(f"Successfully scraped and indexed {len(stories)} customer stories!")
-                    else:
-                        st.error("Failed to scrape customer stories. Please check your connection.")
-                        return False
+                if not vector_store.is_populated():
+                    # Scraping runs as a background job; sessions only poll its status
+                    get_resources().ingest_runner.submit('refresh', trigger='first run')
+                    st.info("No existing data found. Scraping Samsara customer stories in the background...")
+                else:
+                    # Stores built before a granularity was configured lack its collection
+                    vector_store.ensure_granularities(progress=StreamlitProgress())
                 
                 st.session_state.initialized = True
                 return True
@@ -75,6 +67,57 @@ def initialize_app():
                 return False
     return True
 
+# How often a session re-reads the ingest job's status while showing it
+JOB_POLL_SECONDS = 2
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def ingest_job_status(location: str):
+    """Status of the latest ingest job, re-read every few seconds without rerunning the page
+    
+    location keeps the widget keys apart where the status is shown twice.
+    """
+    runner = get_resources().ingest_runner
+    jobs = runner.jobs(limit=1)
+    if not jobs:
+        st.caption("No ingest jobs have run yet.")
+        return
+    job = jobs[0]
+    
+    started = datetime.fromtimestamp(job['created']).strftime('%Y-%m-%d %H:%M:%S')
+    st.markdown(f"**{job['kind'].title()} job** started {started} ({job['trigger']}): **{job['status']}**")
+    if job['status'] in ('queued', 'running'):
+        st.progress(job['progress'], text=job['message'])
+        if st.button("Cancel job", key=f"cancel_ingest_job_{location}"):
+            runner.cancel(job['id'])
+            st.info("Cancelling after the current story...")
+    elif job['status'] == 'succeeded':
+        st.success(job['message'])
+    elif job['status'] == 'failed':
+        st.error(job['message'])
+    else:
+        st.warning(f"{job['message']} after scraping {job['scraped']} and indexing {job['indexed']} stories")
+    if job['status'] in ('interrupted', 'cancelled', 'failed'):
+        if st.button("Resume job", key=f"resume_ingest_job_{location}"):
+            runner.resume(job['id'])
+            st.rerun(scope="fragment")
+    
+    if job['messages']:
+        with st.expander("Job log"):
+            for entry in reversed(job['messages']):
+                logged = datetime.fromtimestamp(entry['time']).strftime('%H:%M:%S')
+                st.text(f"{logged} {entry['level']:<8} {entry['message']}")
+    
+    next_run = runner.next_scheduled()
+    if next_run is not None:
+        st.caption(f"Next scheduled update: {datetime.fromtimestamp(next_run).strftime('%Y-%m-%d %H:%M')}")
+    
+    # Once the job this session watched finishes, rerun the page so the stats show its result
+    if job['status'] in ('queued', 'running'):
+        st.session_state.watched_ingest_job = job['id']
+    elif st.session_state.get('watched_ingest_job') == job['id']:
+        del st.session_state.watched_ingest_job
+        st.rerun()
+
 def main():
     # Display logo and title
     col1, col2 = st.columns([1, 12])
@@ -89,6 +132,11 @@ def main():
     if not initialize_app():
         st.stop()
     
+    # Until the first ingest job has indexed something, show how far it has got
+    resources = get_resources()
+    if resources.ingest_runner is not None and not resources.vector_store.is_populated():
+        ingest_job_status("main")
+    
     # Create tabs
     tab1, tab2, tab3, tab4 = st.tabs(["Chat", "Configuration", "Evaluation", "Knowledge Base"])
     
@@ -128,7 +176,7 @@ def chat_interface():
         st.caption(f"{len(st.session_state.messages)} messages in conversation")
     
     # Check if vector store has data
-    stats = st.session_state.vector_store.get_stats()
+    stats = get_resources().vector_store.get_stats()
     if stats.get('total_chunks', 0) == 0:
         st.warning("WARNING: The knowledge base is empty. Please go to the Configuration tab and click 'Refresh Database' to load customer stories.")
         return
@@ -206,13 +254,14 @@ def chat_interface():
                 try:
                     # Show spinner while processing
                     with st.spinner(""):
-                        response = st.session_state.rag_engine.query(prompt, config)
+                        response = get_resources().rag_engine.query(prompt, config, progress=StreamlitProgress())
                     end_time = time.time()
                     
                     # Display the complete response
                     message_placeholder.markdown(response["answer"])
                     
-                    # Store performance data
+                    # Per-message performance; the tracker also records the query in
+                    # the durable performance log read by the Evaluation tab
                     performance_data = {
                         "query": prompt,
                         "strategy": config["strategy"],
@@ -221,7 +270,6 @@ def chat_interface():
                         "tokens_used": response.get("tokens_used", 0),
                         "sources_count": len(response.get("sources", []))
                     }
-                    st.session_state.performance_data.append(performance_data)
                     
                     # Add assistant message to history
                     st.session_state.messages.append({
@@ -317,7 +365,7 @@ def configuration_interface():
             max_value=2000,
             value=1000,
             step=100,
-            help="Size of text chunks for processing"
+            help="Size of text chunks to search; queries use the indexed granularity closest to this"
         )
         
         chunk_overlap = st.slider(
@@ -426,7 +474,7 @@ def configuration_interface():
     st.subheader("Vector Database Management")
     
     # Show database stats
-    stats = st.session_state.vector_store.get_stats()
+    stats = get_resources().vector_store.get_stats()
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -445,41 +493,30 @@ def configuration_interface():
     # Database actions
     st.subheader("Database Actions")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if st.button("🔄 Refresh Database", help="Clear and re-scrape all customer stories"):
-            with st.spinner("Refreshing database..."):
-                from scraper import SamsaraCustomerScraper
-                scraper = SamsaraCustomerScraper()
-                customer_stories = scraper.scrape_customer_stories()
-                
-                if customer_stories:
-                    st.session_state.vector_store.refresh_store(customer_stories)
-                    st.success("Database refreshed successfully!")
-                    st.rerun()
-                else:
-                    st.error("Failed to scrape customer stories")
-    
-    with col2:
-        if st.button("➕ Update Database", help="Add new stories without removing existing ones"):
-            with st.spinner("Updating database..."):
-                from scraper import SamsaraCustomerScraper
-                scraper = SamsaraCustomerScraper()
-                customer_stories = scraper.scrape_customer_stories()
-                
-                if customer_stories:
-                    st.session_state.vector_store.add_or_update_stories(customer_stories)
-                    st.success("Database updated successfully!")
-                    st.rerun()
-                else:
-                    st.error("Failed to scrape customer stories")
+    # Scraping and indexing run as background jobs; queries keep using the
+    # current index until each batch of stories is written
+    runner = get_resources().ingest_runner
+    if runner is None:
+        st.info("This process serves a read-only index; ingest jobs run in the writer process.")
+    else:
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if st.button("🔄 Refresh Database", help="Re-scrape and re-index all customer stories in the background, "
+                                                    "removing ones no longer published"):
+                runner.submit('refresh')
+        
+        with col2:
+            if st.button("➕ Update Database", help="Scrape in the background and index new or changed stories"):
+                runner.submit('update')
+        
+        ingest_job_status("configuration")
     
     # Warning for clear action
     with st.expander("DANGER ZONE"):
         st.warning("**Clear Database**: This action will permanently delete all stored customer stories and embeddings.")
         if st.button("Clear All Data", type="primary"):
-            if st.session_state.vector_store.clear_store():
+            if get_resources().vector_store.clear_store(progress=StreamlitProgress()):
                 st.success("Database cleared successfully!")
                 st.rerun()
             else:
@@ -489,52 +526,81 @@ def evaluation_interface():
     """Performance evaluation and monitoring interface"""
     st.header("Performance Evaluation & Monitoring")
     
-    if not st.session_state.performance_data:
+    import pandas as pd
+    import plotly.express as px
+    from sketches import MetricStats
+    
+    # Aggregates come from the durable log shared by every session and kept
+    # across restarts, not from this session's memory
+    perf_log = get_resources().obs_tracker.perf_log
+    time_ranges = {"Last hour": 1, "Last 24 hours": 24, "Last 7 days": 168, "All time": None}
+    range_label = st.selectbox("Time range", list(time_ranges), index=1, key="evaluation_time_range")
+    hours = time_ranges[range_label]
+    since = time.time() - hours * 3600 if hours else None
+    
+    by_strategy = perf_log.summarize(since=since)
+    overall = MetricStats.merged(group['stats'] for group in by_strategy.values())
+    
+    if not overall.count:
         st.info("No performance data available. Start chatting to see metrics!")
         return
     
-    # Convert performance data to DataFrame
-    df = pd.DataFrame(st.session_state.performance_data)
-    
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        avg_response_time = df['response_time'].mean()
-        st.metric("Avg Response Time", f"{avg_response_time:.2f}s")
+        st.metric("Avg Response Time", f"{overall.mean_response_time:.2f}s")
     
     with col2:
-        total_queries = len(df)
-        st.metric("Total Queries", total_queries)
+        st.metric("Total Queries", overall.count)
     
     with col3:
-        avg_tokens = df['tokens_used'].mean() if 'tokens_used' in df else 0
-        st.metric("Avg Tokens Used", f"{avg_tokens:.0f}")
+        st.metric("Avg Tokens Used", f"{overall.tokens_sum / overall.count:.0f}")
     
     with col4:
-        avg_sources = df['sources_count'].mean()
-        st.metric("Avg Sources Retrieved", f"{avg_sources:.1f}")
+        st.metric("Avg Sources Retrieved", f"{overall.sources_sum / overall.count:.1f}")
     
     # Performance over time
     st.subheader("Performance Over Time")
+    series = pd.DataFrame(perf_log.timeseries(since=since, bucket_seconds=300 if hours == 1 else 3600))
+    series['bucket_start'] = pd.to_datetime(series['bucket_start'], unit='s')
     fig_time = px.line(
-        df, 
-        x='timestamp', 
-        y='response_time',
+        series, 
+        x='bucket_start', 
+        y='avg_response_time',
         color='strategy',
+        markers=True,
         title="Response Time Over Time by Strategy"
     )
     st.plotly_chart(fig_time, width='stretch')
     
     # Strategy comparison
     st.subheader("Strategy Performance Comparison")
-    strategy_stats = df.groupby('strategy').agg({
-        'response_time': ['mean', 'std'],
-        'tokens_used': 'mean',
-        'sources_count': 'mean'
-    }).round(3)
     
-    st.dataframe(strategy_stats)
+    def stats_table(groups, label):
+        rows = []
+        for name, group in groups.items():
+            stats = group['stats']
+            rows.append({
+                label: name,
+                'queries': stats.count,
+                'errors': group['errors'],
+                'avg_response_time': stats.mean_response_time,
+                'std_response_time': stats.std_response_time,
+                'p50_response_time': stats.response_times.quantile(0.5),
+                'p95_response_time': stats.response_times.quantile(0.95),
+                'avg_tokens_used': stats.tokens_sum / stats.count if stats.count else 0,
+                'avg_sources': stats.sources_sum / stats.count if stats.count else 0,
+            })
+        return pd.DataFrame(rows).set_index(label).round(3)
+    
+    st.dataframe(stats_table(by_strategy, 'strategy'))
+    
+    st.subheader("Performance by Query Intent")
+    st.dataframe(stats_table(perf_log.summarize(since=since, by='intent'), 'intent'))
+    
+    # Distributions use the most recent raw queries in the range
+    df = perf_log.to_store(since=since, limit=5000).to_pandas()
     
     # Response time distribution
     col1, col2 = st.columns(2)
@@ -562,16 +628,17 @@ def evaluation_interface():
     st.subheader("Query History")
     
     # Display recent queries
-    for i, data in enumerate(reversed(st.session_state.performance_data[-10:]), 1):
-        with st.expander(f"Query {len(st.session_state.performance_data) - i + 1}: {data['query'][:60]}..."):
+    for data in perf_log.query(since=since, limit=10, newest_first=True):
+        with st.expander(f"{data['query'][:60]}..."):
             col1, col2 = st.columns(2)
             with col1:
                 st.write(f"**Strategy:** {data['strategy']}")
                 st.write(f"**Response Time:** {data['response_time']:.2f}s")
-                st.write(f"**Timestamp:** {data['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
+                st.write(f"**Timestamp:** {datetime.fromtimestamp(data['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}")
             with col2:
+                st.write(f"**Status:** {data['status']}")
                 st.write(f"**Tokens Used:** {data.get('tokens_used', 'N/A')}")
-                st.write(f"**Sources Retrieved:** {data['sources_count']}")
+                st.write(f"**Sources Retrieved:** {data['num_sources']}")
     
     # Export data
     st.subheader("Export Performance Data")
@@ -591,7 +658,7 @@ def evaluation_interface():
     
     with col2:
         # JSON export
-        json_data = json.dumps(st.session_state.performance_data, default=str, indent=2)
+        json_data = df.to_json(orient='records', date_format='iso', indent=2)
         st.download_button(
             label="📄 Download JSON",
             data=json_data,
@@ -625,7 +692,7 @@ def knowledge_base_interface():
     st.header("Knowledge Base - Indexed Customer Stories")
     
     # Get statistics
-    stats = st.session_state.vector_store.get_stats()
+    stats = get_resources().vector_store.get_stats()
     
     # Display summary metrics
     col1, col2, col3 = st.columns(3)
@@ -639,12 +706,14 @@ def knowledge_base_interface():
     st.divider()
     
     # Get all full documents
-    full_docs = st.session_state.vector_store.full_documents
+    full_docs = get_resources().vector_store.full_documents
     
     if not full_docs:
         st.warning("WARNING: No customer stories in the knowledge base. Go to Configuration tab to load data.")
         return
     
+    import pandas as pd
+    
     # Convert to table format
     table_data = []
     for url, story in full_docs.items():
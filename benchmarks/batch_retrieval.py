@@ -0,0 +1,85 @@
+"""Batched multi-query retrieval throughput
+
+Compares answering N queries one at a time with VectorStore.similarity_search
+against VectorStore.similarity_search_batch (one encoder batch and one ANN call
+per batch), at batch sizes 1, 16 and 128. Also times RAGEngine.query_batch
+with generation disabled, the path offline evaluation uses.
+
+Usage:
+    python -m benchmarks.batch_retrieval [--queries 256] [--k 5] [--embedding hashing|default]
+"""
+import json
+import argparse
+import tempfile
+from typing import Any, Dict
+
+from benchmarks.common import Timer, build_store, load_corpus, sample_queries
+
+BATCH_SIZES = [1, 16, 128]
+
+def run_benchmark(store, queries, k: int = 5, batch_sizes=BATCH_SIZES, engine=None) -> Dict[str, Any]:
+    report = {'queries': len(queries), 'k': k, 'batch_sizes': {}}
+    
+    # Warm up the encoder and the index
+    store.similarity_search_batch(queries[:4], k=k)
+    
+    with Timer() as sequential:
+        for query in queries:
+            store.similarity_search(query, k=k)
+    report['sequential_qps'] = len(queries) / sequential.elapsed
+    
+    for batch_size in batch_sizes:
+        with Timer() as batched:
+            for start in range(0, len(queries), batch_size):
+                store.similarity_search_batch(queries[start:start + batch_size], k=k)
+        
+        entry = {
+            'store_qps': len(queries) / batched.elapsed,
+            'ms_per_query': batched.elapsed / len(queries) * 1000,
+        }
+        entry['speedup_vs_sequential'] = entry['store_qps'] / report['sequential_qps']
+        
+        if engine is not None:
+            config = {'strategy': 'naive', 'top_k': k, 'use_adaptive_retrieval': False}
+            with Timer() as engine_timer:
+                for start in range(0, len(queries), batch_size):
+                    engine.query_batch(queries[start:start + batch_size], config, generate=False)
+            entry['engine_qps'] = len(queries) / engine_timer.elapsed
+        
+        report['batch_sizes'][batch_size] = entry
+    
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched retrieval throughput benchmark")
+    parser.add_argument('--queries', type=int, default=256)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    
+    from rag_engine import RAGEngine
+    from observability import ObservabilityTracker
+    
+    stories = load_corpus()
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = build_store(stories, persist_directory, args.embedding)
+        engine = RAGEngine(vector_store=store, obs_tracker=ObservabilityTracker())
+        report = run_benchmark(store, sample_queries(stories, args.queries), k=args.k, engine=engine)
+    report['embedding'] = args.embedding
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"{report['queries']} queries, k={report['k']}, embedding={args.embedding}")
+    print(f"  sequential similarity_search: {report['sequential_qps']:.1f} q/s")
+    for batch_size, entry in report['batch_sizes'].items():
+        line = (f"  batch {batch_size:>4}: {entry['store_qps']:8.1f} q/s "
+                f"({entry['ms_per_query']:.2f} ms/query, {entry['speedup_vs_sequential']:.2f}x)")
+        if 'engine_qps' in entry:
+            line += f" | query_batch(generate=False): {entry['engine_qps']:.1f} q/s"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Retrieval latency and quality per chunk granularity
+
+Builds one store indexed at several (chunk_size, chunk_overlap)
+granularities, embedding each distinct text once across all of them, then
+runs the labeled retrieval benchmark against each granularity by routing
+through the config's chunk_size/chunk_overlap. Shows what smaller or larger
+chunks cost in latency and buy (or lose) in recall, MRR and nDCG.
+
+Usage:
+    python -m benchmarks.chunk_sweep [--granularities 250:50,500:100,1000:200,2000:400]
+        [--strategies naive] [--embedding hashing|default] [--json]
+"""
+import os
+import json
+import argparse
+import tempfile
+from typing import Any, Dict, Sequence, Tuple
+
+from benchmarks.common import REPO_ROOT, Timer, get_embedding_function, load_corpus
+from benchmarks.retrieval_quality import DEFAULT_DATASET, DEFAULT_KS, load_dataset, run_benchmark
+
+DEFAULT_GRANULARITIES = "250:50,500:100,1000:200,2000:400"
+
+def run_sweep(engine, dataset: Dict[str, Any], granularities: Sequence[Tuple[int, int]],
+              strategies: Sequence[str] = ('naive',), ks: Sequence[int] = DEFAULT_KS) -> Dict[str, Any]:
+    """Benchmark every strategy at every granularity"""
+    store = engine.vector_store
+    report = {'granularities': {}}
+    for size, overlap in granularities:
+        result = run_benchmark(engine, dataset, strategies, ks,
+                               config={'chunk_size': size, 'chunk_overlap': overlap})
+        report['granularities'][f"{size}/{overlap}"] = {
+            'chunks': store.collections[(size, overlap)].count(),
+            'runs': result['runs'],
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk granularity sweep")
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    parser.add_argument('--granularities', default=DEFAULT_GRANULARITIES)
+    parser.add_argument('--strategies', default='naive')
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    from vector_store import VectorStore, parse_granularities
+    from rag_engine import RAGEngine
+    from observability import ObservabilityTracker
+    from llm_backend import SimulatedLLMBackend
+
+    dataset = load_dataset(args.dataset)
+    stories = load_corpus(os.path.join(REPO_ROOT, dataset['corpus']))
+    granularities = parse_granularities(args.granularities)
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = VectorStore(persist_directory=persist_directory, granularities=granularities,
+                            embedding_function=get_embedding_function(args.embedding))
+        with Timer() as build:
+            store.populate_store(stories)
+        engine = RAGEngine(vector_store=store, obs_tracker=ObservabilityTracker(stage_spans=False),
+                           llm=SimulatedLLMBackend(sleep=False))
+        report = run_sweep(engine, dataset, granularities, args.strategies.split(","))
+
+    report.update({
+        'embedding': args.embedding,
+        'build_seconds': build.elapsed,
+        'documents_indexed': store.build_stats['documents'],
+        'texts_embedded': store.build_stats['embedded'],
+    })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Built {len(granularities)} granularities in {report['build_seconds']:.1f}s: "
+          f"{report['documents_indexed']} documents, {report['texts_embedded']} embedded "
+          f"({report['documents_indexed'] - report['texts_embedded']} reused)")
+    print("| granularity | run | chunks | recall@5 | mrr | ndcg@5 | p50_ms | p95_ms |")
+    print("|---|---|---|---|---|---|---|---|")
+    for granularity, entry in report['granularities'].items():
+        for name, run in entry['runs'].items():
+            print(f"| {granularity} | {name} | {entry['chunks']} | {run['recall@5']:.3f} | {run['mrr']:.3f} "
+                  f"| {run['ndcg@5']:.3f} | {run['p50_ms']:.1f} | {run['p95_ms']:.1f} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Chunking throughput: offset chunker vs the existing splitters
+
+Splits the content of every corpus story with LangChain's
+RecursiveCharacterTextSplitter, `utils.chunk_text` and their offset-based
+counterparts in `chunking`, and reports throughput in MB/s of source text.
+Also checks that the offset chunkers return the same chunks (modulo
+surrounding whitespace) as the splitters they replace.
+
+Usage:
+    python -m benchmarks.chunking [--granularities 500:100,1000:200,2000:400] [--repeat 5] [--json]
+"""
+import json
+import argparse
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from benchmarks.common import DEFAULT_CORPUS, Timer, load_corpus
+
+DEFAULT_GRANULARITIES = "500:100,1000:200,2000:400"
+SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+
+def throughput(split: Callable[[str], Any], texts: List[str], repeat: int) -> Dict[str, float]:
+    """Best-of-`repeat` MB/s for splitting every text once"""
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+    best = float('inf')
+    for _ in range(repeat):
+        with Timer() as timer:
+            for text in texts:
+                split(text)
+        best = min(best, timer.elapsed)
+    return {'seconds': best, 'mb_per_s': megabytes / best if best else float('inf')}
+
+def agreement(reference: Callable[[str], List[str]], candidate: Callable[[str], List[str]],
+              texts: List[str]) -> int:
+    """Number of texts whose chunks differ once whitespace is normalized"""
+    def normalize(chunks):
+        return [" ".join(chunk.split()) for chunk in chunks]
+    return sum(normalize(reference(text)) != normalize(candidate(text)) for text in texts)
+
+def run_benchmark(texts: List[str], granularities: Sequence[Tuple[int, int]],
+                  repeat: int = 5) -> Dict[str, Any]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from chunking import OffsetTextSplitter, sentence_chunk_spans
+    from utils import chunk_text
+
+    report = {'texts': len(texts), 'megabytes': sum(len(t.encode('utf-8')) for t in texts) / 1e6,
+              'granularities': {}}
+    for size, overlap in granularities:
+        recursive = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap, separators=SEPARATORS)
+        offsets = OffsetTextSplitter(size, overlap, SEPARATORS)
+
+        def sentence_chunks(text):
+            return [text[start:end] for start, end in sentence_chunk_spans(text, size, overlap)]
+
+        report['granularities'][f"{size}/{overlap}"] = {
+            'runs': {
+                'langchain_recursive': throughput(recursive.split_text, texts, repeat),
+                'offset_recursive': throughput(offsets.split_text, texts, repeat),
+                'offset_recursive_spans': throughput(offsets.split_spans, texts, repeat),
+                'utils_chunk_text': throughput(lambda text: chunk_text(text, size, overlap), texts, repeat),
+                'offset_sentence_spans': throughput(lambda text: sentence_chunk_spans(text, size, overlap),
+                                                    texts, repeat),
+            },
+            'mismatches': {
+                'offset_recursive': agreement(recursive.split_text, offsets.split_text, texts),
+                'offset_sentence': agreement(lambda text: chunk_text(text, size, overlap), sentence_chunks, texts),
+            },
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking throughput benchmark")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--granularities', default=DEFAULT_GRANULARITIES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    from vector_store import parse_granularities
+
+    texts = [story.get('content') or '' for story in load_corpus(args.corpus)]
+    report = run_benchmark(texts, parse_granularities(args.granularities), args.repeat)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['texts']} texts, {report['megabytes']:.2f} MB; best of {args.repeat}")
+    print("| granularity | splitter | MB/s | seconds |")
+    print("|---|---|---|---|")
+    for granularity, entry in report['granularities'].items():
+        for name, run in entry['runs'].items():
+            print(f"| {granularity} | {name} | {run['mb_per_s']:.1f} | {run['seconds']:.4f} |")
+        print(f"| {granularity} | mismatching texts | recursive: {entry['mismatches']['offset_recursive']} "
+              f"| sentence: {entry['mismatches']['offset_sentence']} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Shared helpers for building benchmark corpora, stores and queries"""
+import os
+import ast
+import time
+import pickle
+import statistics
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(REPO_ROOT, "chromadb", "full_documents.pkl")
+
+LIST_FIELDS = ['highlights', 'roi_metrics', 'challenges', 'solutions']
+
+def load_corpus(path: str = DEFAULT_CORPUS, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Load scraped customer stories from a full_documents.pkl file
+    
+    Older pickles store list fields as their repr string; those are parsed
+    back into lists so chunking matches a fresh scrape.
+    """
+    with open(path, 'rb') as f:
+        full_documents = pickle.load(f)
+    
+    stories = []
+    for story in full_documents.values():
+        story = dict(story)
+        for field in LIST_FIELDS:
+            value = story.get(field)
+            if isinstance(value, str):
+                try:
+                    parsed = ast.literal_eval(value)
+                    story[field] = parsed if isinstance(parsed, list) else [value]
+                except (ValueError, SyntaxError):
+                    story[field] = [value] if value else []
+        stories.append(story)
+    
+    return stories[:limit] if limit else stories
+
+def get_embedding_function(name: str):
+    """Embedding function by CLI name: 'default' (Chroma's ONNX model) or 'hashing' (offline)"""
+    from embeddings import HashingEmbeddingFunction
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    
+    if name == "hashing":
+        return HashingEmbeddingFunction()
+    return DefaultEmbeddingFunction()
+
+def build_store(stories: List[Dict[str, Any]], persist_directory: str, embedding: str = "hashing"):
+    """Build and populate a VectorStore in a scratch directory"""
+    from vector_store import VectorStore
+    
+    store = VectorStore(persist_directory=persist_directory,
+                        embedding_function=get_embedding_function(embedding))
+    if not store.is_populated():
+        store.populate_store(stories)
+    return store
+
+def sample_queries(stories: List[Dict[str, Any]], n: int) -> List[str]:
+    """Deterministic, varied questions derived from story metadata"""
+    templates = [
+        "How did {company} use Samsara?",
+        "What results did {company} see?",
+        "What challenges did companies in {industry} face?",
+        "Which {industry} customers improved safety?",
+        "What ROI did {company} report?",
+    ]
+    
+    queries = []
+    i = 0
+    while len(queries) < n and stories:
+        story = stories[i % len(stories)]
+        template = templates[i % len(templates)]
+        company = (story.get('company_name') or 'the customer')[:60]
+        queries.append(template.format(company=company, industry=story.get('industry') or 'logistics'))
+        i += 1
+    return queries
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+class Timer:
+    """Context manager measuring wall time in seconds"""
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,148 @@
+"""Sweep Chroma's HNSW parameters against exact search
+
+For every (M, construction_ef) pair a collection is built from the same
+embeddings, timed, and its index files measured; each search_ef is then
+applied to it in turn and single queries are scored against exact
+brute-force neighbors. Chroma reads search_ef when it loads the index, so
+the collection is reopened on a fresh client for each value, as the app
+picks it up on its next start. The report gives recall@k, p50/p99 query latency,
+build time and index size per setting, and recommends the fastest (by
+p99) setting that reaches a target recall, preferring a smaller index on
+ties.
+
+Embeddings come from the corpus (as the app indexes it) or, to see where
+the parameters start to matter, from a larger synthetic set.
+
+Usage:
+    python -m benchmarks.hnsw_tuning [--source synthetic|corpus] [--size 20000]
+        [--M 8,16,32] [--construction-ef 64,128,256] [--search-ef 10,20,40,80,160]
+        [--k 10] [--target-recall 0.95] [--json]
+"""
+import os
+import json
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmarks.common import REPO_ROOT, Timer, build_store, latency_summary, load_corpus
+from benchmarks.quantization import hnsw_disk_bytes
+from benchmarks.retrieval_quality import DEFAULT_DATASET, load_dataset
+from benchmarks.vector_backends import ADD_BATCH, synthetic_embeddings
+
+COLLECTION = "hnsw_tuning"
+
+def open_collection(directory: str, metadata: Dict[str, Any]):
+    """The tuning collection on a new client, so its index is loaded with the current settings"""
+    from chromadb.api.shared_system_client import SharedSystemClient
+    from vector_backends import ChromaBackend
+
+    SharedSystemClient.clear_system_cache()
+    return ChromaBackend(directory).get_or_create_collection(COLLECTION, metadata=metadata)
+
+def sweep(vectors: np.ndarray, queries: np.ndarray, ms: Sequence[int], construction_efs: Sequence[int],
+          search_efs: Sequence[int], k: int = 10) -> List[Dict[str, Any]]:
+    """One row per (M, construction_ef, search_ef)"""
+    from quantized_index import exact_search
+
+    truth = [set(rows) for rows in exact_search(vectors, queries, k)]
+    ids = [str(i) for i in range(len(vectors))]
+    rows = []
+    for m in ms:
+        for construction_ef in construction_efs:
+            with tempfile.TemporaryDirectory() as directory:
+                metadata = {"hnsw:space": "cosine", "hnsw:M": m, "hnsw:construction_ef": construction_ef}
+                collection = open_collection(directory, metadata)
+                with Timer() as build:
+                    for start in range(0, len(ids), ADD_BATCH):
+                        collection.add(ids=ids[start:start + ADD_BATCH], embeddings=vectors[start:start + ADD_BATCH])
+                    # The first query loads the index; count it as part of the build
+                    collection.query(query_embeddings=[queries[0]], n_results=k, include=[])
+                size = hnsw_disk_bytes(directory)
+
+                for search_ef in search_efs:
+                    # Reopening applies the new search_ef, as VectorStore does at startup
+                    collection = open_collection(directory, {**metadata, "hnsw:search_ef": search_ef})
+                    collection.query(query_embeddings=[queries[0]], n_results=k, include=[])
+                    latencies, hits = [], 0
+                    for query, expected in zip(queries, truth):
+                        with Timer() as timer:
+                            result = collection.query(query_embeddings=[query], n_results=k, include=[])
+                        latencies.append(timer.elapsed)
+                        hits += len({int(doc_id) for doc_id in result['ids'][0]} & expected)
+                    latency = latency_summary(latencies)
+                    rows.append({
+                        'M': m, 'construction_ef': construction_ef, 'search_ef': search_ef,
+                        f'recall@{k}': hits / (len(queries) * k),
+                        'p50_ms': latency['p50_ms'], 'p99_ms': latency['p99_ms'],
+                        'build_seconds': build.elapsed, 'index_mb': size / 1e6,
+                    })
+    return rows
+
+def recommend(rows: List[Dict[str, Any]], target_recall: float, k: int) -> Optional[Dict[str, Any]]:
+    """Lowest-p99 setting meeting the target recall (smaller index on ties); None if none does"""
+    eligible = [row for row in rows if row[f'recall@{k}'] >= target_recall]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda row: (round(row['p99_ms'], 1), row['index_mb'], row['build_seconds']))
+
+def load_vectors(source: str, size: int, n_queries: int, embedding: str):
+    """(vectors, queries) from the corpus's default collection, or synthetic ones"""
+    if source == 'corpus':
+        dataset = load_dataset(DEFAULT_DATASET)
+        stories = load_corpus(os.path.join(REPO_ROOT, dataset['corpus']))
+        with tempfile.TemporaryDirectory() as directory:
+            store = build_store(stories, directory, embedding)
+            vectors = np.asarray(store.collection.get(include=['embeddings'])['embeddings'], dtype=np.float32)
+            queries = np.asarray(store.embed_queries([q['question'] for q in dataset['questions']]),
+                                 dtype=np.float32)
+        return vectors, queries
+
+    vectors = synthetic_embeddings(size, 384)
+    rng = np.random.default_rng(size)
+    queries = vectors[rng.integers(0, size, n_queries)] + 0.3 * rng.standard_normal((n_queries, 384))
+    return vectors, (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW parameter sweep")
+    parser.add_argument('--source', default='synthetic', choices=['synthetic', 'corpus'])
+    parser.add_argument('--size', type=int, default=20000, help="Synthetic chunk count")
+    parser.add_argument('--queries', type=int, default=200, help="Synthetic query count")
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--M', default="8,16,32")
+    parser.add_argument('--construction-ef', default="64,128,256")
+    parser.add_argument('--search-ef', default="10,20,40,80,160")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    def ints(value):
+        return [int(item) for item in value.split(",")]
+
+    vectors, queries = load_vectors(args.source, args.size, args.queries, args.embedding)
+    rows = sweep(vectors, queries, ints(args.M), ints(args.construction_ef), ints(args.search_ef), args.k)
+    best = recommend(rows, args.target_recall, args.k)
+    report = {'source': args.source, 'chunks': len(vectors), 'queries': len(queries), 'k': args.k,
+              'target_recall': args.target_recall, 'rows': rows, 'recommended': best}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    recall = f'recall@{args.k}'
+    print(f"{report['chunks']} {args.source} chunks, {report['queries']} queries; recall against exact search")
+    print(f"| M | construction_ef | search_ef | {recall} | p50_ms | p99_ms | build_s | index_mb |")
+    print("|---|---|---|---|---|---|---|---|")
+    for row in rows:
+        print(f"| {row['M']} | {row['construction_ef']} | {row['search_ef']} | {row[recall]:.3f} "
+              f"| {row['p50_ms']:.2f} | {row['p99_ms']:.2f} | {row['build_seconds']:.1f} | {row['index_mb']:.1f} |")
+    if best:
+        print(f"Recommended for {recall} >= {args.target_recall}: "
+              f"RAG_HNSW=M={best['M']},construction_ef={best['construction_ef']},search_ef={best['search_ef']}")
+    else:
+        print(f"No setting reached {recall} >= {args.target_recall}; widen the sweep")
+
+if __name__ == "__main__":
+    main()
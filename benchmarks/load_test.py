@@ -0,0 +1,231 @@
+"""Load generator for the query path
+
+Replays a query corpus against a RAGEngine in this process, or against a
+running query service (service.py), and reports throughput, latency
+percentiles and error rate per strategy and per stage.
+
+Two arrival models:
+    closed loop  --concurrency N: N workers each send the next query as soon
+                 as the previous one returns
+    open loop    --qps R: queries are released on a fixed schedule at R per
+                 second; latency is measured from the scheduled send time,
+                 so queueing delay under overload is included rather than
+                 hidden (no coordinated omission)
+
+Per-stage latency comes from the engine's trace spans (embedding,
+ann_search, parent_assembly, dedup, context_build, llm, ...) when running
+in process. Against a served endpoint only the response is visible, so the
+split is 'retrieval' and 'generation': generation is the LLM time the engine
+reports in response_time, retrieval is the rest of the request.
+
+Usage:
+    python -m benchmarks.load_test --concurrency 8 --requests 200
+    python -m benchmarks.load_test --qps 20 --duration 30 --llm simulated --llm-latency-ms 800
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 16 --output run.json
+"""
+import json
+import time
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import build_store, latency_summary, load_corpus, sample_queries
+
+STRATEGIES = ['naive', 'parent_document', 'hybrid', 'agentic']
+
+@dataclass
+class RequestResult:
+    """Outcome of one replayed query"""
+    latency: float
+    stages: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+class EngineTarget:
+    """Sends queries straight to a RAGEngine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def send(self, question: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.engine.query(question, config)
+        stages = self.engine.obs_tracker.get_stage_durations(response.get('trace_id'))
+        return dict(response, stages=stages) if stages else response
+
+class HttpTarget:
+    """Sends queries to a running query service's POST /query"""
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        self.url = url.rstrip('/') + '/query'
+        self.timeout = timeout
+
+    def send(self, question: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        body = json.dumps({'question': question, 'config': config}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"HTTP {e.code}: {e.read()[:200].decode('utf-8', 'replace')}")
+
+def _timed_request(target, question: str, config: Dict[str, Any], start: float) -> RequestResult:
+    try:
+        response = target.send(question, config)
+    except Exception as e:
+        return RequestResult(latency=time.perf_counter() - start, error=str(e))
+
+    latency = time.perf_counter() - start
+    stages = response.get('stages')
+    if not stages:
+        generation = min(float(response.get('response_time') or 0.0), latency)
+        stages = {'retrieval': latency - generation, 'generation': generation}
+    return RequestResult(latency=latency, stages=stages, error=response.get('error'))
+
+def run_closed_loop(target, queries: List[str], config: Dict[str, Any],
+                    concurrency: int, requests: int) -> List[RequestResult]:
+    """Keep `concurrency` queries in flight until `requests` have completed"""
+    results: List[RequestResult] = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            result = _timed_request(target, queries[i % len(queries)], config, time.perf_counter())
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def run_open_loop(target, queries: List[str], config: Dict[str, Any],
+                  qps: float, requests: int, max_workers: int = 64) -> List[RequestResult]:
+    """Release `requests` queries at a fixed rate of `qps`"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        begin = time.perf_counter()
+        for i in range(requests):
+            scheduled = begin + i / qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(
+                _timed_request, target, queries[i % len(queries)], config, scheduled
+            ))
+        return [future.result() for future in futures]
+
+def summarize(results: List[RequestResult], elapsed: float) -> Dict[str, Any]:
+    """Throughput, latency percentiles and error rate for one run"""
+    errors = [r for r in results if r.error]
+    successes = [r for r in results if not r.error]
+    stage_names = sorted({name for r in successes for name in r.stages})
+
+    return {
+        'requests': len(results),
+        'errors': len(errors),
+        'error_rate': len(errors) / len(results) if results else 0.0,
+        'duration_s': elapsed,
+        'throughput_qps': len(successes) / elapsed if elapsed > 0 else 0.0,
+        'latency': latency_summary([r.latency for r in successes]),
+        'stages': {
+            name: latency_summary([r.stages[name] for r in successes if name in r.stages])
+            for name in stage_names
+        },
+        'sample_errors': sorted({r.error for r in errors})[:5],
+    }
+
+def run_load_test(target, queries: List[str], strategies: List[str] = STRATEGIES,
+                  concurrency: int = 4, qps: Optional[float] = None, requests: int = 100,
+                  config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Replay `queries` once per strategy and report each run
+
+    Uses the open-loop model when `qps` is given, otherwise closed loop at
+    `concurrency`.
+    """
+    report = {
+        'mode': 'open' if qps else 'closed',
+        'concurrency': None if qps else concurrency,
+        'target_qps': qps,
+        'requests_per_strategy': requests,
+        'config': dict(config or {}),
+        'strategies': {}
+    }
+
+    for strategy in strategies:
+        strategy_config = dict(config or {}, strategy=strategy)
+        start = time.perf_counter()
+        if qps:
+            results = run_open_loop(target, queries, strategy_config, qps, requests)
+        else:
+            results = run_closed_loop(target, queries, strategy_config, concurrency, requests)
+        report['strategies'][strategy] = summarize(results, time.perf_counter() - start)
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay queries against the RAG engine under load")
+    parser.add_argument('--url', help="Query service base URL; default runs an in-process engine")
+    parser.add_argument('--strategies', default=",".join(STRATEGIES))
+    parser.add_argument('--concurrency', type=int, default=4, help="Closed-loop workers")
+    parser.add_argument('--qps', type=float, help="Open-loop arrival rate (overrides --concurrency)")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per strategy")
+    parser.add_argument('--duration', type=float, help="Seconds per strategy at --qps (sets --requests)")
+    parser.add_argument('--queries', type=int, default=64, help="Distinct queries in the replay corpus")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--llm', default='simulated', choices=['simulated', 'openai'])
+    parser.add_argument('--llm-latency', default='lognormal',
+                        choices=['fixed', 'uniform', 'lognormal'])
+    parser.add_argument('--llm-latency-ms', type=float, default=800.0)
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    requests = int(args.duration * args.qps) if args.duration and args.qps else args.requests
+    strategies = [s.strip() for s in args.strategies.split(',') if s.strip()]
+    config = {'top_k': args.top_k}
+
+    stories = load_corpus()
+    queries = sample_queries(stories, args.queries)
+
+    if args.url:
+        report = run_load_test(HttpTarget(args.url), queries, strategies,
+                               args.concurrency, args.qps, requests, config)
+        report['target'] = args.url
+    else:
+        from rag_engine import RAGEngine
+        from observability import ObservabilityTracker
+        from llm_backend import create_llm_backend
+
+        llm_kwargs = {}
+        if args.llm == 'simulated':
+            llm_kwargs = {'latency': args.llm_latency, 'latency_ms': args.llm_latency_ms}
+        llm = create_llm_backend(args.llm, **llm_kwargs)
+
+        with tempfile.TemporaryDirectory() as persist_directory:
+            store = build_store(stories, persist_directory, args.embedding)
+            engine = RAGEngine(vector_store=store, obs_tracker=ObservabilityTracker(), llm=llm)
+            report = run_load_test(EngineTarget(engine), queries, strategies,
+                                   args.concurrency, args.qps, requests, config)
+        report['target'] = 'engine'
+        report['llm'] = {'backend': args.llm, **llm_kwargs}
+        report['embedding'] = args.embedding
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Quantized first-stage search vs Chroma's float32 HNSW
+
+Builds a store from the corpus, then searches its chunk embeddings with
+Chroma's cosine HNSW and with QuantizedIndex (int8 and binary codes at
+several shortlist sizes, each rescored at full precision). Recall@k is
+measured against exact brute-force search. Memory is reported per million
+chunks: what must stay resident (HNSW graph and vectors, or just the codes)
+and what sits on disk.
+
+Usage:
+    python -m benchmarks.quantization [--embedding hashing|default] [--k 1,5,10]
+        [--rescore 1,2,4,10] [--json]
+"""
+import os
+import glob
+import json
+import argparse
+import tempfile
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from benchmarks.common import REPO_ROOT, Timer, build_store, latency_summary, load_corpus
+from benchmarks.retrieval_quality import DEFAULT_DATASET, load_dataset
+
+MILLION = 1_000_000
+
+def recall(found: Sequence[List[int]], truth: Sequence[List[int]], k: int) -> float:
+    """Mean fraction of the exact top-k that a search returned in its top-k"""
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / len(t[:k]) for f, t in zip(found, truth)]))
+
+def timed_search(search, queries: np.ndarray) -> Dict[str, Any]:
+    """Run one query at a time, as the app does; returns row lists and latency"""
+    rows, latencies = [], []
+    for query in queries:
+        with Timer() as timer:
+            rows.append(search(query))
+        latencies.append(timer.elapsed)
+    return {'rows': rows, **latency_summary(latencies)}
+
+def hnsw_disk_bytes(persist_directory: str) -> int:
+    """Bytes of Chroma's HNSW segment files (vectors, graph links and labels)"""
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(persist_directory, "*", "*.bin")))
+
+def run_benchmark(collection, query_embeddings: Any, persist_directory: str, ks: Sequence[int],
+                  rescores: Sequence[int], quantizations: Sequence[str] = ('int8', 'binary')) -> Dict[str, Any]:
+    from quantized_index import QuantizedIndex, bytes_per_vector, exact_search
+
+    records = collection.get(include=['embeddings'])
+    ids = records['ids']
+    vectors = np.asarray(records['embeddings'], dtype=np.float32)
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    row_of = {doc_id: row for row, doc_id in enumerate(ids)}
+    n, dimensions = vectors.shape
+    k_max = max(ks)
+
+    truth = exact_search(vectors, queries, k_max)
+    report = {'chunks': n, 'dimensions': dimensions, 'queries': len(queries), 'ks': list(ks), 'runs': {}}
+
+    def hnsw(query):
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k_max, include=[])
+        return [row_of[doc_id] for doc_id in result['ids'][0]]
+
+    run = timed_search(hnsw, queries)
+    hnsw_bytes = hnsw_disk_bytes(persist_directory)
+    report['runs']['hnsw_float32'] = {
+        **{f'recall@{k}': recall(run['rows'], truth, k) for k in ks},
+        'p50_ms': run['p50_ms'], 'p99_ms': run['p99_ms'],
+        # The whole segment is loaded to search it
+        'resident_mb_per_million': hnsw_bytes / n * MILLION / 1e6,
+        'disk_mb_per_million': hnsw_bytes / n * MILLION / 1e6,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in quantizations:
+            for rescore in rescores:
+                index = QuantizedIndex(os.path.join(directory, quantization), quantization, rescore=rescore)
+                with Timer() as build:
+                    index.build(ids, vectors)
+
+                def quantized(query):
+                    return [row_of[doc_id] for doc_id, _ in index.search(query, k_max)[0]]
+
+                run = timed_search(quantized, queries)
+                report['runs'][f'{quantization}_rescore{rescore}'] = {
+                    **{f'recall@{k}': recall(run['rows'], truth, k) for k in ks},
+                    'p50_ms': run['p50_ms'], 'p99_ms': run['p99_ms'],
+                    'build_seconds': build.elapsed,
+                    'resident_mb_per_million': bytes_per_vector(dimensions, quantization) * MILLION / 1e6,
+                    'disk_mb_per_million': (bytes_per_vector(dimensions, quantization) + 4 * dimensions)
+                                           * MILLION / 1e6,
+                }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized index vs HNSW benchmark")
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--k', default="1,5,10")
+    parser.add_argument('--rescore', default="1,2,4,10")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset)
+    stories = load_corpus(os.path.join(REPO_ROOT, dataset['corpus']))
+    questions = [question['question'] for question in dataset['questions']]
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = build_store(stories, persist_directory, args.embedding)
+        report = run_benchmark(store.collection, store.embed_queries(questions), persist_directory,
+                               [int(k) for k in args.k.split(",")], [int(r) for r in args.rescore.split(",")])
+    report['embedding'] = args.embedding
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    recall_columns = [f'recall@{k}' for k in report['ks']]
+    print(f"{report['chunks']} chunks x {report['dimensions']} dims, {report['queries']} queries, "
+          f"embedding={args.embedding}; recall against exact search")
+    print("| index | " + " | ".join(recall_columns) + " | p50_ms | p99_ms | RAM MB/1M chunks | disk MB/1M chunks |")
+    print("|---|" + "---|" * (len(recall_columns) + 4))
+    for name, run in report['runs'].items():
+        print(f"| {name} | " + " | ".join(f"{run[column]:.3f}" for column in recall_columns)
+              + f" | {run['p50_ms']:.2f} | {run['p99_ms']:.2f} | {run['resident_mb_per_million']:.0f}"
+              f" | {run['disk_mb_per_million']:.0f} |")
+
+if __name__ == "__main__":
+    main()
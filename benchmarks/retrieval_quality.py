@@ -0,0 +1,228 @@
+"""Retrieval quality and latency per strategy and retrieval method
+
+Runs a versioned set of labeled questions (benchmarks/data/) against a store
+built from the scraped corpus, and reports recall@k, MRR and nDCG@k next to
+retrieval latency for every strategy / retrieval_method pair. Relevance is
+judged per story: retrieved chunks are collapsed to their source URL in rank
+order, so several chunks of one story count once.
+
+Runs offline: the default hashing embedding needs no model download, and
+the agentic strategy (opt-in) plans with the simulated LLM backend.
+
+The report is compared with a stored baseline and printed as a table with
+deltas, so a faster configuration that retrieves worse is visible at once.
+
+Usage:
+    python -m benchmarks.retrieval_quality [--strategies naive,hybrid] [--k 1,3,5,10]
+        [--embedding hashing|default] [--baseline PATH] [--update-baseline] [--output PATH]
+"""
+import os
+import json
+import math
+import argparse
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from benchmarks.common import REPO_ROOT, Timer, build_store, latency_summary, load_corpus
+
+DEFAULT_DATASET = os.path.join(REPO_ROOT, "benchmarks", "data", "retrieval_eval_v1.json")
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "retrieval_quality.json")
+
+# Methods each strategy actually varies with; parent_document and agentic
+# always search semantically
+STRATEGY_METHODS = {
+    'naive': ['semantic', 'keyword', 'hybrid'],
+    'parent_document': ['semantic'],
+    'hybrid': ['semantic', 'keyword', 'hybrid'],
+    'agentic': ['semantic'],
+}
+DEFAULT_STRATEGIES = ['naive', 'parent_document', 'hybrid']
+DEFAULT_KS = [1, 3, 5, 10]
+
+def table_metrics(ks: Sequence[int]) -> List[str]:
+    """Metrics shown in the comparison table, at k=5 when measured (else the largest k)
+
+    Latency deltas are informational.
+    """
+    k = 5 if 5 in ks else max(ks)
+    return [f'recall@{k}', 'mrr', f'ndcg@{k}', 'p50_ms', 'p95_ms']
+
+def load_dataset(path: str = DEFAULT_DATASET) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def unique_sources(sources: Iterable[str]) -> List[str]:
+    """Sources in first-seen rank order, without repeats"""
+    seen = set()
+    ranked = []
+    for source in sources:
+        if source not in seen:
+            seen.add(source)
+            ranked.append(source)
+    return ranked
+
+def recall_at_k(ranked: Sequence[str], relevant: Sequence[str], k: int) -> float:
+    if not relevant:
+        return 0.0
+    return len(set(ranked[:k]) & set(relevant)) / len(set(relevant))
+
+def reciprocal_rank(ranked: Sequence[str], relevant: Sequence[str]) -> float:
+    relevant = set(relevant)
+    for rank, source in enumerate(ranked, 1):
+        if source in relevant:
+            return 1.0 / rank
+    return 0.0
+
+def ndcg_at_k(ranked: Sequence[str], relevant: Sequence[str], k: int) -> float:
+    """Binary-relevance nDCG@k"""
+    relevant = set(relevant)
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, source in enumerate(ranked[:k], 1) if source in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+def score_run(rankings: List[List[str]], questions: List[Dict[str, Any]], ks: Sequence[int]) -> Dict[str, float]:
+    """Mean retrieval metrics over questions"""
+    n = len(questions)
+    scores = {'mrr': sum(reciprocal_rank(r, q['relevant']) for r, q in zip(rankings, questions)) / n}
+    for k in ks:
+        scores[f'recall@{k}'] = sum(recall_at_k(r, q['relevant'], k) for r, q in zip(rankings, questions)) / n
+        scores[f'ndcg@{k}'] = sum(ndcg_at_k(r, q['relevant'], k) for r, q in zip(rankings, questions)) / n
+    return scores
+
+def run_benchmark(engine, dataset: Dict[str, Any], strategies: Sequence[str] = DEFAULT_STRATEGIES,
+                  ks: Sequence[int] = DEFAULT_KS, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Score and time every strategy / retrieval_method pair
+
+    Each pair retrieves top_k = max(ks) chunks per question with adaptive
+    top_k disabled, so every configuration is scored at the same depths.
+    """
+    questions = dataset['questions']
+    report = {'dataset_version': dataset['version'], 'questions': len(questions),
+              'ks': list(ks), 'runs': {}}
+
+    for strategy in strategies:
+        for method in STRATEGY_METHODS.get(strategy, ['semantic']):
+            run_config = {'top_k': max(ks), 'use_adaptive_retrieval': False, **(config or {}),
+                          'strategy': strategy, 'retrieval_method': method}
+
+            # Warm up caches and the encoder before timing
+            engine.retrieve(questions[0]['question'], run_config)
+
+            rankings, latencies = [], []
+            for question in questions:
+                with Timer() as timer:
+                    documents = engine.retrieve(question['question'], run_config)
+                latencies.append(timer.elapsed)
+                rankings.append(unique_sources(doc.metadata.get('source', '') for doc in documents))
+
+            latency = latency_summary(latencies)
+            report['runs'][f"{strategy}/{method}"] = {
+                'strategy': strategy,
+                'retrieval_method': method,
+                **score_run(rankings, questions, ks),
+                'p50_ms': latency['p50_ms'],
+                'p95_ms': latency['p95_ms'],
+                'mean_ms': latency['mean_ms'],
+            }
+
+    return report
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Optional[Dict[str, Any]],
+                        metrics: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """One row per run with each metric and its delta from the baseline (None when absent)
+
+    Metrics default to table_metrics() for the ks the report measured.
+    """
+    metrics = metrics if metrics is not None else table_metrics(report['ks'])
+    baseline_runs = (baseline or {}).get('runs', {})
+    if baseline and baseline.get('dataset_version') != report['dataset_version']:
+        # Scores over different question sets are not comparable
+        baseline_runs = {}
+
+    rows = []
+    for name, run in report['runs'].items():
+        row = {'run': name}
+        previous = baseline_runs.get(name)
+        for metric in metrics:
+            row[metric] = run.get(metric)
+            if previous is not None and metric in previous and run.get(metric) is not None:
+                row[f'{metric}_delta'] = run[metric] - previous[metric]
+            else:
+                row[f'{metric}_delta'] = None
+        rows.append(row)
+    return rows
+
+def format_table(rows: List[Dict[str, Any]], metrics: Optional[Sequence[str]] = None) -> str:
+    """Markdown table of metrics (by default, those in the rows) with baseline deltas"""
+    if metrics is None:
+        metrics = [key for key in (rows[0] if rows else {}) if key != 'run' and not key.endswith('_delta')]
+    header = "| run | " + " | ".join(metrics) + " |"
+    lines = [header, "|" + "---|" * (len(metrics) + 1)]
+    for row in rows:
+        cells = []
+        for metric in metrics:
+            value, delta = row.get(metric), row.get(f'{metric}_delta')
+            precision = 1 if metric.endswith('_ms') else 3
+            if value is None:
+                cells.append("n/a")
+                continue
+            cell = f"{value:.{precision}f}"
+            if delta is not None:
+                cell += f" ({delta:+.{precision}f})"
+            cells.append(cell)
+        lines.append(f"| {row['run']} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark")
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    parser.add_argument('--corpus', default=None, help="full_documents.pkl (defaults to the dataset's corpus)")
+    parser.add_argument('--strategies', default=",".join(DEFAULT_STRATEGIES))
+    parser.add_argument('--k', default=",".join(str(k) for k in DEFAULT_KS))
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help="Write this run as the new baseline")
+    parser.add_argument('--output', default=None, help="Also write the JSON report here")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    from rag_engine import RAGEngine
+    from observability import ObservabilityTracker
+    from llm_backend import SimulatedLLMBackend
+
+    dataset = load_dataset(args.dataset)
+    stories = load_corpus(args.corpus or os.path.join(REPO_ROOT, dataset['corpus']))
+    ks = [int(k) for k in args.k.split(",")]
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = build_store(stories, persist_directory, args.embedding)
+        engine = RAGEngine(vector_store=store, obs_tracker=ObservabilityTracker(stage_spans=False),
+                           llm=SimulatedLLMBackend(sleep=False))
+        report = run_benchmark(engine, dataset, args.strategies.split(","), ks)
+    report['embedding'] = args.embedding
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('embedding') != report['embedding']:
+            baseline = None
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['questions']} labeled questions (dataset v{report['dataset_version']}), "
+          f"embedding={args.embedding}; deltas vs baseline in parentheses")
+    print(format_table(compare_to_baseline(report, baseline)))
+
+if __name__ == "__main__":
+    main()
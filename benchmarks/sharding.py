@@ -0,0 +1,131 @@
+"""Throughput and latency of sharded collections
+
+Fills one collection per shard count with the same synthetic embeddings,
+each chunk tagged with a source and one of a dozen industries, then
+measures:
+
+    write      chunks/s added (shards are filled in parallel)
+    query      single-query p50/p99 latency, unfiltered (fan-out to all
+               shards) and filtered to one industry
+    throughput queries/s with several clients querying at once
+    recall@k   against exact search, since each shard has its own index
+
+Usage:
+    python -m benchmarks.sharding [--shards 1,4,8] [--shard-by industry|source]
+        [--backend chroma|numpy] [--size 20000] [--queries 200] [--clients 8]
+        [--k 10] [--json]
+"""
+import json
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+from benchmarks.common import Timer, latency_summary
+from benchmarks.vector_backends import ADD_BATCH, synthetic_embeddings
+
+INDUSTRIES = ['Logistics', 'Construction', 'Education', 'Energy', 'Food', 'Government', 'Healthcare',
+              'Manufacturing', 'Retail', 'Utilities', 'Transportation', 'Field Services']
+
+# Chunks per story, as the app's chunker produces for a typical case study
+CHUNKS_PER_STORY = 8
+
+def open_collection(backend, shards: int, shard_by: str, executor):
+    from sharding import ShardedCollection, shard_names
+
+    metadata = {"hnsw:space": "cosine"}
+    if shards == 1:
+        return backend.get_or_create_collection("benchmark", metadata=metadata)
+    return ShardedCollection("benchmark", [backend.get_or_create_collection(name, metadata=metadata)
+                                           for name in shard_names("benchmark", shards, shard_by)],
+                             shard_by, executor)
+
+def timed_queries(collection, queries: np.ndarray, k: int, where=None):
+    latencies, found = [], []
+    for query in queries:
+        with Timer() as timer:
+            result = collection.query(query_embeddings=[query], n_results=k, where=where, include=['metadatas'])
+        latencies.append(timer.elapsed)
+        found.append({metadata['row'] for metadata in result['metadatas'][0]})
+    return latencies, found
+
+def measure(collection, vectors: np.ndarray, metadatas, queries: np.ndarray, truth, k: int,
+            clients: int) -> Dict[str, Any]:
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    with Timer() as build:
+        for start in range(0, len(ids), ADD_BATCH):
+            end = start + ADD_BATCH
+            collection.add(ids=ids[start:end], documents=ids[start:end], metadatas=metadatas[start:end],
+                           embeddings=vectors[start:end])
+
+    latencies, found = timed_queries(collection, queries, k)
+    filtered, _ = timed_queries(collection, queries, k, where={'industry': INDUSTRIES[0]})
+
+    # Several clients at once, as concurrent app sessions would query
+    with ThreadPoolExecutor(max_workers=clients) as pool, Timer() as concurrent:
+        list(pool.map(lambda query: collection.query(query_embeddings=[query], n_results=k, include=['metadatas']),
+                      queries))
+
+    return {
+        'write_chunks_per_second': len(ids) / build.elapsed,
+        f'recall@{k}': float(np.mean([len(f & set(t)) / k for f, t in zip(found, truth)])),
+        **latency_summary(latencies),
+        'filtered_p50_ms': latency_summary(filtered)['p50_ms'],
+        'filtered_p99_ms': latency_summary(filtered)['p99_ms'],
+        'queries_per_second': len(queries) / concurrent.elapsed,
+    }
+
+def run_benchmark(shard_counts: Sequence[int], shard_by: str = 'industry', backend: str = 'chroma',
+                  size: int = 20000, n_queries: int = 200, clients: int = 8, k: int = 10) -> Dict[str, Any]:
+    from quantized_index import exact_search
+    from vector_backends import create_backend
+
+    vectors = synthetic_embeddings(size, 384)
+    rng = np.random.default_rng(size)
+    metadatas = [{'row': i, 'source': f"https://example.com/story-{i // CHUNKS_PER_STORY}",
+                  'industry': INDUSTRIES[(i // CHUNKS_PER_STORY) % len(INDUSTRIES)]} for i in range(size)]
+    queries = vectors[rng.integers(0, size, n_queries)] + 0.3 * rng.standard_normal((n_queries, 384))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    truth = exact_search(vectors, queries, k)
+
+    report = {'backend': backend, 'shard_by': shard_by, 'chunks': size, 'queries': n_queries,
+              'clients': clients, 'k': k, 'shards': {}}
+    for shards in shard_counts:
+        with tempfile.TemporaryDirectory() as directory, \
+                ThreadPoolExecutor(max_workers=shards, thread_name_prefix="rag-shard") as executor:
+            collection = open_collection(create_backend(backend, directory), shards, shard_by, executor)
+            report['shards'][shards] = measure(collection, vectors, metadatas, queries, truth, k, clients)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded collection benchmark")
+    parser.add_argument('--shards', default="1,4,8")
+    parser.add_argument('--shard-by', default='industry', choices=['industry', 'source'])
+    parser.add_argument('--backend', default='chroma', choices=['chroma', 'numpy'])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    report = run_benchmark([int(shards) for shards in args.shards.split(",")], args.shard_by, args.backend,
+                           args.size, args.queries, args.clients, args.k)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['chunks']} chunks on {args.backend}, sharded by {args.shard_by}; "
+          f"{report['queries']} queries, {args.clients} concurrent clients, k={args.k}")
+    print(f"| shards | write chunks/s | p50_ms | p99_ms | industry p50_ms | industry p99_ms | QPS | recall@{args.k} |")
+    print("|---|---|---|---|---|---|---|---|")
+    for shards, run in report['shards'].items():
+        print(f"| {shards} | {run['write_chunks_per_second']:.0f} | {run['p50_ms']:.2f} | {run['p99_ms']:.2f} "
+              f"| {run['filtered_p50_ms']:.2f} | {run['filtered_p99_ms']:.2f} | {run['queries_per_second']:.0f} "
+              f"| {run[f'recall@{args.k}']:.3f} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Time from a built index to a query-ready replica
+
+Builds a store from the corpus (optionally repeated to make it larger),
+exports a snapshot, then brings up a replica three ways and times each
+until its first answered query:
+
+    snapshot       open_snapshot(): map the file, verify checksums, serve
+    snapshot_fast  the same without checksum verification
+    chroma_copy    open the persisted Chroma directory read-only
+    import         import_snapshot() into a fresh Chroma store
+
+Usage:
+    python -m benchmarks.snapshot [--copies 20] [--embedding hashing|default] [--json]
+"""
+import os
+import json
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.common import REPO_ROOT, Timer, get_embedding_function, load_corpus
+from benchmarks.retrieval_quality import DEFAULT_DATASET, load_dataset
+
+def replicate(stories: List[Dict[str, Any]], copies: int) -> List[Dict[str, Any]]:
+    """The corpus repeated under distinct URLs, to approach a production-sized index"""
+    return [dict(story, url=f"{story['url']}?copy={copy}") for copy in range(copies) for story in stories]
+
+def open_chroma(persist_directory: str, embedding_function):
+    """A read-only store over a Chroma directory, loaded cold rather than from this process's cache"""
+    from chromadb.api.shared_system_client import SharedSystemClient
+    from vector_store import VectorStore
+
+    SharedSystemClient.clear_system_cache()
+    return VectorStore(persist_directory, embedding_function, read_only=True)
+
+def run_benchmark(stories: List[Dict[str, Any]], question: str, embedding: str = 'hashing') -> Dict[str, Any]:
+    from snapshot import import_snapshot, open_snapshot
+    from vector_store import VectorStore
+
+    embedding_function = get_embedding_function(embedding)
+    report = {'stories': len(stories)}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source")
+        store = VectorStore(source, embedding_function)
+        with Timer() as build:
+            store.populate_store(stories)
+        report['chunks'] = store.collection.count()
+        report['build_seconds'] = build.elapsed
+
+        path = os.path.join(directory, "index.ragsnap")
+        with Timer() as export:
+            store.export_snapshot(path)
+        report['export_seconds'] = export.elapsed
+        report['snapshot_mb'] = os.path.getsize(path) / 1e6
+
+        replicas = {
+            'snapshot': lambda: open_snapshot(path, embedding_function),
+            'snapshot_fast': lambda: open_snapshot(path, embedding_function, verify=False),
+            'chroma_copy': lambda: open_chroma(source, embedding_function),
+            'import': lambda: import_snapshot(path, os.path.join(directory, "imported"), embedding_function),
+        }
+        report['replicas'] = {}
+        for name, open_replica in replicas.items():
+            with Timer() as ready:
+                replica = open_replica()
+                results = replica.similarity_search(question, k=5)
+            report['replicas'][name] = {'ready_seconds': ready.elapsed, 'results': len(results)}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot load benchmark")
+    parser.add_argument('--copies', type=int, default=20, help="Times to repeat the corpus")
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    dataset = load_dataset(DEFAULT_DATASET)
+    stories = replicate(load_corpus(os.path.join(REPO_ROOT, dataset['corpus'])), args.copies)
+    report = run_benchmark(stories, dataset['questions'][0]['question'], args.embedding)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['stories']} stories, {report['chunks']} chunks; built in {report['build_seconds']:.1f}s, "
+          f"exported in {report['export_seconds']:.2f}s to a {report['snapshot_mb']:.1f} MB snapshot")
+    print("| replica | seconds to first answer |")
+    print("|---|---|")
+    for name, run in report['replicas'].items():
+        print(f"| {name} | {run['ready_seconds']:.3f} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Cold-start import-time benchmark
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+parses the report. Fails (exit code 1) if the median cumulative import time
+of a target regresses past its threshold, or if the first-paint target pulls
+in a heavy module that should be deferred.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--app-max-ms 1500] [--engine-max-ms 6000]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Any
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported before the first paint of app.py
+DEFERRED_MODULES = [
+    'chromadb',
+    'langchain',
+    'langchain_core',
+    'langchain_text_splitters',
+    'sentence_transformers',
+    'torch',
+    'openai',
+    'logfire',
+    'pandas',
+    'plotly.express',
+]
+
+@dataclass
+class ImportRecord:
+    """One line of `-X importtime` output"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """Parse `-X importtime` stderr into import records"""
+    records = []
+    
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # Header line ("self [us] | cumulative | imported package")
+            continue
+        
+        name = parts[2]
+        stripped = name.lstrip(' ')
+        # Nesting is encoded as two extra spaces per level after the first
+        depth = (len(name) - len(stripped) - 1) // 2
+        
+        records.append(ImportRecord(
+            module=stripped,
+            self_us=int(parts[0]),
+            cumulative_us=int(parts[1]),
+            depth=depth
+        ))
+    
+    return records
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """Import a module in a fresh interpreter and summarize its import profile"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True
+    )
+    
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    
+    records = parse_importtime(result.stderr)
+    imported = {r.module for r in records}
+    
+    # Children are reported before their parent, so the target's subtree is
+    # everything between the previous top-level record and the target itself
+    target = None
+    subtree_start = 0
+    for i, record in enumerate(records):
+        if record.depth != 0:
+            continue
+        if record.module == module:
+            target = record
+            subtree = records[subtree_start:i]
+            break
+        subtree_start = i + 1
+    else:
+        subtree = []
+    
+    heaviest = sorted(
+        (r for r in subtree if r.depth == 1),
+        key=lambda r: r.cumulative_us,
+        reverse=True
+    )[:10]
+    
+    return {
+        'module': module,
+        'cumulative_ms': (target.cumulative_us if target else 0) / 1000,
+        'total_self_ms': sum(r.self_us for r in records) / 1000,
+        'modules_imported': len(imported),
+        'imported': imported,
+        'heaviest': [(r.module, r.cumulative_us / 1000) for r in heaviest]
+    }
+
+def run_benchmark(targets: Dict[str, float], runs: int = 5,
+                  deferred: Dict[str, List[str]] = None) -> Dict[str, Any]:
+    """Measure each target `runs` times and check thresholds
+    
+    Args:
+        targets: module name -> max allowed median cumulative import time (ms)
+        runs: fresh interpreters per target
+        deferred: module name -> modules that must not be imported by it
+    """
+    deferred = deferred or {}
+    report = {'runs': runs, 'python': sys.version.split()[0], 'targets': {}, 'passed': True}
+    
+    for module, max_ms in targets.items():
+        samples = [measure_import(module) for _ in range(runs)]
+        cumulative = [s['cumulative_ms'] for s in samples]
+        median_ms = statistics.median(cumulative)
+        
+        leaked = sorted(
+            name for name in deferred.get(module, [])
+            if name in samples[0]['imported']
+        )
+        passed = median_ms <= max_ms and not leaked
+        
+        report['targets'][module] = {
+            'median_ms': round(median_ms, 1),
+            'min_ms': round(min(cumulative), 1),
+            'max_ms': round(max(cumulative), 1),
+            'threshold_ms': max_ms,
+            'modules_imported': samples[0]['modules_imported'],
+            'heaviest': [(name, round(ms, 1)) for name, ms in samples[0]['heaviest']],
+            'leaked_heavy_modules': leaked,
+            'passed': passed
+        }
+        report['passed'] = report['passed'] and passed
+    
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import-time benchmark")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--app-max-ms', type=float, default=1500.0,
+                        help="Threshold for `import app` (first paint)")
+    parser.add_argument('--engine-max-ms', type=float, default=6000.0,
+                        help="Threshold for `import resources` (engine cold start)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    report = run_benchmark(
+        targets={'app': args.app_max_ms, 'resources': args.engine_max_ms},
+        runs=args.runs,
+        deferred={'app': DEFERRED_MODULES}
+    )
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, stats in report['targets'].items():
+            status = "PASS" if stats['passed'] else "FAIL"
+            print(f"[{status}] import {module}: median {stats['median_ms']:.1f}ms "
+                  f"(min {stats['min_ms']:.1f}, max {stats['max_ms']:.1f}, threshold {stats['threshold_ms']:.0f}ms, "
+                  f"{stats['modules_imported']} modules)")
+            for name, ms in stats['heaviest']:
+                print(f"    {ms:8.1f}ms  {name}")
+            if stats['leaked_heavy_modules']:
+                print(f"    deferred modules imported eagerly: {', '.join(stats['leaked_heavy_modules'])}")
+    
+    sys.exit(0 if report['passed'] else 1)
+
+if __name__ == "__main__":
+    main()
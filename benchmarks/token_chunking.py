@@ -0,0 +1,93 @@
+"""Chunk lengths in embedding tokens: character chunking vs token chunking
+
+Chunks the corpus by characters (the app's 1000/200 default) and by tokens
+of the embedding model's own tokenizer, then tokenizes every chunk the way
+the model will and reports the length distribution, how much of the window
+chunks fill, and how many exceed it and are silently truncated.
+
+Token chunking tokenizes each story once, in one batch, and maps the token
+offsets back to character spans.
+
+Usage:
+    python -m benchmarks.token_chunking [--embedding hashing|default] [--chars 1000:200]
+        [--tokens 254:50] [--json]
+"""
+import json
+import argparse
+import statistics
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import DEFAULT_CORPUS, Timer, get_embedding_function, load_corpus, percentile
+
+def length_report(counts: List[int], max_tokens: int) -> Dict[str, Any]:
+    """Distribution of per-chunk token counts against the model's limit"""
+    return {
+        'chunks': len(counts),
+        'min': min(counts, default=0),
+        'p50': percentile(counts, 50),
+        'p95': percentile(counts, 95),
+        'max': max(counts, default=0),
+        'mean': statistics.mean(counts) if counts else 0.0,
+        'window_fill': statistics.mean(min(c, max_tokens) / max_tokens for c in counts) if counts else 0.0,
+        'truncated': sum(c > max_tokens for c in counts),
+        'tokens_lost': sum(max(c - max_tokens, 0) for c in counts),
+    }
+
+def run_benchmark(texts: List[str], tokenizer, chars: Tuple[int, int],
+                  tokens: Tuple[int, int]) -> Dict[str, Any]:
+    from chunking import OffsetTextSplitter
+
+    with Timer() as by_chars:
+        char_chunks = [chunk for text in texts for chunk in OffsetTextSplitter(*chars).split_text(text)]
+
+    splitter = OffsetTextSplitter(*tokens)
+    with Timer() as by_tokens:
+        offsets = tokenizer.offsets(texts)
+        token_chunks = [chunk for text, spans in zip(texts, offsets)
+                        for chunk in splitter.split_text(text, [start for start, _ in spans])]
+
+    return {
+        'max_tokens': tokenizer.max_tokens,
+        'window': tokenizer.window,
+        'chars': {'granularity': list(chars), 'seconds': by_chars.elapsed,
+                  **length_report(tokenizer.count(char_chunks), tokenizer.max_tokens)},
+        'tokens': {'granularity': list(tokens), 'seconds': by_tokens.elapsed,
+                   **length_report(tokenizer.count(token_chunks), tokenizer.max_tokens)},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Character vs token chunk lengths")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--embedding', default='hashing', choices=['hashing', 'default'])
+    parser.add_argument('--chars', default="1000:200", help="Character chunk_size:chunk_overlap")
+    parser.add_argument('--tokens', default=None, help="Token chunk_size:chunk_overlap (defaults to the window)")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    from embeddings import get_embedding_tokenizer
+    from vector_store import parse_granularities
+
+    tokenizer = get_embedding_tokenizer(get_embedding_function(args.embedding))
+    texts = [story.get('content') or '' for story in load_corpus(args.corpus)]
+    tokens = (parse_granularities(args.tokens)[0] if args.tokens
+              else (tokenizer.window, tokenizer.window // 5))
+    report = run_benchmark(texts, tokenizer, parse_granularities(args.chars)[0], tokens)
+    report['embedding'] = args.embedding
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{len(texts)} stories, embedding={args.embedding}, "
+          f"max_tokens={report['max_tokens']} ({report['window']} for content)")
+    print("| chunking | chunks | min | p50 | p95 | max | window fill | truncated | tokens lost | seconds |")
+    print("|---|---|---|---|---|---|---|---|---|---|")
+    for unit in ('chars', 'tokens'):
+        row = report[unit]
+        size, overlap = row['granularity']
+        print(f"| {unit} {size}/{overlap} | {row['chunks']} | {row['min']} | {row['p50']} | {row['p95']} "
+              f"| {row['max']} | {row['window_fill']:.0%} | {row['truncated']} | {row['tokens_lost']} "
+              f"| {row['seconds']:.3f} |")
+
+if __name__ == "__main__":
+    main()
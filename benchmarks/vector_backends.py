@@ -0,0 +1,103 @@
+"""Chroma HNSW vs exact NumPy search, by corpus size
+
+Fills a collection in each backend with the same synthetic embeddings
+(clustered, so neighborhoods look like real topical chunks), then times
+single queries as the app issues them and measures recall@k against exact
+search. Shows the corpus size at which the ANN index starts to pay for its
+per-query overhead, if it does within the sizes tried.
+
+Usage:
+    python -m benchmarks.vector_backends [--sizes 1000,5000,10000,20000,50000]
+        [--dimensions 384] [--queries 200] [--k 10] [--json]
+"""
+import json
+import argparse
+import tempfile
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+from benchmarks.common import Timer, latency_summary
+
+# VectorStore adds chunks in batches of 100, so build time reflects real ingest
+ADD_BATCH = 100
+
+def synthetic_embeddings(n: int, dimensions: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random cluster centers"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def measure(collection, vectors: np.ndarray, queries: np.ndarray, truth, k: int) -> Dict[str, Any]:
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    with Timer() as build:
+        for start in range(0, len(ids), ADD_BATCH):
+            end = start + ADD_BATCH
+            collection.add(ids=ids[start:end], documents=ids[start:end],
+                           metadatas=[{'row': i} for i in range(start, min(end, len(ids)))],
+                           embeddings=vectors[start:end])
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        with Timer() as timer:
+            result = collection.query(query_embeddings=[query], n_results=k, include=['metadatas'])
+        latencies.append(timer.elapsed)
+        hits += len({metadata['row'] for metadata in result['metadatas'][0]} & set(expected))
+
+    return {'build_seconds': build.elapsed, f'recall@{k}': hits / (len(queries) * k), **latency_summary(latencies)}
+
+def run_benchmark(sizes: Sequence[int], dimensions: int = 384, n_queries: int = 200, k: int = 10) -> Dict[str, Any]:
+    from quantized_index import exact_search
+    from vector_backends import ChromaBackend, NumpyBackend
+
+    report = {'dimensions': dimensions, 'queries': n_queries, 'k': k, 'sizes': {}}
+    for size in sizes:
+        vectors = synthetic_embeddings(size, dimensions)
+        rng = np.random.default_rng(size)
+        # Queries near existing chunks, like questions about a story
+        queries = vectors[rng.integers(0, size, n_queries)] + 0.3 * rng.standard_normal((n_queries, dimensions))
+        queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+        truth = exact_search(vectors, queries, k)
+
+        entry = {}
+        for name, backend_class in (('chroma', ChromaBackend), ('numpy', NumpyBackend)):
+            with tempfile.TemporaryDirectory() as directory:
+                collection = backend_class(directory).get_or_create_collection(
+                    "benchmark", metadata={"hnsw:space": "cosine"})
+                entry[name] = measure(collection, vectors, queries, truth, k)
+        report['sizes'][size] = entry
+
+    faster = [size for size, entry in report['sizes'].items() if entry['chroma']['p50_ms'] < entry['numpy']['p50_ms']]
+    report['crossover'] = min(faster) if faster else None
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector backend crossover benchmark")
+    parser.add_argument('--sizes', default="1000,5000,10000,20000,50000")
+    parser.add_argument('--dimensions', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    report = run_benchmark([int(size) for size in args.sizes.split(",")], args.dimensions, args.queries, args.k)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.dimensions}-dim embeddings, {args.queries} single queries, k={args.k}")
+    print(f"| chunks | backend | build_s | p50_ms | p99_ms | recall@{args.k} |")
+    print("|---|---|---|---|---|---|")
+    for size, entry in report['sizes'].items():
+        for name, run in entry.items():
+            print(f"| {size} | {name} | {run['build_seconds']:.2f} | {run['p50_ms']:.2f} | {run['p99_ms']:.2f} "
+                  f"| {run[f'recall@{args.k}']:.3f} |")
+    if report['crossover']:
+        print(f"Chroma's HNSW is faster from {report['crossover']} chunks")
+    else:
+        print("Exact NumPy search is faster at every size tried")
+
+if __name__ == "__main__":
+    main()
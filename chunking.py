@@ -0,0 +1,173 @@
+"""Offset-based text chunking
+
+Chunks are computed as (start, end) offsets into the source string. Separator
+positions are found once per text with a compiled regex `finditer` and
+searched with bisect, so splitting never builds intermediate substrings;
+only the final chunks are sliced out.
+
+`OffsetTextSplitter` follows LangChain's `RecursiveCharacterTextSplitter`
+(separators kept at the start of the following piece, whitespace stripped
+from each chunk) and produces the same chunks. Given the start offsets of a
+text's tokens, it measures chunks in tokens instead of characters.
+`sentence_chunk_spans` is the offset form of `utils.chunk_text`.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+Span = Tuple[int, int]
+
+# Paragraph, line, sentence, word, character
+DEFAULT_SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+
+# Searched one literal at a time: a literal pattern scans several times faster than a character class
+_SENTENCE_ENDS = [re.compile(re.escape(mark)) for mark in ".!?"]
+
+def _strip_span(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+class OffsetTextSplitter:
+    """Recursive separator splitter that works on offsets
+
+    Drop-in for `RecursiveCharacterTextSplitter.split_text` with literal
+    separators and `len` as the length function. With `token_starts`,
+    chunk_size and chunk_overlap count the tokens starting inside a span.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 separators: Optional[Sequence[str]] = None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(DEFAULT_SEPARATORS if separators is None else separators)
+        self._patterns = [re.compile(re.escape(separator)) if separator else None
+                          for separator in self.separators]
+
+    def split_text(self, text: str, token_starts: Optional[Sequence[int]] = None) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text, token_starts)]
+
+    def split_spans(self, text: str, token_starts: Optional[Sequence[int]] = None) -> List[Span]:
+        """(start, end) offsets of each chunk in `text`
+
+        `token_starts` are the sorted character offsets where the text's
+        tokens begin; when given, lengths are measured in tokens.
+        """
+        spans: List[Span] = []
+        if text:
+            # Separator match starts, found on first use and shared by every level
+            boundaries: List[Optional[List[int]]] = [None] * len(self.separators)
+            self._split(text, 0, len(text), 0, boundaries, spans, token_starts)
+        return spans
+
+    def _boundaries(self, text: str, level: int, cache: List[Optional[List[int]]]) -> List[int]:
+        starts = cache[level]
+        if starts is None:
+            starts = cache[level] = [match.start() for match in self._patterns[level].finditer(text)]
+        return starts
+
+    def _bounds(self, text: str, start: int, end: int, level: int,
+                cache: List[Optional[List[int]]]) -> Tuple[List[int], int]:
+        """Piece boundaries of [start, end) on the first separator it contains, and the next level
+
+        Piece i spans bounds[i]:bounds[i + 1]; each separator stays at the
+        start of the piece that follows it.
+        """
+        separators = self.separators
+        for i in range(level, len(separators)):
+            separator = separators[i]
+            if not separator:
+                # Character split
+                return list(range(start, end + 1)), len(separators)
+            starts = self._boundaries(text, i, cache)
+            lo = bisect_left(starts, start)
+            hi = bisect_right(starts, end - len(separator))
+            if lo < hi:
+                bounds = starts[lo:hi]
+                if bounds[0] != start:
+                    bounds.insert(0, start)
+                bounds.append(end)
+                return bounds, i + 1
+        return [start, end], len(separators)
+
+    def _split(self, text: str, start: int, end: int, level: int, cache: List[Optional[List[int]]],
+               spans: List[Span], token_starts: Optional[Sequence[int]]):
+        bounds, next_level = self._bounds(text, start, end, level, cache)
+        # Position of each bound in the unit being measured: characters, or tokens before it
+        positions = bounds if token_starts is None else [bisect_left(token_starts, bound) for bound in bounds]
+
+        # Pieces shorter than chunk_size are merged in runs; longer ones are split further
+        run_start = 0
+        for k in range(len(bounds) - 1):
+            if positions[k + 1] - positions[k] < self.chunk_size:
+                continue
+            if k > run_start:
+                self._merge(text, bounds, positions, run_start, k, spans)
+            if next_level >= len(self.separators):
+                # Nothing left to split on; kept as is, like LangChain does
+                spans.append((bounds[k], bounds[k + 1]))
+            else:
+                self._split(text, bounds[k], bounds[k + 1], next_level, cache, spans, token_starts)
+            run_start = k + 1
+        if run_start < len(bounds) - 1:
+            self._merge(text, bounds, positions, run_start, len(bounds) - 1, spans)
+
+    def _merge(self, text: str, bounds: List[int], positions: List[int], first: int, last: int,
+               spans: List[Span]):
+        """Pack pieces first..last-1 into chunks of at most chunk_size, carrying up to chunk_overlap forward
+
+        Adjacent pieces are contiguous, so a chunk's length is the distance
+        between the positions of two bounds and each chunk edge is found by
+        bisection rather than by adding up piece lengths.
+        """
+        size, overlap = self.chunk_size, self.chunk_overlap
+        while True:
+            # Last bound within chunk_size of the chunk start (always past the first piece)
+            j = bisect_right(positions, positions[first] + size, first + 1, last + 1) - 1
+            if j == last:
+                self._emit(text, bounds[first], bounds[last], spans)
+                return
+            self._emit(text, bounds[first], bounds[j], spans)
+            # Drop leading pieces until at most chunk_overlap remains and the next piece fits
+            first = max(bisect_left(positions, positions[j] - overlap, first, j),
+                        bisect_left(positions, positions[j + 1] - size, first, j))
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, spans: List[Span]):
+        start, end = _strip_span(text, start, end)
+        if start < end:
+            spans.append((start, end))
+
+def sentence_chunk_spans(text: str, chunk_size: int = 1000, overlap: int = 200,
+                         lookback: int = 200) -> List[Span]:
+    """Offsets of `utils.chunk_text` chunks
+
+    Each chunk ends at the last sentence end ('.', '!' or '?') within
+    `lookback` characters of the size limit, found by bisecting the sentence
+    ends precomputed for the whole text.
+    """
+    if not text or chunk_size <= 0:
+        return [(0, len(text))] if text else []
+    if len(text) <= chunk_size:
+        return [(0, len(text))]
+
+    sentence_ends = sorted(match.start() for pattern in _SENTENCE_ENDS for match in pattern.finditer(text))
+    spans = []
+    length = len(text)
+    start = 0
+    while start < length:
+        end = start + chunk_size
+        if end < length:
+            k = bisect_right(sentence_ends, end) - 1
+            if k >= 0 and sentence_ends[k] > max(end - lookback, start):
+                end = sentence_ends[k] + 1
+
+        chunk_start, chunk_end = _strip_span(text, start, min(end, length))
+        if chunk_start < chunk_end:
+            spans.append((chunk_start, chunk_end))
+        start = max(start + chunk_size - overlap, end)
+    return spans
@@ -0,0 +1,125 @@
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction, register_embedding_function
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+@register_embedding_function
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Deterministic feature-hashing embeddings that need no model download
+
+    Quality is far below the sentence-transformer default, but vectors are
+    stable across runs and machines, which is what offline tests and
+    benchmarks need. Select it for the app with RAG_EMBEDDING=hashing.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = np.zeros((len(input), self.dimensions), dtype=np.float32)
+
+        for row, text in enumerate(input):
+            for token in _TOKEN_PATTERN.findall(text.lower()):
+                digest = zlib.crc32(token.encode('utf-8'))
+                sign = 1.0 if digest & 1 else -1.0
+                vectors[row, (digest >> 1) % self.dimensions] += sign
+
+        # Sublinear term frequency, then unit length for cosine distance
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return list(vectors / norms)
+
+    @staticmethod
+    def name() -> str:
+        return "samsara_hashing"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {'dimensions': self.dimensions}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashingEmbeddingFunction":
+        return HashingEmbeddingFunction(dimensions=config.get('dimensions', 384))
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def max_tokens(self) -> int:
+        # Nominal window for token-aware chunking; hashing itself never truncates
+        return 256
+
+    def supported_spaces(self) -> List[str]:
+        return ["cosine", "l2", "ip"]
+
+class EmbeddingTokenizer(ABC):
+    """Token offsets from the tokenizer an embedding function uses
+
+    `window` is how many content tokens one embedding sees: the model's
+    max_tokens less the special tokens added to every input.
+    """
+
+    def __init__(self, max_tokens: int, special_tokens: int = 0):
+        self.max_tokens = max_tokens
+        self.special_tokens = special_tokens
+        self.window = max_tokens - special_tokens
+
+    @abstractmethod
+    def offsets(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        """(start, end) character offsets of each text's tokens, without special tokens"""
+
+    def count(self, texts: List[str]) -> List[int]:
+        """Tokens the model would see for each text before truncation"""
+        return [len(offsets) + self.special_tokens for offsets in self.offsets(texts)]
+
+class RegexTokenizer(EmbeddingTokenizer):
+    """Word tokens, as HashingEmbeddingFunction hashes them"""
+
+    def __init__(self, max_tokens: int = 256, pattern: re.Pattern = _TOKEN_PATTERN):
+        super().__init__(max_tokens)
+        self.pattern = pattern
+
+    def offsets(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        return [[match.span() for match in self.pattern.finditer(text)] for text in texts]
+
+class HuggingFaceTokenizer(EmbeddingTokenizer):
+    """A `tokenizers` tokenizer; texts are encoded in one parallel batch"""
+
+    def __init__(self, tokenizer, max_tokens: int, special_tokens: int = 2):
+        from tokenizers import Tokenizer
+
+        super().__init__(max_tokens, special_tokens)
+        # A private copy: the model's own instance truncates and pads every input to its window
+        self.tokenizer = Tokenizer.from_str(tokenizer.to_str())
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+
+    def offsets(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        encodings = self.tokenizer.encode_batch(list(texts), add_special_tokens=False)
+        return [encoding.offsets for encoding in encodings]
+
+def get_embedding_tokenizer(embedding_function) -> Optional[EmbeddingTokenizer]:
+    """The tokenizer behind an embedding function, or None when it is not known"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    if isinstance(embedding_function, HashingEmbeddingFunction):
+        return RegexTokenizer(max_tokens=embedding_function.max_tokens())
+    if isinstance(embedding_function, (DefaultEmbeddingFunction, ONNXMiniLM_L6_V2)):
+        model = ONNXMiniLM_L6_V2()
+        model._download_model_if_not_exists()
+        # [CLS] and [SEP] take two of the model's tokens
+        return HuggingFaceTokenizer(model.tokenizer, model.max_tokens(), special_tokens=2)
+    return None
+
+def get_default_embedding_function() -> EmbeddingFunction:
+    """Embedding function for new stores, chosen by the RAG_EMBEDDING env var"""
+    if os.getenv("RAG_EMBEDDING", "default").lower() == "hashing":
+        return HashingEmbeddingFunction()
+    # Chroma's default (all-MiniLM-L6-v2 on ONNX), which collections used implicitly
+    return DefaultEmbeddingFunction()
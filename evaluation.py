@@ -1,16 +1,35 @@
-import time
-import statistics
-from typing import Dict, List, Any, Optional
+import threading
+from typing import TYPE_CHECKING, Dict, List, Any, Optional
 from datetime import datetime, timedelta
-import pandas as pd
+
 import numpy as np
 
+from perf_store import PerformanceStore
+from sketches import MetricStats, RollingWindow
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 class EvaluationMetrics:
-    """Evaluation and performance metrics for RAG system"""
+    """Evaluation and performance metrics for RAG system
     
-    def __init__(self):
+    Summaries come from streaming statistics updated in O(1) per query:
+    all-time MetricStats per strategy, plus a RollingWindow of time buckets
+    for time-ranged summaries. Neither has a cap on history. Raw entries
+    are kept in a columnar PerformanceStore holding at most `recent_entries`
+    queries, for views that need individual queries (slowest queries,
+    trends, export).
+
+    One instance is shared by every session in the process, so updates and
+    reads take a lock.
+    """
+    
+    def __init__(self, recent_entries: int = 1000, bucket_seconds: int = 300):
         self.query_history = []
-        self.performance_data = []
+        self.performance_data = PerformanceStore(max_rows=recent_entries)
+        self.strategy_stats: Dict[str, MetricStats] = {}
+        self.rolling = RollingWindow(bucket_seconds=bucket_seconds)
+        self._lock = threading.Lock()
     
     def log_query_performance(self, 
                              query: str, 
@@ -19,180 +38,173 @@ class EvaluationMetrics:
                              tokens_used: int, 
                              num_sources: int,
                              config: Dict[str, Any],
-                             response_quality_score: Optional[float] = None):
+                             response_quality_score: Optional[float] = None,
+                             timestamp: Optional[datetime] = None):
         """Log performance data for a query"""
+        with self._lock:
+            timestamp = timestamp or datetime.now()
+        
+            # Bounded: the oldest raw entries drop out once the store is full
+            self.performance_data.append(query, strategy, response_time, tokens_used, num_sources,
+                                         config, timestamp, response_quality_score)
+        
+            epoch = timestamp.timestamp()
+            stats = self.strategy_stats.get(strategy)
+            if stats is None:
+                stats = self.strategy_stats[strategy] = MetricStats()
+            stats.add(response_time, tokens_used, num_sources, epoch)
+            self.rolling.add(strategy, response_time, tokens_used, num_sources, epoch)
+    
+    def _select_stats(self, strategy: Optional[str] = None,
+                      time_range_hours: Optional[int] = None) -> Dict[str, MetricStats]:
+        """Per-strategy stats, all-time or for the last time_range_hours"""
+        if time_range_hours:
+            since = (datetime.now() - timedelta(hours=time_range_hours)).timestamp()
+            return self.rolling.window(since, strategy)
         
-        performance_entry = {
-            'timestamp': datetime.now(),
-            'query': query,
-            'strategy': strategy,
-            'response_time': response_time,
-            'tokens_used': tokens_used,
-            'num_sources': num_sources,
-            'config': config.copy(),
-            'response_quality_score': response_quality_score
-        }
-        
-        self.performance_data.append(performance_entry)
-        
-        # Keep only last 1000 entries to prevent memory issues
-        if len(self.performance_data) > 1000:
-            self.performance_data = self.performance_data[-1000:]
+        if strategy:
+            return {strategy: self.strategy_stats[strategy]} if strategy in self.strategy_stats else {}
+        return dict(self.strategy_stats)
     
     def get_performance_summary(self, strategy: Optional[str] = None, 
                                time_range_hours: Optional[int] = None) -> Dict[str, Any]:
         """Get performance summary statistics"""
         
-        # Filter data based on criteria
-        filtered_data = self.performance_data.copy()
-        
-        if strategy:
-            filtered_data = [d for d in filtered_data if d['strategy'] == strategy]
-        
-        if time_range_hours:
-            cutoff_time = datetime.now() - timedelta(hours=time_range_hours)
-            filtered_data = [d for d in filtered_data if d['timestamp'] > cutoff_time]
-        
-        if not filtered_data:
-            return self._empty_summary()
-        
-        # Calculate statistics
-        response_times = [d['response_time'] for d in filtered_data]
-        tokens_used = [d['tokens_used'] for d in filtered_data]
-        num_sources = [d['num_sources'] for d in filtered_data]
-        
-        summary = {
-            'total_queries': len(filtered_data),
-            'avg_response_time': statistics.mean(response_times),
-            'median_response_time': statistics.median(response_times),
-            'min_response_time': min(response_times),
-            'max_response_time': max(response_times),
-            'std_response_time': statistics.stdev(response_times) if len(response_times) > 1 else 0,
-            'avg_tokens_used': statistics.mean(tokens_used),
-            'total_tokens_used': sum(tokens_used),
-            'avg_sources_retrieved': statistics.mean(num_sources),
-            'queries_per_hour': self._calculate_queries_per_hour(filtered_data),
-            'strategy_breakdown': self._get_strategy_breakdown(filtered_data)
-        }
+        with self._lock:
+            by_strategy = self._select_stats(strategy, time_range_hours)
+            stats = MetricStats.merged(by_strategy.values())
+        
+            if not stats.count:
+                return self._empty_summary()
+        
+            summary = {
+                'total_queries': stats.count,
+                'avg_response_time': stats.mean_response_time,
+                'median_response_time': stats.response_times.quantile(0.5),
+                'min_response_time': stats.min_response_time,
+                'max_response_time': stats.max_response_time,
+                'std_response_time': stats.std_response_time,
+                'avg_tokens_used': stats.tokens_sum / stats.count,
+                'total_tokens_used': stats.tokens_sum,
+                'avg_sources_retrieved': stats.sources_sum / stats.count,
+                'queries_per_hour': self._calculate_queries_per_hour(stats),
+                'strategy_breakdown': self._get_strategy_breakdown(by_strategy)
+            }
         
-        # Add percentiles
-        if len(response_times) > 4:
-            summary.update({
-                'p95_response_time': np.percentile(response_times, 95),
-                'p99_response_time': np.percentile(response_times, 99)
-            })
+            # Add percentiles
+            if stats.count > 4:
+                summary.update({
+                    'p95_response_time': stats.response_times.quantile(0.95),
+                    'p99_response_time': stats.response_times.quantile(0.99)
+                })
         
-        return summary
+            return summary
     
     def compare_strategies(self, strategies: List[str]) -> Dict[str, Dict[str, Any]]:
         """Compare performance between different RAG strategies"""
         
-        comparison = {}
+        with self._lock:
+            comparison = {}
         
-        for strategy in strategies:
-            strategy_data = [d for d in self.performance_data if d['strategy'] == strategy]
+            for strategy in strategies:
+                stats = self.strategy_stats.get(strategy)
             
-            if strategy_data:
-                response_times = [d['response_time'] for d in strategy_data]
-                tokens_used = [d['tokens_used'] for d in strategy_data]
-                
-                comparison[strategy] = {
-                    'query_count': len(strategy_data),
-                    'avg_response_time': statistics.mean(response_times),
-                    'median_response_time': statistics.median(response_times),
-                    'avg_tokens_used': statistics.mean(tokens_used),
-                    'success_rate': 1.0,  # Assuming all logged queries were successful
-                    'p95_response_time': np.percentile(response_times, 95) if len(response_times) > 4 else max(response_times)
-                }
-            else:
-                comparison[strategy] = self._empty_strategy_stats()
-        
-        return comparison
+                if stats is not None and stats.count:
+                    comparison[strategy] = {
+                        'query_count': stats.count,
+                        'avg_response_time': stats.mean_response_time,
+                        'median_response_time': stats.response_times.quantile(0.5),
+                        'avg_tokens_used': stats.tokens_sum / stats.count,
+                        'success_rate': 1.0,  # Assuming all logged queries were successful
+                        'p95_response_time': stats.response_times.quantile(0.95) if stats.count > 4 else stats.max_response_time
+                    }
+                else:
+                    comparison[strategy] = self._empty_strategy_stats()
+        
+            return comparison
     
     def get_performance_trends(self, time_window_hours: int = 24) -> Dict[str, List[Any]]:
         """Get performance trends over time"""
         
-        cutoff_time = datetime.now() - timedelta(hours=time_window_hours)
-        recent_data = [d for d in self.performance_data if d['timestamp'] > cutoff_time]
+        with self._lock:
+            store = self.performance_data
+            cutoff_time = datetime.now() - timedelta(hours=time_window_hours)
+            selected = np.flatnonzero(store.mask(since=cutoff_time))
         
-        if not recent_data:
-            return {'timestamps': [], 'response_times': [], 'tokens_used': [], 'strategies': []}
+            if not len(selected):
+                return {'timestamps': [], 'response_times': [], 'tokens_used': [], 'strategies': []}
         
-        # Sort by timestamp
-        recent_data.sort(key=lambda x: x['timestamp'])
+            # Sort by timestamp
+            selected = selected[np.argsort(store.column('timestamp')[selected], kind='stable')]
         
-        return {
-            'timestamps': [d['timestamp'] for d in recent_data],
-            'response_times': [d['response_time'] for d in recent_data],
-            'tokens_used': [d['tokens_used'] for d in recent_data],
-            'strategies': [d['strategy'] for d in recent_data],
-            'queries': [d['query'] for d in recent_data]
-        }
+            return {
+                'timestamps': store.column('timestamp')[selected].astype(datetime).tolist(),
+                'response_times': store.column('response_time')[selected].tolist(),
+                'tokens_used': store.column('tokens_used')[selected].tolist(),
+                'strategies': [store.strategies[code] for code in store.column('strategy')[selected]],
+                'queries': store.column('query')[selected].tolist()
+            }
     
     def get_slowest_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get the slowest queries for analysis"""
         
-        if not self.performance_data:
-            return []
-        
-        # Sort by response time in descending order
-        sorted_data = sorted(self.performance_data, key=lambda x: x['response_time'], reverse=True)
-        
-        return sorted_data[:limit]
+        with self._lock:
+            return self.performance_data.slowest(limit)
     
     def get_token_usage_analysis(self) -> Dict[str, Any]:
         """Analyze token usage patterns"""
         
-        if not self.performance_data:
-            return self._empty_token_analysis()
-        
-        tokens_by_strategy = {}
-        for entry in self.performance_data:
-            strategy = entry['strategy']
-            if strategy not in tokens_by_strategy:
-                tokens_by_strategy[strategy] = []
-            tokens_by_strategy[strategy].append(entry['tokens_used'])
-        
-        analysis = {
-            'total_tokens_used': sum(d['tokens_used'] for d in self.performance_data),
-            'avg_tokens_per_query': statistics.mean([d['tokens_used'] for d in self.performance_data]),
-            'strategy_token_usage': {}
-        }
+        with self._lock:
+            stats = MetricStats.merged(self.strategy_stats.values())
+            if not stats.count:
+                return self._empty_token_analysis()
         
-        for strategy, tokens in tokens_by_strategy.items():
-            analysis['strategy_token_usage'][strategy] = {
-                'avg_tokens': statistics.mean(tokens),
-                'total_tokens': sum(tokens),
-                'min_tokens': min(tokens),
-                'max_tokens': max(tokens)
+            analysis = {
+                'total_tokens_used': stats.tokens_sum,
+                'avg_tokens_per_query': stats.tokens_sum / stats.count,
+                'strategy_token_usage': {}
             }
         
-        return analysis
+            for strategy, strategy_stats in self.strategy_stats.items():
+                analysis['strategy_token_usage'][strategy] = {
+                    'avg_tokens': strategy_stats.tokens_sum / strategy_stats.count,
+                    'total_tokens': strategy_stats.tokens_sum,
+                    'min_tokens': strategy_stats.min_tokens,
+                    'max_tokens': strategy_stats.max_tokens
+                }
+        
+            return analysis
     
     def evaluate_response_latency(self, target_latency_seconds: float = 3.0) -> Dict[str, Any]:
-        """Evaluate response latency against target"""
-        
-        if not self.performance_data:
-            return {'within_target': 0, 'total_queries': 0, 'percentage': 0}
-        
-        within_target = sum(1 for d in self.performance_data if d['response_time'] <= target_latency_seconds)
-        total_queries = len(self.performance_data)
-        
-        return {
-            'within_target': within_target,
-            'total_queries': total_queries,
-            'percentage': (within_target / total_queries) * 100,
-            'target_latency': target_latency_seconds,
-            'avg_latency': statistics.mean([d['response_time'] for d in self.performance_data])
-        }
+        """Evaluate response latency against target
+        
+        within_target is counted from the response time sketch, so it is
+        exact up to the sketch's relative accuracy around the target.
+        """
+        
+        with self._lock:
+            stats = MetricStats.merged(self.strategy_stats.values())
+            if not stats.count:
+                return {'within_target': 0, 'total_queries': 0, 'percentage': 0}
+        
+            within_target = stats.response_times.count_at_most(target_latency_seconds)
+            total_queries = stats.count
+        
+            return {
+                'within_target': within_target,
+                'total_queries': total_queries,
+                'percentage': (within_target / total_queries) * 100,
+                'target_latency': target_latency_seconds,
+                'avg_latency': stats.mean_response_time
+            }
     
     def generate_performance_report(self) -> str:
         """Generate a comprehensive performance report"""
         
-        if not self.performance_data:
+        summary = self.get_performance_summary()
+        if not summary['total_queries']:
             return "No performance data available to generate report."
         
-        summary = self.get_performance_summary()
         token_analysis = self.get_token_usage_analysis()
         latency_eval = self.evaluate_response_latency()
         
@@ -220,36 +232,18 @@ class EvaluationMetrics:
         
         return report
     
-    def export_performance_data(self) -> pd.DataFrame:
+    def export_performance_data(self) -> "pd.DataFrame":
         """Export performance data as pandas DataFrame"""
-        
-        if not self.performance_data:
-            return pd.DataFrame()
-        
-        # Flatten the data for DataFrame
-        flattened_data = []
-        for entry in self.performance_data:
-            flat_entry = {
-                'timestamp': entry['timestamp'],
-                'query': entry['query'],
-                'strategy': entry['strategy'],
-                'response_time': entry['response_time'],
-                'tokens_used': entry['tokens_used'],
-                'num_sources': entry['num_sources'],
-                'chunk_size': entry['config'].get('chunk_size'),
-                'chunk_overlap': entry['config'].get('chunk_overlap'),
-                'top_k': entry['config'].get('top_k'),
-                'retrieval_method': entry['config'].get('retrieval_method'),
-                'response_quality_score': entry.get('response_quality_score')
-            }
-            flattened_data.append(flat_entry)
-        
-        return pd.DataFrame(flattened_data)
+        with self._lock:
+            return self.performance_data.to_pandas()
     
     def clear_performance_data(self):
         """Clear all performance data"""
-        self.performance_data.clear()
-        self.query_history.clear()
+        with self._lock:
+            self.performance_data.clear()
+            self.query_history.clear()
+            self.strategy_stats.clear()
+            self.rolling.buckets.clear()
     
     def _empty_summary(self) -> Dict[str, Any]:
         """Return empty summary structure"""
@@ -286,41 +280,33 @@ class EvaluationMetrics:
             'strategy_token_usage': {}
         }
     
-    def _calculate_queries_per_hour(self, data: List[Dict[str, Any]]) -> float:
-        """Calculate queries per hour from data"""
-        if len(data) < 2:
+    def _calculate_queries_per_hour(self, stats: MetricStats) -> float:
+        """Calculate queries per hour from the first and last query times"""
+        if stats.count < 2:
             return 0
         
-        sorted_data = sorted(data, key=lambda x: x['timestamp'])
-        time_span = sorted_data[-1]['timestamp'] - sorted_data[0]['timestamp']
+        time_span = stats.last_timestamp - stats.first_timestamp
         
-        if time_span.total_seconds() == 0:
+        if time_span == 0:
             return 0
         
-        hours = time_span.total_seconds() / 3600
-        return len(data) / hours
+        hours = time_span / 3600
+        return stats.count / hours
     
-    def _get_strategy_breakdown(self, data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    def _get_strategy_breakdown(self, by_strategy: Dict[str, MetricStats]) -> Dict[str, Dict[str, Any]]:
         """Get breakdown by strategy"""
         breakdown = {}
         
-        for entry in data:
-            strategy = entry['strategy']
-            if strategy not in breakdown:
-                breakdown[strategy] = {
-                    'count': 0,
-                    'total_response_time': 0,
-                    'total_tokens': 0
-                }
-            
-            breakdown[strategy]['count'] += 1
-            breakdown[strategy]['total_response_time'] += entry['response_time']
-            breakdown[strategy]['total_tokens'] += entry['tokens_used']
-        
-        # Calculate averages
-        for strategy_data in breakdown.values():
-            if strategy_data['count'] > 0:
-                strategy_data['avg_response_time'] = strategy_data['total_response_time'] / strategy_data['count']
-                strategy_data['avg_tokens'] = strategy_data['total_tokens'] / strategy_data['count']
+        for strategy, stats in by_strategy.items():
+            if not stats.count:
+                continue
+            breakdown[strategy] = {
+                'count': stats.count,
+                'total_response_time': stats.response_time_sum,
+                'total_tokens': stats.tokens_sum,
+                'avg_response_time': stats.mean_response_time,
+                'avg_tokens': stats.tokens_sum / stats.count,
+                'p95_response_time': stats.response_times.quantile(0.95)
+            }
         
         return breakdown
@@ -0,0 +1,142 @@
+"""Cross-process coordination for one persisted index
+
+Several processes may open the same persist directory: one writer and any
+number of read-only servers. Two files beside the index coordinate them:
+
+    writer.lock   advisory fcntl lock; the writer holds it exclusively for
+                  the whole of every write, readers take it shared only
+                  while (re)opening, so they never load a half-written index
+    generation    a counter the writer bumps after each write; readers
+                  compare it to the one they opened to know when to reload
+    active_index.json
+                  which version of the collections is live, versions being
+                  built (outside the lock) and retired ones awaiting garbage
+                  collection; switching it under the lock is what makes a
+                  rebuilt index go live
+
+Without fcntl (Windows) the locks only serialize threads of one process.
+"""
+import os
+import json
+import socket
+import threading
+from typing import Any, Dict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_FILE = "writer.lock"
+GENERATION_FILE = "generation"
+ACTIVE_INDEX_FILE = "active_index.json"
+
+class WriterLock:
+    """Exclusive, reentrant lock on an index, across threads and processes"""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self._lock = threading.RLock()
+        self._file = None
+        self.depth = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._lock.acquire(blocking):
+            return False
+        if self.depth == 0:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lock_file = open(self.path, 'a+')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    lock_file.close()
+                    self._lock.release()
+                    return False
+            self._file = lock_file
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+@contextmanager
+def shared_lock(directory: str):
+    """Wait out any write in progress and keep new ones from starting (creates no files)"""
+    path = os.path.join(directory, LOCK_FILE)
+    if fcntl is None or not os.path.exists(path):
+        yield
+        return
+    with open(path, 'r') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_generation(directory: str) -> int:
+    """The index's current generation (0 before its first write)"""
+    try:
+        with open(os.path.join(directory, GENERATION_FILE), encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_generation(directory: str) -> int:
+    """Publish a new generation; call while holding the WriterLock"""
+    generation = read_generation(directory) + 1
+    path = os.path.join(directory, GENERATION_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(str(generation))
+    os.replace(path + ".tmp", path)
+    return generation
+
+def process_alive(pid: int) -> bool:
+    """Whether a process on this host is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def owner() -> Dict[str, Any]:
+    """This process, as recorded against work it leaves on disk"""
+    return {'host': socket.gethostname(), 'pid': os.getpid()}
+
+def owner_gone(record: Dict[str, Any]) -> bool:
+    """Whether the process a record was left by has exited (never true for another host's)"""
+    return record.get('host') == socket.gethostname() and \
+        not (record.get('pid') and process_alive(record['pid']))
+
+def read_active_index(directory: str) -> Dict[str, Any]:
+    """The live index version ('' for the original collections), plus any being built or retired"""
+    state = {'version': '', 'building': [], 'retired': []}
+    try:
+        with open(os.path.join(directory, ACTIVE_INDEX_FILE), encoding='utf-8') as f:
+            state.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return state
+
+def write_active_index(directory: str, state: Dict[str, Any]):
+    """Replace the active index record in one rename; call while holding the WriterLock"""
+    path = os.path.join(directory, ACTIVE_INDEX_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,393 @@
+"""Background ingest jobs
+
+Crawling the customer stories and indexing them takes minutes, so the app
+submits it as a job instead of running it in the Streamlit script. An
+IngestRunner runs one job at a time on a background thread, and queries
+keep being served from the current index throughout:
+
+    update   scrape, then index new and changed stories in batches, each
+             a short write under the writer lock
+    refresh  scrape, then build a new index version from every story and
+             switch to it once validated (VectorStore.refresh_store), so
+             stories no longer on the site drop out
+
+Each job's state lives in the jobs directory, so any process can poll it:
+
+    <id>.json           kind, status, progress, recent messages, counts
+    <id>.stories.jsonl  stories scraped so far, appended as each arrives
+    <id>.cancel         present once a cancel was requested
+
+A job whose process died is found 'interrupted' by the next runner;
+resume() picks it (or a cancelled or failed one) up again without
+re-fetching the stories already scraped or re-indexing the batches an
+update already wrote. With an interval (RAG_INGEST_INTERVAL, e.g. "6h") the runner also
+submits an update job whenever that long has passed since the last job.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from progress import ProgressCallback, logger
+from index_lock import owner, owner_gone
+from vector_backends import ReadOnlyError
+
+JOB_KINDS = ('update', 'refresh')
+ACTIVE_STATUSES = ('queued', 'running')
+RESUMABLE_STATUSES = ('interrupted', 'cancelled', 'failed')
+
+# Stories written to the store per write (and per resumable checkpoint)
+INDEX_BATCH = 20
+# Share of a job's progress bar given to scraping; indexing takes the rest
+SCRAPE_SHARE = 0.5
+# Job state is rewritten at most this often while progress is reported
+SAVE_INTERVAL_SECONDS = 0.5
+# Recent messages kept in a job's state, and finished jobs kept on disk
+KEEP_MESSAGES = 20
+KEEP_JOBS = 50
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancellation has been requested"""
+
+def parse_interval(spec: str) -> Optional[float]:
+    """Seconds from an interval such as "90", "30m", "6h" or "1d"; None when empty"""
+    spec = spec.strip().lower()
+    if not spec:
+        return None
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    try:
+        if spec[-1] in units:
+            return float(spec[:-1]) * units[spec[-1]]
+        return float(spec)
+    except ValueError:
+        raise ValueError(f"Invalid interval {spec!r}; expected e.g. 900, 30m, 6h or 1d")
+
+class JobProgress(ProgressCallback):
+    """Records an operation's messages and progress into its job's state
+
+    The operation's own [0, 1] progress is mapped onto the span of the
+    job's progress bar set with span().
+    """
+
+    def __init__(self, runner: "IngestRunner", job: Dict[str, Any]):
+        self.runner = runner
+        self.job = job
+        self._start, self._end = 0.0, 1.0
+
+    def span(self, start: float, end: float):
+        self._start, self._end = start, end
+        self.progress(0.0)
+
+    def emit(self, level: str, message: str):
+        super().emit(level, message)
+        self.job['message'] = message
+        self.job['messages'] = (self.job['messages'] + [{'time': time.time(), 'level': level,
+                                                         'message': message}])[-KEEP_MESSAGES:]
+        self.runner._save(self.job, force=level in ('warning', 'error'))
+
+    def progress(self, fraction: float):
+        self.job['progress'] = self._start + (self._end - self._start) * min(max(fraction, 0.0), 1.0)
+        self.runner._save(self.job)
+
+class IngestRunner:
+    """Runs scrape-and-index jobs for a store on a background thread, one at a time"""
+
+    def __init__(self, vector_store, jobs_dir: str, scraper_factory: Optional[Callable] = None,
+                 interval: Optional[float] = None, batch_size: int = INDEX_BATCH):
+        self.vector_store = vector_store
+        self.jobs_dir = jobs_dir
+        # Called with a ProgressCallback; returns an object with scrape_customer_stories()
+        self.scraper_factory = scraper_factory or self._default_scraper
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._saved: Dict[str, float] = {}
+        self._worker: Optional[threading.Thread] = None
+        self._scheduler: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._started = time.time()
+        self._mark_interrupted()
+
+    @staticmethod
+    def _default_scraper(progress: ProgressCallback):
+        from scraper import SamsaraCustomerScraper
+        return SamsaraCustomerScraper(progress=progress)
+
+    def _path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.jobs_dir, job_id + suffix)
+
+    def _save(self, job: Dict[str, Any], force: bool = True):
+        """Persist a job's state, at most every SAVE_INTERVAL_SECONDS unless forced"""
+        now = time.monotonic()
+        if not force and now - self._saved.get(job['id'], 0.0) < SAVE_INTERVAL_SECONDS:
+            return
+        self._saved[job['id']] = now
+        job['updated'] = time.time()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._path(job['id'])
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's last saved state"""
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def jobs(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Saved jobs, newest first"""
+        try:
+            names = [name for name in os.listdir(self.jobs_dir) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        jobs = [job for job in (self.get(name[:-len(".json")]) for name in names) if job is not None]
+        return sorted(jobs, key=lambda job: job['created'], reverse=True)[:limit]
+
+    def active(self) -> Optional[Dict[str, Any]]:
+        """The queued or running job, from this process or another sharing the jobs directory"""
+        return next((job for job in self.jobs() if job['status'] in ACTIVE_STATUSES), None)
+
+    def _mark_interrupted(self):
+        """Jobs left queued or running by a process that is gone will never finish on their own"""
+        for job in self.jobs():
+            if job['status'] in ACTIVE_STATUSES and owner_gone(job):
+                job.update(status='interrupted', finished=time.time())
+                self._save(job)
+
+    def submit(self, kind: str = 'update', trigger: str = 'manual') -> Dict[str, Any]:
+        """Queue a job, or return the one already queued or running"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}; expected one of {JOB_KINDS}")
+        if self.vector_store.read_only:
+            raise ReadOnlyError("Ingest jobs need a writable vector store")
+        with self._lock:
+            self._check_running()
+            job = self.active()
+            if job is not None:
+                return job
+            job = {
+                'id': f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+                'kind': kind, 'trigger': trigger, 'status': 'queued',
+                'created': time.time(), 'started': None, 'finished': None,
+                'progress': 0.0, 'message': "Queued", 'messages': [], 'error': None,
+                'scraped': 0, 'scrape_complete': False, 'indexed': 0, 'unchanged': 0, 'removed': 0,
+            }
+            self._enqueue(job)
+            self._prune_jobs()
+        return job
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """Run an interrupted, cancelled or failed job again from its checkpoint"""
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job['status'] not in RESUMABLE_STATUSES:
+                raise ValueError(f"Job {job_id} is {job['status']} and cannot be resumed")
+            self._check_running()
+            active = self.active()
+            if active is not None:
+                raise RuntimeError(f"Job {active['id']} is still {active['status']}")
+            job.update(status='queued', finished=None, error=None, message="Queued to resume")
+            if os.path.exists(self._path(job_id, ".cancel")):
+                os.remove(self._path(job_id, ".cancel"))
+            self._enqueue(job)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a queued or running job to stop at its next checkpoint; False if it is not active"""
+        job = self.get(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return False
+        with open(self._path(job_id, ".cancel"), 'w'):
+            pass
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll: float = 0.05) -> Dict[str, Any]:
+        """Block until a job is no longer queued or running; returns its state"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is not None and job['status'] not in ACTIVE_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} still {job and job['status']} after {timeout}s")
+            time.sleep(poll)
+
+    def _enqueue(self, job: Dict[str, Any]):
+        job.update(owner())
+        self._save(job)
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name="rag-ingest", daemon=True)
+            self._worker.start()
+        self._queue.put(job['id'])
+
+    def _prune_jobs(self):
+        for job in self.jobs()[KEEP_JOBS:]:
+            if job['status'] in ACTIVE_STATUSES:
+                continue
+            for suffix in (".json", ".stories.jsonl", ".cancel"):
+                if os.path.exists(self._path(job['id'], suffix)):
+                    os.remove(self._path(job['id'], suffix))
+
+    def start(self):
+        """Start submitting scheduled update jobs, when an interval is set"""
+        if self.interval and (self._scheduler is None or not self._scheduler.is_alive()):
+            self._scheduler = threading.Thread(target=self._schedule, name="rag-ingest-schedule", daemon=True)
+            self._scheduler.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the scheduler and the worker, cancelling the current job at its next checkpoint
+
+        Jobs still queued are cancelled too, and later submits raise.
+        """
+        with self._lock:
+            self._stopping.set()
+            self._queue.put(None)
+        for thread in (self._scheduler, self._worker):
+            if thread is not None:
+                thread.join(timeout)
+
+    def next_scheduled(self) -> Optional[float]:
+        """When the next scheduled job is due (a time.time() value), or None without a schedule"""
+        if not self.interval:
+            return None
+        latest = self.jobs(limit=1)
+        return (latest[0]['created'] if latest else self._started) + self.interval
+
+    def _schedule(self):
+        while not self._stopping.wait(max(0.0, self.next_scheduled() - time.time())):
+            try:
+                if self.active() is None:
+                    self.submit('update', trigger='schedule')
+                else:
+                    # A job is still running; look again once it may have finished
+                    self._stopping.wait(self.interval)
+            except Exception as e:
+                logger.error(f"Scheduled ingest job failed to start: {e}")
+                self._stopping.wait(self.interval)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self.get(job_id)
+            if job is None or job['status'] != 'queued':
+                continue
+            if self._stopping.is_set():
+                job.update(status='cancelled', finished=time.time(), message="Cancelled: the runner was stopped")
+                self._save(job)
+            else:
+                self._run(job)
+
+    def _check_running(self):
+        if self._stopping.is_set():
+            raise RuntimeError("The ingest runner has been stopped")
+
+    def _check_cancel(self, job: Dict[str, Any]):
+        if self._stopping.is_set() or os.path.exists(self._path(job['id'], ".cancel")):
+            raise JobCancelled(job['id'])
+
+    def _run(self, job: Dict[str, Any]):
+        progress = JobProgress(self, job)
+        job.update(status='running', started=time.time())
+        self._save(job)
+        try:
+            stories = self._scrape(job, progress)
+            if job['kind'] == 'refresh':
+                self._rebuild(job, stories, progress)
+            else:
+                self._index(job, stories, progress)
+            job.update(status='succeeded', progress=1.0,
+                       message=f"Indexed {job['indexed'] - job['unchanged']} of {len(stories)} stories "
+                               f"({job['unchanged']} unchanged, {job['removed']} removed)")
+        except JobCancelled:
+            job.update(status='cancelled', message="Cancelled")
+        except Exception as e:
+            logger.exception(f"Ingest job {job['id']} failed")
+            job.update(status='failed', error=str(e), message=f"Failed: {e}")
+        job['finished'] = time.time()
+        self._save(job)
+
+    def _read_checkpoint(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        stories = []
+        try:
+            with open(self._path(job['id'], ".stories.jsonl"), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        stories.append(json.loads(line))
+                    except ValueError:
+                        # A line cut short when the process died
+                        break
+        except FileNotFoundError:
+            pass
+        return stories
+
+    def _scrape(self, job: Dict[str, Any], progress: JobProgress) -> List[Dict[str, Any]]:
+        """Scrape the stories not yet in the job's checkpoint, appending each one to it"""
+        stories = self._read_checkpoint(job)
+        if job['scrape_complete']:
+            return stories
+
+        progress.span(0.0, SCRAPE_SHARE)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with open(self._path(job['id'], ".stories.jsonl"), 'w', encoding='utf-8') as checkpoint:
+            # Rewritten whole, so a line cut short by a crash is dropped
+            for story in stories:
+                checkpoint.write(json.dumps(story) + "\n")
+
+            def on_story(story: Dict[str, Any]):
+                checkpoint.write(json.dumps(story) + "\n")
+                checkpoint.flush()
+                stories.append(story)
+                job['scraped'] = len(stories)
+
+            def should_stop() -> bool:
+                return self._stopping.is_set() or os.path.exists(self._path(job['id'], ".cancel"))
+
+            self.scraper_factory(progress).scrape_customer_stories(
+                skip_urls={story['url'] for story in stories}, on_story=on_story, should_stop=should_stop)
+
+        self._check_cancel(job)
+        if not stories:
+            raise RuntimeError("No customer stories were scraped; check the connection")
+        job.update(scraped=len(stories), scrape_complete=True)
+        self._save(job)
+        return stories
+
+    def _index(self, job: Dict[str, Any], stories: List[Dict[str, Any]], progress: JobProgress):
+        """Write stories to the store a batch at a time, checkpointing after each batch"""
+        total = len(stories)
+        for start in range(job['indexed'], total, self.batch_size):
+            self._check_cancel(job)
+            batch = stories[start:start + self.batch_size]
+            # Stories as they are already stored are left alone
+            changed = [story for story in batch if self.vector_store.full_documents.get(story['url']) != story]
+            job['unchanged'] += len(batch) - len(changed)
+            batch = changed
+
+            progress.span(SCRAPE_SHARE + (1 - SCRAPE_SHARE) * start / total,
+                          SCRAPE_SHARE + (1 - SCRAPE_SHARE) * min(start + self.batch_size, total) / total)
+            if batch:
+                self.vector_store.add_or_update_stories(batch, progress=progress)
+            job['indexed'] = min(start + self.batch_size, total)
+            self._save(job)
+
+    def _rebuild(self, job: Dict[str, Any], stories: List[Dict[str, Any]], progress: JobProgress):
+        """Replace the index with one built from every story, switched in only once complete"""
+        self._check_cancel(job)
+        progress.span(SCRAPE_SHARE, 1.0)
+        urls = {story['url'] for story in stories}
+        removed = [url for url in self.vector_store.full_documents if url not in urls]
+        if not self.vector_store.refresh_store(stories, progress):
+            raise RuntimeError("The rebuilt index failed validation; the current index was kept")
+        job.update(indexed=len(stories), removed=len(removed))
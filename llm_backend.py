@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import zlib
+import random
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+@dataclass
+class LLMResponse:
+    """A completed chat response with token usage"""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+class LLMBackend(ABC):
+    """Chat completion backend used by RAGEngine
+
+    Implementations must be safe to call from several threads at once, since
+    one engine (and its backend) is shared by all sessions.
+    """
+
+    model: str = "unknown"
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None) -> LLMResponse:
+        """Generate a full response"""
+
+    def stream(self, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+               max_tokens: Optional[int] = None) -> Iterator[Union[str, LLMResponse]]:
+        """Yield text deltas as they are generated, then one final LLMResponse"""
+        response = self.complete(messages, temperature=temperature, max_tokens=max_tokens)
+        yield response.text
+        yield response
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions"""
+
+    # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
+    # do not change this unless explicitly requested by the user
+    def __init__(self, model: str = "gpt-5", api_key: Optional[str] = None):
+        from openai import OpenAI
+
+        self.model = model
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY", "default_key"))
+
+    def _request_args(self, messages, temperature, max_tokens) -> Dict[str, Any]:
+        args = {'model': self.model, 'messages': messages}
+        if temperature is not None:
+            args['temperature'] = temperature
+        if max_tokens is not None:
+            args['max_completion_tokens'] = max_tokens
+        return args
+
+    def complete(self, messages, temperature=None, max_tokens=None) -> LLMResponse:
+        response = self.client.chat.completions.create(
+            stream=False,
+            **self._request_args(messages, temperature, max_tokens)
+        )
+        usage = response.usage
+        return LLMResponse(
+            text=response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0
+        )
+
+    def stream(self, messages, temperature=None, max_tokens=None):
+        stream = self.client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._request_args(messages, temperature, max_tokens)
+        )
+
+        parts = []
+        prompt_tokens = completion_tokens = 0
+        for chunk in stream:
+            if chunk.usage:
+                prompt_tokens = chunk.usage.prompt_tokens
+                completion_tokens = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                parts.append(text)
+                yield text
+
+        yield LLMResponse("".join(parts), prompt_tokens, completion_tokens)
+
+class SimulatedLLMBackend(LLMBackend):
+    """Deterministic offline stand-in for benchmarks and load tests
+
+    Emulates latency, streaming and token usage without network calls. Each
+    call draws from an RNG seeded by (seed, prompt), so a given prompt gets
+    the same latency, answer and usage on every run, regardless of how
+    concurrent callers interleave.
+
+    Latency distributions (total seconds per completion):
+        fixed      always latency_ms
+        uniform    uniform in [latency_ms * (1 - spread), latency_ms * (1 + spread)]
+        lognormal  median latency_ms, shape sigma (long right tail, like real APIs)
+        empirical  resampled from latency_samples_ms (e.g. measured production latencies)
+    """
+
+    _SOURCE_PATTERN = re.compile(r"--- Source \d+: (.+?) \(")
+
+    def __init__(self, model: str = "simulated", latency: str = "lognormal",
+                 latency_ms: float = 800.0, sigma: float = 0.5, spread: float = 0.5,
+                 latency_samples_ms: Optional[Sequence[float]] = None,
+                 time_to_first_token: float = 0.3, completion_tokens: int = 200,
+                 failure_rate: float = 0.0, seed: int = 0, sleep: bool = True):
+        if latency == "empirical" and not latency_samples_ms:
+            raise ValueError("latency='empirical' needs latency_samples_ms")
+        if latency not in ("fixed", "uniform", "lognormal", "empirical"):
+            raise ValueError(f"Unknown latency distribution: {latency}")
+
+        self.model = model
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.spread = spread
+        self.latency_samples_ms = list(latency_samples_ms or [])
+        self.time_to_first_token = time_to_first_token
+        self.completion_tokens = completion_tokens
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.sleep = sleep
+
+    def _rng(self, messages: List[Dict[str, str]]) -> random.Random:
+        prompt = "\n".join(m.get('content', '') for m in messages)
+        return random.Random(zlib.crc32(prompt.encode('utf-8')) ^ self.seed)
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        if self.latency == "fixed":
+            ms = self.latency_ms
+        elif self.latency == "uniform":
+            ms = rng.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+        elif self.latency == "lognormal":
+            ms = self.latency_ms * rng.lognormvariate(0.0, self.sigma)
+        else:
+            ms = rng.choice(self.latency_samples_ms)
+        return max(ms, 0.0) / 1000
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        # Roughly 4 characters per token for English text
+        return max(1, len(text) // 4)
+
+    def _answer(self, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> str:
+        prompt = messages[-1].get('content', '') if messages else ''
+
+        if "Respond in JSON format" in prompt:
+            question = re.search(r"Question: (.*)", prompt)
+            return json.dumps({
+                "complexity": "complex" if len(prompt) > 400 else "simple",
+                "sub_queries": [question.group(1).strip() if question else prompt[:200]],
+                "reasoning": "Simulated plan: search the main question directly."
+            })
+
+        sources = list(dict.fromkeys(self._SOURCE_PATTERN.findall(prompt)))
+        words = f"Simulated answer based on {len(sources)} retrieved sources.".split()
+        for name in sources:
+            words.extend(f"{name}.".split())
+
+        target = min(self.completion_tokens, max_tokens or self.completion_tokens)
+        filler = "Customers report measurable improvements in safety, efficiency and cost".split()
+        i = 0
+        while len(words) < target:
+            words.append(filler[i % len(filler)])
+            i += 1
+        return " ".join(words[:max(target, 1)])
+
+    def _plan(self, messages, max_tokens):
+        rng = self._rng(messages)
+        latency = self._sample_latency(rng)
+        if rng.random() < self.failure_rate:
+            return None, latency
+
+        text = self._answer(messages, max_tokens)
+        prompt_tokens = sum(self._count_tokens(m.get('content', '')) for m in messages)
+        return LLMResponse(text, prompt_tokens, len(text.split())), latency
+
+    def complete(self, messages, temperature=None, max_tokens=None) -> LLMResponse:
+        response, latency = self._plan(messages, max_tokens)
+        if self.sleep:
+            time.sleep(latency)
+        if response is None:
+            raise RuntimeError("Simulated LLM failure")
+        return response
+
+    def stream(self, messages, temperature=None, max_tokens=None):
+        response, latency = self._plan(messages, max_tokens)
+        first_token = latency * self.time_to_first_token
+
+        if self.sleep:
+            time.sleep(first_token)
+        if response is None:
+            raise RuntimeError("Simulated LLM failure")
+
+        words = response.text.split(" ")
+        per_token = (latency - first_token) / max(len(words), 1)
+        for i, word in enumerate(words):
+            if self.sleep and i > 0:
+                time.sleep(per_token)
+            yield word if i == 0 else " " + word
+
+        yield response
+
+def create_llm_backend(name: Optional[str] = None, **kwargs) -> LLMBackend:
+    """Build a backend by name: 'openai' (default) or 'simulated'
+
+    Without a name, RAG_LLM_BACKEND selects the backend and RAG_LLM_MODEL
+    overrides the model, so services and benchmarks can run offline by
+    setting RAG_LLM_BACKEND=simulated.
+    """
+    name = (name or os.getenv("RAG_LLM_BACKEND", "openai")).lower()
+    model = os.getenv("RAG_LLM_MODEL")
+    if model and 'model' not in kwargs:
+        kwargs['model'] = model
+
+    if name == "openai":
+        return OpenAIBackend(**kwargs)
+    elif name == "simulated":
+        return SimulatedLLMBackend(**kwargs)
+    raise ValueError(f"Unknown LLM backend: {name}")
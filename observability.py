@@ -1,15 +1,24 @@
 import os
 import time
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, IO, Iterator, Optional
 from datetime import datetime
 import uuid
-import streamlit as st
+import random
+import threading
+from collections import OrderedDict, deque
+from contextlib import nullcontext
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+from tracing import activate_trace
+from trace_store import TraceArchive
+from telemetry import TelemetryExporter, logfire_sink
+from perf_log import PerformanceLog
+from progress import logger
+
 try:
     import logfire
     LOGFIRE_AVAILABLE = True
@@ -17,11 +26,58 @@ except ImportError:
     LOGFIRE_AVAILABLE = False
 
 class ObservabilityTracker:
-    """Observability and tracing for RAG operations"""
+    """Observability and tracing for RAG operations
+    
+    Memory is bounded: only the most recent `capacity` completed traces and
+    metrics are kept. Older traces roll out to a TraceArchive on disk when
+    archive_dir (or RAG_TRACE_DIR) is set, and are dropped otherwise. Summary
+    statistics come from running aggregates, so they cover every query since
+    the last clear_data() regardless of what has been rolled out.
+    
+    Sampling decides which traces are kept (stored and exported):
+        head   a random sample_rate fraction, decided when the trace starts
+        tail   every trace slower than slow_threshold seconds or ending in
+               an error, decided when it ends
+    Every query still counts toward the aggregates. In detailed mode,
+    head-sampled traces also record per-stage payload sizes; tail-kept
+    traces have timings and counts only, since that is decided too late.
+    
+    When a PerformanceLog is given, every completed query (sampled or not)
+    is also appended to it, for durable history across sessions and restarts.
+    """
     
-    def __init__(self):
-        self.traces = {}
-        self.metrics = []
+    def __init__(self, stage_spans: Optional[bool] = None, capacity: Optional[int] = None,
+                 archive_dir: Optional[str] = None, exporter: Optional[TelemetryExporter] = None,
+                 sample_rate: Optional[float] = None, slow_threshold: Optional[float] = None,
+                 detailed: Optional[bool] = None, perf_log: Optional[PerformanceLog] = None):
+        self.capacity = capacity or int(os.getenv('RAG_TRACE_CAPACITY', '1000'))
+        # In-flight traces, and the most recent completed ones (oldest first)
+        self.active_traces = {}
+        self.traces = OrderedDict()
+        self.metrics = deque(maxlen=self.capacity)
+        # Shared by every session in the process, so guard mutations
+        self._lock = threading.Lock()
+        self._reset_aggregates()
+        
+        archive_dir = archive_dir or os.getenv('RAG_TRACE_DIR')
+        self.archive = TraceArchive(archive_dir) if archive_dir else None
+        self.perf_log = perf_log
+        
+        # Per-stage spans within each query; RAG_STAGE_SPANS=0 turns them off
+        if stage_spans is None:
+            stage_spans = os.getenv('RAG_STAGE_SPANS', '1') != '0'
+        self.stage_spans = stage_spans
+        
+        # Head sampling rate, tail latency threshold (seconds) and detailed mode
+        if sample_rate is None:
+            sample_rate = float(os.getenv('RAG_TRACE_SAMPLE_RATE', '1.0'))
+        if slow_threshold is None:
+            slow_threshold = float(os.getenv('RAG_TRACE_SLOW_MS', '5000')) / 1000
+        if detailed is None:
+            detailed = os.getenv('RAG_TRACE_DETAILED', '0') == '1'
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.detailed = detailed
         
         # Initialize Logfire if available
         if LOGFIRE_AVAILABLE:
@@ -31,17 +87,28 @@ class ObservabilityTracker:
                 if logfire_token:
                     logfire.configure(token=logfire_token)
                     self.logfire_enabled = True
-                    print("✓ Pydantic Logfire initialized successfully with your account")
+                    logger.info("Pydantic Logfire initialized successfully with your account")
                 else:
                     logfire.configure()
                     self.logfire_enabled = True
-                    print("✓ Pydantic Logfire initialized (no token found)")
+                    logger.info("Pydantic Logfire initialized (no token found)")
             except Exception as e:
-                print(f"WARNING: Logfire configuration failed: {str(e)}")
+                logger.warning(f"Logfire configuration failed: {str(e)}")
                 self.logfire_enabled = False
         else:
-            print("WARNING: Pydantic Logfire not available - using local logging")
+            logger.warning("Pydantic Logfire not available - using local logging")
             self.logfire_enabled = False
+        
+        # Telemetry leaves the request path: events are queued and exported
+        # in batches by a background thread
+        if exporter is None and self.logfire_enabled:
+            exporter = TelemetryExporter(logfire_sink)
+        self.exporter = exporter
+    
+    def _emit(self, name: str, **attributes):
+        """Queue a telemetry event; a no-op without an exporter"""
+        if self.exporter is not None:
+            self.exporter.emit(name, **attributes)
     
     def start_trace(self, query: str, config: Dict[str, Any]) -> str:
         """Start tracing a RAG query"""
@@ -53,30 +120,63 @@ class ObservabilityTracker:
             'config': config,
             'start_time': time.time(),
             'timestamp': datetime.now(),
-            'status': 'started'
+            'status': 'started',
+            'sampled': self.sample_rate >= 1.0 or random.random() < self.sample_rate,
+            'spans': []
         }
         
-        self.traces[trace_id] = trace_data
-        
-        # Log to Logfire if available
-        if self.logfire_enabled:
-            try:
-                with logfire.span('rag_query_start') as span:
-                    span.set_attribute('trace_id', trace_id)
-                    span.set_attribute('query', query)
-                    span.set_attribute('rag_strategy', config.get('strategy', 'unknown'))
-                    span.set_attribute('top_k', config.get('top_k', 0))
-            except Exception as e:
-                print(f"WARNING: Logfire logging error: {str(e)}")
+        with self._lock:
+            self.active_traces[trace_id] = trace_data
         
         return trace_id
     
+    def activate(self, trace_id: str):
+        """Context manager making trace_id the target of span() on this thread"""
+        trace_data = self.get_trace(trace_id)
+        if not self.stage_spans or trace_data is None:
+            return nullcontext()
+        return activate_trace(trace_id, trace_data['spans'],
+                              detailed=self.detailed and trace_data['sampled'])
+    
+    def is_detailed(self, trace_id: str) -> bool:
+        """Whether a trace records per-stage payload sizes"""
+        trace_data = self.get_trace(trace_id)
+        return bool(self.detailed and trace_data and trace_data['sampled'])
+    
+    def record_span(self, trace_id: str, name: str, duration: float, **attributes):
+        """Record a stage timed by the caller, for stages that cannot sit in a with block"""
+        trace_data = self.get_trace(trace_id)
+        if not self.stage_spans or trace_data is None:
+            return
+        
+        trace_data['spans'].append({
+            'name': name,
+            'parent': None,
+            'depth': 0,
+            'offset': time.time() - duration - trace_data['start_time'],
+            'duration': duration,
+            'attributes': attributes
+        })
+    
+    def get_stage_durations(self, trace_id: str) -> Dict[str, float]:
+        """Total seconds per stage name for a trace (empty if unknown)"""
+        trace_data = self.get_trace(trace_id)
+        return self._stage_durations(trace_data) if trace_data else {}
+    
+    @staticmethod
+    def _stage_durations(trace_data: Dict[str, Any]) -> Dict[str, float]:
+        """Total time per stage name across a trace's spans"""
+        stages = {}
+        for recorded in trace_data.get('spans', []):
+            stages[recorded['name']] = stages.get(recorded['name'], 0.0) + recorded['duration']
+        return stages
+    
     def end_trace(self, trace_id: str, response: Dict[str, Any], num_documents: int):
         """End tracing a RAG query"""
-        if trace_id not in self.traces:
+        trace_data = self.active_traces.get(trace_id)
+        if trace_data is None:
             return
         
-        trace_data = self.traces[trace_id]
         end_time = time.time()
         
         trace_data.update({
@@ -96,34 +196,25 @@ class ObservabilityTracker:
             'duration': trace_data['duration'],
             'tokens_used': response.get('tokens_used', 0),
             'num_documents': num_documents,
+            'stages': self._stage_durations(trace_data),
             'timestamp': trace_data['timestamp'],
             'success': True
         }
         
-        self.metrics.append(metric)
-        
-        # Log to Logfire if available
-        if self.logfire_enabled:
-            try:
-                with logfire.span('rag_query_complete') as span:
-                    span.set_attribute('trace_id', trace_id)
-                    span.set_attribute('duration', trace_data['duration'])
-                    span.set_attribute('tokens_used', response.get('tokens_used', 0))
-                    span.set_attribute('num_documents', num_documents)
-                    span.set_attribute('success', True)
-            except Exception as e:
-                st.warning(f"Logfire logging error: {str(e)}")
+        self._complete(trace_data, metric)
         
         return trace_data
     
     def log_error(self, trace_id: str, error_message: str):
         """Log an error for a trace"""
-        if trace_id in self.traces:
-            trace_data = self.traces[trace_id]
+        trace_data = self.active_traces.get(trace_id)
+        if trace_data is not None:
+            end_time = time.time()
             trace_data.update({
                 'status': 'error',
                 'error_message': error_message,
-                'end_time': time.time()
+                'end_time': end_time,
+                'duration': end_time - trace_data['start_time']
             })
             
             # Store error metric
@@ -131,77 +222,153 @@ class ObservabilityTracker:
                 'trace_id': trace_id,
                 'query': trace_data.get('query', ''),
                 'strategy': trace_data.get('config', {}).get('strategy', 'unknown'),
-                'duration': trace_data.get('end_time', time.time()) - trace_data.get('start_time', time.time()),
+                'duration': trace_data['duration'],
                 'error': error_message,
+                'stages': self._stage_durations(trace_data),
                 'timestamp': trace_data.get('timestamp', datetime.now()),
                 'success': False
             }
             
-            self.metrics.append(metric)
-            
-            # Log to Logfire if available
-            if self.logfire_enabled:
-                try:
-                    with logfire.span('rag_query_error') as span:
-                        span.set_attribute('trace_id', trace_id)
-                        span.set_attribute('error_message', error_message)
-                        span.record_exception(Exception(error_message))
-                except Exception as e:
-                    st.warning(f"Logfire error logging failed: {str(e)}")
+            self._complete(trace_data, metric)
     
     def log_retrieval_step(self, trace_id: str, step_name: str, duration: float, metadata: Dict[str, Any]):
         """Log a retrieval step within a trace"""
-        if self.logfire_enabled:
-            try:
-                with logfire.span(f'retrieval_step_{step_name}') as span:
-                    span.set_attribute('trace_id', trace_id)
-                    span.set_attribute('step_name', step_name)
-                    span.set_attribute('duration', duration)
-                    
-                    for key, value in metadata.items():
-                        span.set_attribute(key, value)
-                        
-            except Exception as e:
-                st.warning(f"Logfire step logging error: {str(e)}")
+        self._emit(f'retrieval_step_{step_name}', trace_id=trace_id, step_name=step_name,
+                   duration=duration, **metadata)
+
+    def _keep_reason(self, trace_data: Dict[str, Any]) -> Optional[str]:
+        """Why a finished trace is kept: 'error', 'slow', 'head', or None to drop it"""
+        if trace_data['status'] == 'error':
+            return 'error'
+        if trace_data['duration'] >= self.slow_threshold:
+            return 'slow'
+        if trace_data['sampled']:
+            return 'head'
+        return None
+    
+    def _complete(self, trace_data: Dict[str, Any], metric: Dict[str, Any]):
+        """Count a finished trace; if sampled, move it into the ring buffer and export it"""
+        reason = self._keep_reason(trace_data)
+        evicted = []
+        with self._lock:
+            self.active_traces.pop(trace_data['trace_id'], None)
+            self.metrics.append(metric)
+            self._update_aggregates(metric)
+            self._sampling[reason or 'dropped'] += 1
+            
+            if reason is not None:
+                trace_data['kept_because'] = reason
+                self.traces[trace_data['trace_id']] = trace_data
+                while len(self.traces) > self.capacity:
+                    evicted.append(self.traces.popitem(last=False)[1])
+        
+        if self.archive is not None:
+            for old_trace in evicted:
+                self.archive.append(old_trace)
+        
+        if self.perf_log is not None:
+            self.perf_log.append(
+                timestamp=trace_data['start_time'], query=trace_data['query'],
+                strategy=metric['strategy'], status=trace_data['status'],
+                response_time=trace_data['duration'], tokens_used=metric.get('tokens_used', 0),
+                num_sources=metric.get('num_documents', 0),
+                intent=trace_data['config'].get('query_intent'), trace_id=trace_data['trace_id'],
+                stages=metric['stages'], error=metric.get('error')
+            )
+        
+        if reason is not None:
+            self._export_trace(trace_data)
+    
+    def _export_trace(self, trace_data: Dict[str, Any]):
+        """Queue telemetry events for a kept trace"""
+        trace_id = trace_data['trace_id']
+        config = trace_data['config']
+        self._emit('rag_query_start', trace_id=trace_id, query=trace_data['query'],
+                   rag_strategy=config.get('strategy', 'unknown'), top_k=config.get('top_k', 0),
+                   kept_because=trace_data['kept_because'])
+        
+        for recorded in trace_data['spans']:
+            self.log_retrieval_step(trace_id, recorded['name'], recorded['duration'], recorded['attributes'])
+        
+        if trace_data['status'] == 'error':
+            self._emit('rag_query_error', level='error', trace_id=trace_id,
+                       error_message=trace_data['error_message'])
+        else:
+            self._emit('rag_query_complete', trace_id=trace_id, duration=trace_data['duration'],
+                       tokens_used=trace_data.get('response_tokens', 0),
+                       num_documents=trace_data.get('num_documents_retrieved', 0), success=True)
+    
+    def _reset_aggregates(self):
+        self._totals = {'count': 0, 'successes': 0, 'success_duration': 0.0, 'success_tokens': 0}
+        self._strategy_totals = {}
+        self._stage_totals = {}
+        self._sampling = {'head': 0, 'slow': 0, 'error': 0, 'dropped': 0}
+    
+    def _update_aggregates(self, metric: Dict[str, Any]):
+        """Fold one metric into the running aggregates (caller holds the lock)"""
+        success = metric.get('success', False)
+        duration = metric.get('duration', 0)
+        tokens = metric.get('tokens_used', 0)
+        
+        self._totals['count'] += 1
+        if success:
+            self._totals['successes'] += 1
+            self._totals['success_duration'] += duration
+            self._totals['success_tokens'] += tokens
+        
+        strategy = self._strategy_totals.setdefault(metric.get('strategy', 'unknown'), {
+            'count': 0,
+            'total_duration': 0,
+            'total_tokens': 0,
+            'successes': 0
+        })
+        strategy['count'] += 1
+        strategy['total_duration'] += duration
+        strategy['total_tokens'] += tokens
+        if success:
+            strategy['successes'] += 1
+            
+            for stage_name, stage_duration in metric.get('stages', {}).items():
+                stage = self._stage_totals.setdefault(stage_name, {'count': 0, 'total_duration': 0})
+                stage['count'] += 1
+                stage['total_duration'] += stage_duration
     
     def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
-        """Get trace data by ID"""
-        return self.traces.get(trace_id)
+        """Get an in-flight or recent trace by ID"""
+        trace_data = self.active_traces.get(trace_id)
+        if trace_data is None:
+            trace_data = self.traces.get(trace_id)
+        return trace_data
     
     def get_all_traces(self) -> Dict[str, Dict[str, Any]]:
-        """Get all trace data"""
-        return self.traces.copy()
+        """Get in-flight and recent trace data held in memory"""
+        with self._lock:
+            all_traces = dict(self.traces)
+            all_traces.update(self.active_traces)
+            return all_traces
     
     def get_metrics_summary(self) -> Dict[str, Any]:
         """Get summary metrics"""
-        if not self.metrics:
+        with self._lock:
+            totals = dict(self._totals)
+            strategy_breakdown = {name: dict(data) for name, data in self._strategy_totals.items()}
+            stage_breakdown = {name: dict(data) for name, data in self._stage_totals.items()}
+            sampling = dict(self._sampling)
+        
+        if not totals['count']:
             return {
                 'total_queries': 0,
                 'avg_duration': 0,
                 'success_rate': 0,
                 'avg_tokens': 0,
-                'strategy_breakdown': {}
+                'strategy_breakdown': {},
+                'stage_breakdown': {},
+                'sampling': sampling,
+                'telemetry': self.get_telemetry_stats()
             }
         
-        successful_metrics = [m for m in self.metrics if m.get('success', False)]
-        
-        strategy_breakdown = {}
-        for metric in self.metrics:
-            strategy = metric.get('strategy', 'unknown')
-            if strategy not in strategy_breakdown:
-                strategy_breakdown[strategy] = {
-                    'count': 0,
-                    'total_duration': 0,
-                    'total_tokens': 0,
-                    'successes': 0
-                }
-            
-            strategy_breakdown[strategy]['count'] += 1
-            strategy_breakdown[strategy]['total_duration'] += metric.get('duration', 0)
-            strategy_breakdown[strategy]['total_tokens'] += metric.get('tokens_used', 0)
-            
-            if metric.get('success', False):
-                strategy_breakdown[strategy]['successes'] += 1
+        for stage_data in stage_breakdown.values():
+            stage_data['avg_duration'] = stage_data['total_duration'] / stage_data['count']
         
         # Calculate averages for each strategy
         for strategy_data in strategy_breakdown.values():
@@ -210,34 +377,76 @@ class ObservabilityTracker:
                 strategy_data['avg_tokens'] = strategy_data['total_tokens'] / strategy_data['count']
                 strategy_data['success_rate'] = strategy_data['successes'] / strategy_data['count']
         
+        successes = totals['successes']
         return {
-            'total_queries': len(self.metrics),
-            'successful_queries': len(successful_metrics),
-            'avg_duration': sum(m.get('duration', 0) for m in successful_metrics) / len(successful_metrics) if successful_metrics else 0,
-            'success_rate': len(successful_metrics) / len(self.metrics) if self.metrics else 0,
-            'avg_tokens': sum(m.get('tokens_used', 0) for m in successful_metrics) / len(successful_metrics) if successful_metrics else 0,
-            'strategy_breakdown': strategy_breakdown
+            'total_queries': totals['count'],
+            'successful_queries': successes,
+            'avg_duration': totals['success_duration'] / successes if successes else 0,
+            'success_rate': successes / totals['count'],
+            'avg_tokens': totals['success_tokens'] / successes if successes else 0,
+            'strategy_breakdown': strategy_breakdown,
+            'stage_breakdown': stage_breakdown,
+            'sampling': sampling,
+            'telemetry': self.get_telemetry_stats()
         }
     
+    def get_telemetry_stats(self) -> Dict[str, int]:
+        """Export queue counters (queued, exported, dropped, ...); empty without an exporter"""
+        return self.exporter.stats() if self.exporter is not None else {}
+    
+    def iter_traces(self) -> Iterator[Dict[str, Any]]:
+        """Stream every completed trace, oldest first: archived, then in memory"""
+        if self.archive is not None:
+            yield from self.archive.iter_records()
+        
+        with self._lock:
+            recent = list(self.traces.values())
+        yield from recent
+    
+    def export_jsonl(self, output: IO[str]) -> int:
+        """Write every completed trace to a text stream as JSON lines
+        
+        Streams from the archive segment by segment, so memory use does not
+        depend on how many traces have been recorded. Returns the count.
+        """
+        count = 0
+        for trace_data in self.iter_traces():
+            output.write(json.dumps(trace_data, default=str) + "\n")
+            count += 1
+        return count
+    
     def export_traces(self) -> str:
-        """Export all traces as JSON"""
-        export_data = {
-            'traces': self.traces,
-            'metrics': self.metrics,
-            'exported_at': datetime.now().isoformat()
-        }
+        """Export the traces and metrics held in memory as JSON
+        
+        Use export_jsonl() to include traces rolled out to the archive.
+        """
+        with self._lock:
+            export_data = {
+                'traces': dict(self.traces),
+                'metrics': list(self.metrics),
+                'exported_at': datetime.now().isoformat()
+            }
         
         return json.dumps(export_data, indent=2, default=str)
     
+    def close(self):
+        """Export queued telemetry and write buffered archive records (call on shutdown)"""
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.archive is not None:
+            self.archive.flush()
+        if self.perf_log is not None:
+            self.perf_log.close()
+    
     def clear_data(self):
-        """Clear all trace and metric data"""
-        self.traces.clear()
-        self.metrics.clear()
+        """Clear all trace and metric data (the durable performance log is kept)"""
+        with self._lock:
+            self.active_traces.clear()
+            self.traces.clear()
+            self.metrics.clear()
+            self._reset_aggregates()
         
-        if self.logfire_enabled:
-            try:
-                with logfire.span('observability_data_cleared') as span:
-                    span.set_attribute('action', 'clear_data')
-                    span.set_attribute('timestamp', datetime.now().isoformat())
-            except Exception as e:
-                st.warning(f"Logfire clear logging error: {str(e)}")
+        if self.archive is not None:
+            self.archive.clear()
+        
+        self._emit('observability_data_cleared', action='clear_data')
@@ -0,0 +1,390 @@
+"""Durable, process-wide log of query performance
+
+Every query the ObservabilityTracker completes is appended here, so latency
+history survives restarts and covers every session rather than one browser
+tab. Records are stored in time-partitioned SQLite files, one per UTC day,
+each in WAL mode so readers never block the writer:
+
+    <directory>/queries-<YYYYMMDD>.sqlite3
+
+Each partition is indexed by time, by (strategy, time) and by (intent, time).
+Appending only queues the record; a TelemetryExporter thread writes queued
+records in batches, one transaction per partition, and drops (and counts)
+records if the queue is full, so a slow disk never slows a query.
+
+compact() folds partitions older than the raw retention window into hourly
+rollups (MetricStats per strategy and intent, including the latency sketch)
+in rollups.sqlite3 and deletes them, so history is unbounded in time while
+the raw rows kept on disk are bounded. It runs when the log is opened and
+from the writer thread whenever it starts a new day's partition.
+"""
+import os
+import glob
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from perf_store import PerformanceStore
+from progress import logger
+from sketches import MetricStats
+from telemetry import TelemetryExporter
+
+PARTITION_PREFIX = "queries-"
+PARTITION_SUFFIX = ".sqlite3"
+ROLLUP_FILE = "rollups.sqlite3"
+
+COLUMNS = ('timestamp', 'trace_id', 'query', 'strategy', 'intent', 'status', 'response_time',
+           'tokens_used', 'num_sources', 'stages', 'error')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    timestamp REAL NOT NULL,
+    trace_id TEXT,
+    query TEXT,
+    strategy TEXT,
+    intent TEXT,
+    status TEXT,
+    response_time REAL,
+    tokens_used INTEGER,
+    num_sources INTEGER,
+    stages TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS queries_time ON queries (timestamp);
+CREATE INDEX IF NOT EXISTS queries_strategy_time ON queries (strategy, timestamp);
+CREATE INDEX IF NOT EXISTS queries_intent_time ON queries (intent, timestamp);
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hourly (
+    hour REAL NOT NULL,
+    strategy TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    errors INTEGER NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (hour, strategy, intent)
+);
+"""
+
+def _connect(path: str, schema: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+def _day(timestamp: float) -> str:
+    return time.strftime("%Y%m%d", time.gmtime(timestamp))
+
+class PerformanceLog:
+    """Append-only, day-partitioned SQLite log of per-query performance"""
+
+    def __init__(self, directory: str, raw_retention_days: int = 30, max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 0.5):
+        self.directory = directory
+        self.raw_retention_days = raw_retention_days
+        os.makedirs(directory, exist_ok=True)
+
+        # Writer connections, one per partition, used only under the lock
+        self._lock = threading.Lock()
+        self._writers: Dict[str, sqlite3.Connection] = {}
+        self._writer = TelemetryExporter(self._write_batch, max_queue=max_queue,
+                                         batch_size=batch_size, flush_interval=flush_interval)
+        with self._lock:
+            self._compact_expired()
+
+    # Writing
+
+    def append(self, timestamp: float, query: str, strategy: str, status: str,
+               response_time: float, tokens_used: int = 0, num_sources: int = 0,
+               intent: Optional[str] = None, trace_id: Optional[str] = None,
+               stages: Optional[Dict[str, float]] = None, error: Optional[str] = None):
+        """Queue one query record; never blocks"""
+        self._writer.emit('query', record=(
+            timestamp, trace_id, query, strategy, intent or 'unknown', status, response_time,
+            tokens_used, num_sources, json.dumps(stages or {}), error,
+        ))
+
+    def _writer_for(self, day: str) -> sqlite3.Connection:
+        conn = self._writers.get(day)
+        if conn is None:
+            conn = self._writers[day] = _connect(self._partition_path(day), SCHEMA)
+        return conn
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        by_day: Dict[str, List[Tuple]] = {}
+        for event in batch:
+            record = event['record']
+            by_day.setdefault(_day(record[0]), []).append(record)
+
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self._lock:
+            opened = [day for day in by_day if day not in self._writers]
+            for day, records in by_day.items():
+                conn = self._writer_for(day)
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO queries ({', '.join(COLUMNS)}) VALUES ({placeholders})", records
+                    )
+            if opened:
+                # A new day's partition; older ones may have aged out of the retention window
+                self._compact_expired()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until queued records are on disk; False on timeout"""
+        return self._writer.flush(timeout)
+
+    def close(self):
+        """Write queued records and close the partitions"""
+        self._writer.close()
+        with self._lock:
+            for conn in self._writers.values():
+                conn.close()
+            self._writers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._writer.stats()
+
+    # Reading
+
+    def _partition_path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{PARTITION_PREFIX}{day}{PARTITION_SUFFIX}")
+
+    def partitions(self) -> List[str]:
+        """Partition days on disk, oldest first"""
+        paths = glob.glob(os.path.join(self.directory, f"{PARTITION_PREFIX}*{PARTITION_SUFFIX}"))
+        return sorted(os.path.basename(path)[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)]
+                      for path in paths)
+
+    def _partitions_between(self, since: Optional[float], until: Optional[float]) -> List[str]:
+        first = _day(since) if since is not None else None
+        last = _day(until) if until is not None else None
+        return [day for day in self.partitions()
+                if (first is None or day >= first) and (last is None or day <= last)]
+
+    @staticmethod
+    def _where(since: Optional[float], until: Optional[float], strategy: Optional[str],
+               intent: Optional[str], status: Optional[str] = None) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for clause, value in (("timestamp >= ?", since), ("timestamp < ?", until),
+                              ("strategy = ?", strategy), ("intent = ?", intent),
+                              ("status = ?", status)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select(self, columns: str, since: Optional[float], until: Optional[float],
+                strategy: Optional[str], intent: Optional[str], status: Optional[str] = None,
+                order: str = "", newest_first: bool = False) -> Iterator[Tuple]:
+        where, params = self._where(since, until, strategy, intent, status)
+        days = self._partitions_between(since, until)
+        for day in (reversed(days) if newest_first else days):
+            conn = sqlite3.connect(f"file:{self._partition_path(day)}?mode=ro", uri=True, timeout=30)
+            try:
+                yield from conn.execute(f"SELECT {columns} FROM queries{where}{order}", params)
+            except sqlite3.OperationalError:
+                # A partition created but not yet initialized by the writer
+                continue
+            finally:
+                conn.close()
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              strategy: Optional[str] = None, intent: Optional[str] = None,
+              limit: Optional[int] = None, newest_first: bool = False) -> List[Dict[str, Any]]:
+        """Raw records (not yet compacted) matching the filters"""
+        order = " ORDER BY timestamp DESC" if newest_first else " ORDER BY timestamp"
+        records = []
+        for row in self._select(", ".join(COLUMNS), since, until, strategy, intent,
+                                order=order, newest_first=newest_first):
+            record = dict(zip(COLUMNS, row))
+            record['stages'] = json.loads(record['stages'] or '{}')
+            records.append(record)
+            if limit is not None and len(records) >= limit:
+                break
+        return records
+
+    def to_store(self, since: Optional[float] = None, until: Optional[float] = None,
+                 strategy: Optional[str] = None, intent: Optional[str] = None,
+                 limit: Optional[int] = None) -> PerformanceStore:
+        """Completed raw records as a columnar PerformanceStore (oldest first)"""
+        store = PerformanceStore()
+        rows = []
+        for row in self._select("timestamp, query, strategy, response_time, tokens_used, num_sources, intent",
+                                since, until, strategy, intent, status='completed',
+                                order=" ORDER BY timestamp DESC", newest_first=True):
+            rows.append(row)
+            if limit is not None and len(rows) >= limit:
+                break
+
+        for timestamp, query, name, response_time, tokens, sources, query_intent in reversed(rows):
+            store.append(query, name, response_time, tokens, sources, {'query_intent': query_intent},
+                         timestamp=datetime.fromtimestamp(timestamp))
+        return store
+
+    def summarize(self, since: Optional[float] = None, until: Optional[float] = None,
+                  strategy: Optional[str] = None, intent: Optional[str] = None,
+                  by: str = 'strategy') -> Dict[str, Dict[str, Any]]:
+        """Per-group stats over raw records and rollups
+
+        Groups by 'strategy' or 'intent'. Each group has 'stats' (MetricStats
+        over completed queries) and 'errors'. Rollups count whole hours, so
+        a range that starts inside a compacted hour includes all of it.
+        """
+        if by not in ('strategy', 'intent'):
+            raise ValueError(f"Cannot group by {by!r}")
+
+        groups: Dict[str, Dict[str, Any]] = {}
+
+        def group(name):
+            if name not in groups:
+                groups[name] = {'stats': MetricStats(), 'errors': 0}
+            return groups[name]
+
+        for name, status, timestamp, response_time, tokens, sources in self._select(
+                f"{by}, status, timestamp, response_time, tokens_used, num_sources",
+                since, until, strategy, intent):
+            if status == 'completed':
+                group(name)['stats'].add(response_time, tokens, sources, timestamp)
+            else:
+                group(name)['errors'] += 1
+
+        for hour, row_strategy, row_intent, errors, stats in self._rollups(since, until, strategy, intent):
+            entry = group(row_strategy if by == 'strategy' else row_intent)
+            entry['stats'].merge(stats)
+            entry['errors'] += errors
+
+        return groups
+
+    def timeseries(self, since: Optional[float] = None, bucket_seconds: int = 3600,
+                   strategy: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One row per (time bucket, strategy), oldest first"""
+        buckets: Dict[Tuple[float, str], MetricStats] = {}
+
+        def bucket(start, name):
+            key = (start, name)
+            if key not in buckets:
+                buckets[key] = MetricStats()
+            return buckets[key]
+
+        for name, timestamp, response_time, tokens, sources in self._select(
+                "strategy, timestamp, response_time, tokens_used, num_sources",
+                since, None, strategy, None, status='completed'):
+            start = timestamp // bucket_seconds * bucket_seconds
+            bucket(start, name).add(response_time, tokens, sources, timestamp)
+
+        for hour, name, _, _, stats in self._rollups(since, None, strategy, None):
+            bucket(hour // bucket_seconds * bucket_seconds, name).merge(stats)
+
+        return [{
+            'bucket_start': start,
+            'strategy': name,
+            'count': stats.count,
+            'avg_response_time': stats.mean_response_time,
+            'p95_response_time': stats.response_times.quantile(0.95),
+            'tokens_used': stats.tokens_sum,
+        } for (start, name), stats in sorted(buckets.items())]
+
+    # Compaction
+
+    def _rollups(self, since: Optional[float], until: Optional[float], strategy: Optional[str],
+                 intent: Optional[str]) -> Iterator[Tuple[float, str, str, int, MetricStats]]:
+        path = os.path.join(self.directory, ROLLUP_FILE)
+        if not os.path.exists(path):
+            return
+        clauses, params = [], []
+        for clause, value in (("hour >= ?", None if since is None else since // 3600 * 3600),
+                              ("hour < ?", until), ("strategy = ?", strategy), ("intent = ?", intent)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        try:
+            for hour, row_strategy, row_intent, errors, stats in conn.execute(
+                    f"SELECT hour, strategy, intent, errors, stats FROM hourly{where}", params):
+                yield hour, row_strategy, row_intent, errors, MetricStats.from_dict(json.loads(stats))
+        finally:
+            conn.close()
+
+    def compact(self, older_than_days: Optional[int] = None) -> List[str]:
+        """Roll partitions older than the retention window into hourly rollups
+
+        Returns the days that were compacted. Today's partition is never
+        compacted, since the writer may still be appending to it.
+        """
+        older_than_days = self.raw_retention_days if older_than_days is None else older_than_days
+        self.flush()
+        with self._lock:
+            return self._compact_older_than(older_than_days)
+
+    def _compact_expired(self):
+        """Compact partitions past the retention window, logging rather than raising; hold the lock"""
+        try:
+            self._compact_older_than(self.raw_retention_days)
+        except Exception as e:
+            logger.warning(f"Error compacting the performance log: {str(e)}")
+
+    def _compact_older_than(self, older_than_days: int) -> List[str]:
+        cutoff = _day(time.time() - older_than_days * 86400)
+        expired = [day for day in self.partitions() if day < cutoff]
+        if not expired:
+            return []
+
+        rollups = _connect(os.path.join(self.directory, ROLLUP_FILE), ROLLUP_SCHEMA)
+        try:
+            for day in expired:
+                self._compact_partition(day, rollups)
+        finally:
+            rollups.close()
+        return expired
+
+    def _compact_partition(self, day: str, rollups: sqlite3.Connection):
+        hourly: Dict[Tuple[float, str, str], Dict[str, Any]] = {}
+        path = self._partition_path(day)
+        conn = self._writers.pop(day, None) or sqlite3.connect(path, timeout=30)
+        try:
+            for timestamp, strategy, intent, status, response_time, tokens, sources in conn.execute(
+                    "SELECT timestamp, strategy, intent, status, response_time, tokens_used, num_sources "
+                    "FROM queries"):
+                key = (timestamp // 3600 * 3600, strategy, intent)
+                entry = hourly.setdefault(key, {'stats': MetricStats(), 'errors': 0})
+                if status == 'completed':
+                    entry['stats'].add(response_time, tokens, sources, timestamp)
+                else:
+                    entry['errors'] += 1
+        finally:
+            conn.close()
+
+        with rollups:
+            for (hour, strategy, intent), entry in hourly.items():
+                existing = rollups.execute(
+                    "SELECT errors, stats FROM hourly WHERE hour = ? AND strategy = ? AND intent = ?",
+                    (hour, strategy, intent)
+                ).fetchone()
+                if existing is not None:
+                    entry['errors'] += existing[0]
+                    entry['stats'].merge(MetricStats.from_dict(json.loads(existing[1])))
+                rollups.execute(
+                    "INSERT OR REPLACE INTO hourly (hour, strategy, intent, errors, stats) VALUES (?, ?, ?, ?, ?)",
+                    (hour, strategy, intent, entry['errors'], json.dumps(entry['stats'].to_dict()))
+                )
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        logger.info(f"Compacted performance log partition {day} into {len(hourly)} hourly rollups")
+
+    def clear(self):
+        """Delete every partition and rollup"""
+        self.flush()
+        with self._lock:
+            for conn in self._writers.values():
+                conn.close()
+            self._writers.clear()
+            for path in glob.glob(os.path.join(self.directory, "*.sqlite3*")):
+                os.remove(path)
@@ -0,0 +1,219 @@
+"""Columnar, array-backed storage for per-query performance records
+
+Each field is a preallocated NumPy column that grows by doubling, so an
+append is a handful of scalar writes rather than a new dict. With max_rows
+set, the store keeps exactly the last max_rows rows: they are a window
+sliding over a buffer twice that long, moved back to the front once it
+reaches the end, so every column stays one contiguous view. Strategies are
+stored as small integer codes into a category list, and configs are interned:
+identical configs (by their canonical JSON) share one id and one stored dict.
+
+Filters by strategy and time range are vectorized boolean masks. Exports hand
+the columns (or views of them) to pandas and Arrow without copying numeric
+data; only the query strings, which live in an object column, are converted.
+"""
+import json
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# Config keys flattened into their own columns on export
+CONFIG_COLUMNS = ('chunk_size', 'chunk_overlap', 'top_k', 'retrieval_method')
+
+class PerformanceStore:
+    """Append-only table of query performance with NumPy columns"""
+
+    NUMERIC_COLUMNS = {
+        'timestamp': 'datetime64[us]',
+        'strategy': np.int16,
+        'response_time': np.float64,
+        'tokens_used': np.int64,
+        'num_sources': np.int32,
+        'config_id': np.int32,
+        'response_quality_score': np.float64,
+    }
+
+    def __init__(self, capacity: int = 1024, max_rows: Optional[int] = None):
+        self.max_rows = max_rows
+        self.strategies: List[str] = []
+        self._strategy_codes: Dict[str, int] = {}
+        self.configs: List[Dict[str, Any]] = []
+        self._config_ids: Dict[str, int] = {}
+        self._start = 0
+        self._size = 0
+        self._allocate(min(capacity, max_rows) if max_rows else capacity)
+
+    def _allocate(self, capacity: int):
+        self._columns = {name: np.empty(capacity, dtype=dtype)
+                         for name, dtype in self.NUMERIC_COLUMNS.items()}
+        self._columns['query'] = np.empty(capacity, dtype=object)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _grow(self):
+        capacity = len(self._columns['query'])
+        if not self.max_rows or capacity < 2 * self.max_rows:
+            capacity *= 2
+            if self.max_rows:
+                capacity = min(capacity, 2 * self.max_rows)
+
+        # Move the live rows to the front, into a larger buffer until the cap
+        live = slice(self._start, self._start + self._size)
+        for name, column in self._columns.items():
+            moved = column if len(column) == capacity else np.empty(capacity, dtype=column.dtype)
+            moved[:self._size] = column[live]
+            self._columns[name] = moved
+        self._columns['query'][self._size:] = None
+        self._start = 0
+
+    def _strategy_code(self, strategy: str) -> int:
+        code = self._strategy_codes.get(strategy)
+        if code is None:
+            code = self._strategy_codes[strategy] = len(self.strategies)
+            self.strategies.append(strategy)
+        return code
+
+    def _config_id(self, config: Dict[str, Any]) -> int:
+        key = json.dumps(config, sort_keys=True, default=str)
+        config_id = self._config_ids.get(key)
+        if config_id is None:
+            config_id = self._config_ids[key] = len(self.configs)
+            self.configs.append(dict(config))
+        return config_id
+
+    def append(self, query: str, strategy: str, response_time: float, tokens_used: int,
+               num_sources: int, config: Optional[Dict[str, Any]] = None,
+               timestamp: Optional[datetime] = None,
+               response_quality_score: Optional[float] = None):
+        if self.max_rows and self._size == self.max_rows:
+            # The oldest row drops out; the window slides forward over the buffer
+            self._columns['query'][self._start] = None
+            self._start += 1
+            self._size -= 1
+        if self._start + self._size == len(self._columns['query']):
+            self._grow()
+
+        i = self._start + self._size
+        columns = self._columns
+        columns['timestamp'][i] = np.datetime64(timestamp or datetime.now(), 'us')
+        columns['strategy'][i] = self._strategy_code(strategy)
+        columns['response_time'][i] = response_time
+        columns['tokens_used'][i] = tokens_used
+        columns['num_sources'][i] = num_sources
+        columns['config_id'][i] = self._config_id(config or {})
+        columns['response_quality_score'][i] = np.nan if response_quality_score is None else response_quality_score
+        columns['query'][i] = query
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """View of a column's filled rows (no copy)"""
+        return self._columns[name][self._start:self._start + self._size]
+
+    def mask(self, strategy: Optional[str] = None, since: Optional[datetime] = None,
+             until: Optional[datetime] = None) -> np.ndarray:
+        """Boolean row mask for a strategy and/or time range"""
+        selected = np.ones(self._size, dtype=bool)
+        if strategy is not None:
+            code = self._strategy_codes.get(strategy)
+            if code is None:
+                return np.zeros(self._size, dtype=bool)
+            selected &= self.column('strategy') == code
+        if since is not None:
+            selected &= self.column('timestamp') > np.datetime64(since, 'us')
+        if until is not None:
+            selected &= self.column('timestamp') <= np.datetime64(until, 'us')
+        return selected
+
+    def rows(self, indices) -> List[Dict[str, Any]]:
+        """Materialize selected rows as dicts (for small, per-query views)"""
+        records = []
+        columns = {name: self.column(name) for name in self._columns}
+        for i in np.asarray(indices, dtype=np.intp):
+            records.append({
+                'timestamp': columns['timestamp'][i].astype(datetime),
+                'query': columns['query'][i],
+                'strategy': self.strategies[columns['strategy'][i]],
+                'response_time': float(columns['response_time'][i]),
+                'tokens_used': int(columns['tokens_used'][i]),
+                'num_sources': int(columns['num_sources'][i]),
+                'config': self.configs[columns['config_id'][i]],
+                'response_quality_score': (None if np.isnan(columns['response_quality_score'][i])
+                                           else float(columns['response_quality_score'][i])),
+            })
+        return records
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """The last `limit` rows, newest first"""
+        return self.rows(np.arange(self._size - 1, max(self._size - limit, 0) - 1, -1))
+
+    def slowest(self, limit: int) -> List[Dict[str, Any]]:
+        """The `limit` slowest rows, slowest first"""
+        response_times = self.column('response_time')
+        limit = min(limit, self._size)
+        if limit == 0:
+            return []
+        top = np.argpartition(response_times, self._size - limit)[self._size - limit:]
+        return self.rows(top[np.argsort(response_times[top])[::-1]])
+
+    def _config_column(self, key: str, selected: Optional[np.ndarray] = None) -> np.ndarray:
+        values = np.array([config.get(key) for config in self.configs] or [None], dtype=object)
+        config_ids = self.column('config_id')
+        return values[config_ids if selected is None else config_ids[selected]]
+
+    def to_pandas(self, selected: Optional[np.ndarray] = None) -> "pd.DataFrame":
+        """DataFrame over the columns; unfiltered exports share their memory"""
+        import pandas as pd
+
+        def take(name):
+            column = self.column(name)
+            return column if selected is None else column[selected]
+
+        codes = take('strategy')
+        data = {
+            'timestamp': take('timestamp'),
+            'query': take('query'),
+            'strategy': pd.Categorical.from_codes(codes, categories=self.strategies)
+                        if self.strategies else pd.Categorical([]),
+            'response_time': take('response_time'),
+            'tokens_used': take('tokens_used'),
+            'num_sources': take('num_sources'),
+        }
+        for key in CONFIG_COLUMNS:
+            data[key] = self._config_column(key, selected)
+        data['response_quality_score'] = take('response_quality_score')
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self, selected: Optional[np.ndarray] = None) -> "pa.Table":
+        """Arrow table; numeric columns wrap the NumPy buffers without copying"""
+        import pyarrow as pa
+
+        def take(name):
+            column = self.column(name)
+            return column if selected is None else column[selected]
+
+        codes = take('strategy')
+        return pa.table({
+            'timestamp': pa.array(take('timestamp')),
+            'query': pa.array(take('query'), type=pa.string()),
+            'strategy': pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(self.strategies, type=pa.string())),
+            'response_time': pa.array(take('response_time')),
+            'tokens_used': pa.array(take('tokens_used')),
+            'num_sources': pa.array(take('num_sources')),
+            'config_id': pa.array(take('config_id')),
+            'response_quality_score': pa.array(take('response_quality_score'), from_pandas=True),
+        })
+
+    def clear(self):
+        self.strategies.clear()
+        self._strategy_codes.clear()
+        self.configs.clear()
+        self._config_ids.clear()
+        self._start = 0
+        self._size = 0
+        self._allocate(len(self._columns['query']))
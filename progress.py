@@ -0,0 +1,80 @@
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("samsara_rag")
+
+class ProgressCallback:
+    """Receives progress updates from long-running engine operations
+
+    The engine, vector store and scraper report through this instead of
+    calling Streamlit directly, so they can run in any process. The base
+    implementation logs messages; subclasses render or forward them.
+    """
+
+    def emit(self, level: str, message: str):
+        """Handle a message; level is one of info, write, success, warning, error"""
+        log_level = {
+            'warning': logging.WARNING,
+            'error': logging.ERROR
+        }.get(level, logging.INFO)
+        logger.log(log_level, message)
+
+    def info(self, message: str):
+        self.emit('info', message)
+
+    def write(self, message: str):
+        self.emit('write', message)
+
+    def success(self, message: str):
+        self.emit('success', message)
+
+    def warning(self, message: str):
+        self.emit('warning', message)
+
+    def error(self, message: str):
+        self.emit('error', message)
+
+    def progress(self, fraction: float):
+        """Report completion of the current operation as a fraction in [0, 1]"""
+        pass
+
+class EventProgress(ProgressCallback):
+    """Forwards progress as event dicts to a sink (e.g. an HTTP stream)"""
+
+    def __init__(self, sink: Callable[[Dict[str, Any]], None]):
+        self.sink = sink
+
+    def emit(self, level: str, message: str):
+        self.sink({'event': 'progress', 'level': level, 'message': message})
+
+    def progress(self, fraction: float):
+        self.sink({'event': 'progress', 'level': 'progress', 'fraction': fraction})
+
+class StreamlitProgress(ProgressCallback):
+    """Renders progress in the current Streamlit container"""
+
+    def __init__(self):
+        self._progress_bar = None
+
+    def emit(self, level: str, message: str):
+        import streamlit as st
+
+        render = {
+            'info': st.info,
+            'write': st.write,
+            'success': st.success,
+            'warning': st.warning,
+            'error': st.error
+        }.get(level, st.write)
+        render(message)
+
+    def progress(self, fraction: float):
+        import streamlit as st
+
+        if self._progress_bar is None:
+            self._progress_bar = st.progress(0)
+        self._progress_bar.progress(min(max(fraction, 0.0), 1.0))
+
+def get_progress(progress: Optional[ProgressCallback]) -> ProgressCallback:
+    """Fall back to the logging callback when none is given"""
+    return progress if progress is not None else ProgressCallback()
@@ -0,0 +1,207 @@
+"""Quantized first-stage vector search with exact rescoring
+
+Only compact codes are held in memory: int8 scalar codes (one byte per
+dimension, with a per-dimension scale) or binary codes (one bit per
+dimension, compared by Hamming distance). A query scores every code, keeps a
+shortlist of `rescore` x k candidates, and reranks them by exact cosine
+against the full-precision vectors, which stay on disk in a memory-mapped
+float32 file; only the shortlisted rows are ever paged in.
+
+Files in the index directory:
+
+    meta.json     ids, quantization, dimensions and the current build
+    <build>/      one directory per build, holding
+        vectors.f32   normalized float32 rows, memory-mapped for rescoring
+        codes.npy     int8 codes, or bit-packed uint8 codes for binary
+        scales.npy    per-dimension int8 scales (int8 only)
+
+A rebuild writes a new build directory and then replaces meta.json, so an
+index opened earlier (here or in another process) keeps reading the files
+it opened, never a file truncated or half rewritten under its mapping.
+Older build directories are unlinked, which leaves open mappings intact.
+
+With no directory the index lives in memory only, full vectors included.
+"""
+import os
+import json
+import uuid
+import shutil
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ('int8', 'binary')
+
+# Shortlist size as a multiple of k, per quantization: one bit per
+# dimension loses more ordering than one byte, so binary rescores more
+DEFAULT_RESCORE = {'int8': 4, 'binary': 10}
+
+# Rows scored per block, bounding the float32 working set of a query batch
+BLOCK_ROWS = 65536
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def normalize(vectors: Any) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def bytes_per_vector(dimensions: int, quantization: str) -> int:
+    """Resident bytes per indexed vector (codes only; full vectors stay on disk)"""
+    if quantization == 'binary':
+        return (dimensions + 7) // 8
+    return dimensions
+
+class QuantizedIndex:
+    """Vectors searched by quantized codes and reranked at full precision"""
+
+    def __init__(self, directory: Optional[str], quantization: str = 'int8', rescore: Optional[int] = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore = rescore or DEFAULT_RESCORE[quantization]
+        self.ids: List[str] = []
+        self._rows = {}
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.vectors: Optional[np.ndarray] = None
+        self._build: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimensions(self) -> int:
+        return 0 if self.vectors is None else self.vectors.shape[1]
+
+    def _path(self, name: str, build: Optional[str] = None) -> str:
+        """A file in the index directory, or in one of its build directories"""
+        return os.path.join(self.directory, build, name) if build else os.path.join(self.directory, name)
+
+    def build(self, ids: Sequence[str], embeddings: Any):
+        """Replace the index contents with these vectors"""
+        vectors = normalize(embeddings) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+        if self.quantization == 'int8':
+            scales = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1], np.float32)
+            scales[scales == 0] = 1.0
+            self.scales = scales.astype(np.float32)
+            self.codes = np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+        else:
+            self.codes = np.packbits(vectors > 0, axis=1)
+        self.ids = list(ids)
+        if self.directory is None:
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self.vectors = vectors
+            return self
+
+        build = f"build-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self._path("", build), exist_ok=True)
+        vectors.tofile(self._path("vectors.f32", build))
+        if self.quantization == 'int8':
+            np.save(self._path("scales.npy", build), self.scales)
+        np.save(self._path("codes.npy", build), self.codes)
+        with open(self._path("meta.json.tmp"), 'w', encoding='utf-8') as f:
+            json.dump({'quantization': self.quantization, 'dimensions': int(vectors.shape[1]),
+                       'build': build, 'ids': self.ids}, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+        self._build = build
+        self._open_vectors(vectors.shape[1])
+
+        for name in os.listdir(self.directory):
+            if name.startswith("build-") and name != build:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+        return self
+
+    def load(self) -> bool:
+        """Open a previously built index; False when there is none (or it used another quantization)"""
+        if self.directory is None:
+            return False
+        try:
+            with open(self._path("meta.json"), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('quantization') != self.quantization:
+            return False
+
+        # A rebuild may remove this build's files once it has replaced meta.json
+        try:
+            self._build = meta.get('build')
+            self.ids = meta['ids']
+            self.codes = np.load(self._path("codes.npy", self._build))
+            if self.quantization == 'int8':
+                self.scales = np.load(self._path("scales.npy", self._build))
+            self._open_vectors(meta['dimensions'])
+        except OSError:
+            self.ids, self._rows, self.codes, self.scales, self.vectors = [], {}, None, None, None
+            return False
+        return True
+
+    def _open_vectors(self, dimensions: int):
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        if self.ids and dimensions:
+            self.vectors = np.memmap(self._path("vectors.f32", self._build), dtype=np.float32, mode='r',
+                                     shape=(len(self.ids), dimensions))
+        else:
+            self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+
+    def rows_for(self, ids: Sequence[str]) -> np.ndarray:
+        """Row numbers of the given ids (unknown ids are skipped)"""
+        return np.fromiter((self._rows[doc_id] for doc_id in ids if doc_id in self._rows), dtype=np.intp)
+
+    def memory_bytes(self) -> int:
+        """Bytes held in RAM: the codes and scales"""
+        return (0 if self.codes is None else self.codes.nbytes) + (0 if self.scales is None else self.scales.nbytes)
+
+    def _approximate_scores(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """(queries, candidates) first-stage scores; higher is closer"""
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        if self.quantization == 'int8':
+            # Dot products with the scale folded into the query
+            scaled = (queries * self.scales).T
+            for start in range(0, len(codes), BLOCK_ROWS):
+                block = codes[start:start + BLOCK_ROWS]
+                scores[:, start:start + len(block)] = (block.astype(np.float32) @ scaled).T
+        else:
+            query_bits = np.packbits(queries > 0, axis=1)
+            for i, bits in enumerate(query_bits):
+                for start in range(0, len(codes), BLOCK_ROWS):
+                    block = codes[start:start + BLOCK_ROWS]
+                    distances = _POPCOUNT[np.bitwise_xor(block, bits)].sum(axis=1, dtype=np.int32)
+                    scores[i, start:start + len(block)] = -distances
+        return scores
+
+    def search(self, query_embeddings: Any, k: int,
+               rows: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+        """Top-k (id, cosine similarity) per query, optionally among the given rows only"""
+        queries = normalize(query_embeddings)
+        candidates = len(self.ids) if rows is None else len(rows)
+        if candidates == 0 or k <= 0:
+            return [[] for _ in queries]
+
+        k = min(k, candidates)
+        shortlist = min(candidates, k * self.rescore)
+        approximate = self._approximate_scores(queries, rows)
+
+        results = []
+        for query, scores in zip(queries, approximate):
+            top = np.argpartition(-scores, shortlist - 1)[:shortlist] if shortlist < candidates \
+                else np.arange(candidates)
+            top_rows = np.sort(top if rows is None else rows[top])
+            # Exact rescoring reads only the shortlisted rows from disk
+            exact = self.vectors[top_rows] @ query
+            order = np.argsort(-exact)[:k]
+            results.append([(self.ids[top_rows[i]], float(exact[i])) for i in order])
+        return results
+
+def exact_search(vectors: np.ndarray, query_embeddings: Any, k: int) -> List[List[int]]:
+    """Brute-force top-k rows by cosine similarity, for recall ground truth"""
+    scores = normalize(query_embeddings) @ normalize(vectors).T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [list(row[np.argsort(-score[row])]) for row, score in zip(top, scores)]
@@ -1,20 +1,20 @@
-import os
 import json
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from openai import OpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-import streamlit as st
+from langchain_core.documents import Document
 
 from vector_store import VectorStore
 from observability import ObservabilityTracker
+from progress import ProgressCallback, get_progress
+from tracing import span
+from llm_backend import LLMBackend, LLMResponse, create_llm_backend
 
 @dataclass
 class RAGConfig:
@@ -34,26 +34,43 @@ class RAGConfig:
     use_adaptive_retrieval: bool = True
     query_intent: Optional[str] = None
 
+class PrefetchedSearch:
+    """Serves one question's searches from batched results
+    
+    Looks like the VectorStore search API to the retrieval strategies.
+    Results are keyed by search depth, so a strategy gets exactly what the
+    equivalent single search would return; anything that was not
+    prefetched falls through to the real store.
+    """
+    
+    def __init__(self, vector_store: VectorStore, question: str,
+                 semantic: Dict[int, List[Document]], keyword: Dict[int, List[Document]]):
+        self.vector_store = vector_store
+        self.question = question
+        self.semantic = semantic
+        self.keyword = keyword
+    
+    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
+        if query == self.question and k in self.semantic:
+            return self.semantic[k]
+        return self.vector_store.similarity_search(query, k=k)
+    
+    def keyword_search(self, query: str, k: int = 5) -> List[Document]:
+        if query == self.question and k in self.keyword:
+            return self.keyword[k]
+        return self.vector_store.keyword_search(query, k=k)
+
 class RAGEngine:
     """RAG engine with multiple retrieval strategies"""
     
-    def __init__(self, vector_store: VectorStore, obs_tracker: ObservabilityTracker):
+    def __init__(self, vector_store: VectorStore, obs_tracker: ObservabilityTracker,
+                 llm: Optional[LLMBackend] = None):
         self.vector_store = vector_store
         self.obs_tracker = obs_tracker
         
-        # Initialize OpenAI client
-        # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
-        # do not change this unless explicitly requested by the user
-        self.openai_client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY", "default_key")
-        )
+        # LLM backend: OpenAI by default, or the simulated one (RAG_LLM_BACKEND=simulated)
+        self.llm = llm or create_llm_backend()
         
-        # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
     
     def _classify_query_intent(self, question: str) -> str:
         """Classify query intent to determine optimal retrieval strategy
@@ -124,8 +141,8 @@ class RAGEngine:
             # Precision over recall
             return base_top_k
         
-    def query(self, question: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a query using the specified RAG configuration"""
+    def _build_rag_config(self, question: str, config: Dict[str, Any]) -> RAGConfig:
+        """Build the effective RAGConfig for a question from a config dict"""
         
         # Get base top_k from config
         base_top_k = config.get('top_k', 5)
@@ -135,7 +152,7 @@ class RAGEngine:
         adaptive_top_k = self._get_adaptive_top_k(question, base_top_k, use_adaptive)
         query_intent = self._classify_query_intent(question)
         
-        rag_config = RAGConfig(
+        return RAGConfig(
             strategy=config.get('strategy', 'naive'),
             chunk_size=config.get('chunk_size', 1000),
             chunk_overlap=config.get('chunk_overlap', 200),
@@ -149,12 +166,10 @@ class RAGEngine:
             use_adaptive_retrieval=use_adaptive,
             query_intent=query_intent
         )
-        
-        # Start tracking this query
-        trace_id = self.obs_tracker.start_trace(question, rag_config.__dict__)
-        
-        try:
-            # Retrieve relevant documents based on strategy
+    
+    def _retrieve(self, question: str, rag_config: RAGConfig, progress: ProgressCallback) -> List[Document]:
+        """Retrieve relevant documents based on strategy"""
+        with span('retrieval', strategy=rag_config.strategy, top_k=rag_config.top_k) as stage:
             if rag_config.strategy == "naive":
                 documents = self._naive_retrieval(question, rag_config)
             elif rag_config.strategy == "parent_document":
@@ -162,15 +177,39 @@ class RAGEngine:
             elif rag_config.strategy == "hybrid":
                 documents = self._hybrid_retrieval(question, rag_config)
             elif rag_config.strategy == "agentic":
-                documents = self._agentic_retrieval(question, rag_config)
+                documents = self._agentic_retrieval(question, rag_config, progress)
             else:
                 documents = self._naive_retrieval(question, rag_config)
-            
-            # Generate response
-            response = self._generate_response(question, documents, rag_config)
+            stage.set(documents=len(documents))
+            if stage.detailed:
+                stage.set(result_chars=sum(len(doc.page_content) for doc in documents))
+        return documents
+    
+    def retrieve(self, question: str, config: Dict[str, Any],
+                 progress: Optional[ProgressCallback] = None) -> List[Document]:
+        """Retrieve documents for a question without generating an answer"""
+        rag_config = self._build_rag_config(question, config)
+        return self._retrieve(question, rag_config, get_progress(progress))
+    
+    def query(self, question: str, config: Dict[str, Any],
+              progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Process a query using the specified RAG configuration"""
+        progress = get_progress(progress)
+        rag_config = self._build_rag_config(question, config)
+        
+        # Start tracking this query
+        trace_id = self.obs_tracker.start_trace(question, rag_config.__dict__)
+        
+        try:
+            with self.obs_tracker.activate(trace_id):
+                documents = self._retrieve(question, rag_config, progress)
+                
+                # Generate response
+                response = self._generate_response(question, documents, rag_config, progress)
             
             # End tracking
             self.obs_tracker.end_trace(trace_id, response, len(documents))
+            response['trace_id'] = trace_id
             
             return response
             
@@ -178,82 +217,275 @@ class RAGEngine:
             self.obs_tracker.log_error(trace_id, str(e))
             raise e
     
-    def _naive_retrieval(self, question: str, config: RAGConfig) -> List[Document]:
+    def query_stream(self, question: str, config: Dict[str, Any],
+                     progress: Optional[ProgressCallback] = None) -> Iterator[Dict[str, Any]]:
+        """Process a query and stream the answer as events
+        
+        Yields a 'sources' event once retrieval is done, then 'token' events
+        with answer text as it is generated, then a final 'done' event carrying
+        the same fields as the dict returned by query().
+        """
+        progress = get_progress(progress)
+        rag_config = self._build_rag_config(question, config)
+        
+        trace_id = self.obs_tracker.start_trace(question, rag_config.__dict__)
+        
+        try:
+            # Spans cannot stay active across yields (the caller shares this
+            # context), so only retrieval runs under the trace; generation
+            # stages are recorded by _generate_response_stream
+            with self.obs_tracker.activate(trace_id):
+                documents = self._retrieve(question, rag_config, progress)
+            sources = [doc.metadata.get('source', 'Unknown') for doc in documents]
+            yield {'event': 'sources', 'sources': sources, 'trace_id': trace_id}
+            
+            response = None
+            for event in self._generate_response_stream(question, documents, rag_config, progress, trace_id):
+                if event['event'] == 'done':
+                    response = event
+                yield event
+            
+            self.obs_tracker.end_trace(trace_id, response or {}, len(documents))
+            
+        except GeneratorExit:
+            # The consumer stopped reading; close the trace so it is not left in flight
+            self.obs_tracker.log_error(trace_id, "Stream closed before completion")
+            raise
+        except Exception as e:
+            self.obs_tracker.log_error(trace_id, str(e))
+            raise e
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get knowledge base and query statistics"""
+        return {
+            'vector_store': self.vector_store.get_stats(),
+            'queries': self.obs_tracker.get_metrics_summary()
+        }
+    
+    def _store_for(self, config: RAGConfig):
+        """Search API over the collection chunked closest to the config's chunk_size/overlap"""
+        return self.vector_store.for_granularity(config.chunk_size, config.chunk_overlap)
+    
+    def _naive_retrieval(self, question: str, config: RAGConfig, search=None) -> List[Document]:
         """Simple semantic similarity retrieval"""
+        search = search or self._store_for(config)
         
         if config.retrieval_method == "semantic":
-            results = self.vector_store.similarity_search(question, k=config.top_k)
+            results = search.similarity_search(question, k=config.top_k)
         elif config.retrieval_method == "keyword":
-            results = self.vector_store.keyword_search(question, k=config.top_k)
+            results = search.keyword_search(question, k=config.top_k)
         else:  # hybrid
             # Combine semantic and keyword search
-            semantic_results = self.vector_store.similarity_search(question, k=config.top_k//2)
-            keyword_results = self.vector_store.keyword_search(question, k=config.top_k//2)
+            semantic_results = search.similarity_search(question, k=config.top_k//2)
+            keyword_results = search.keyword_search(question, k=config.top_k//2)
             
             # Merge and deduplicate
             all_results = semantic_results + keyword_results
-            seen_content = set()
-            results = []
-            for doc in all_results:
-                if doc.page_content not in seen_content:
-                    results.append(doc)
-                    seen_content.add(doc.page_content)
-                if len(results) >= config.top_k:
-                    break
+            with span('dedup', candidates=len(all_results)) as stage:
+                if stage.detailed:
+                    stage.set(candidate_chars=sum(len(doc.page_content) for doc in all_results))
+                seen_content = set()
+                results = []
+                for doc in all_results:
+                    if doc.page_content not in seen_content:
+                        results.append(doc)
+                        seen_content.add(doc.page_content)
+                    if len(results) >= config.top_k:
+                        break
+                stage.set(documents=len(results))
         
         return results
     
-    def _parent_document_retrieval(self, question: str, config: RAGConfig) -> List[Document]:
+    def _parent_document_retrieval(self, question: str, config: RAGConfig, search=None) -> List[Document]:
         """Parent document retrieval - find relevant chunks then return full documents"""
+        search = search or self._store_for(config)
         
         # First, get relevant chunks
-        chunk_results = self.vector_store.similarity_search(question, k=config.top_k * 2)
+        chunk_results = search.similarity_search(question, k=config.top_k * 2)
         
         # Get parent documents for these chunks
-        parent_docs = []
-        seen_sources = set()
-        
-        for chunk in chunk_results:
-            source = chunk.metadata.get('source', '')
-            if source and source not in seen_sources:
-                # Get the full document
-                full_doc = self.vector_store.get_full_document(source)
-                if full_doc:
-                    parent_docs.append(full_doc)
-                    seen_sources.add(source)
-                
-                if len(parent_docs) >= config.top_k:
-                    break
+        with span('parent_assembly', chunks=len(chunk_results)) as stage:
+            parent_docs = []
+            seen_sources = set()
+            
+            for chunk in chunk_results:
+                source = chunk.metadata.get('source', '')
+                if source and source not in seen_sources:
+                    # Get the full document
+                    full_doc = self.vector_store.get_full_document(source)
+                    if full_doc:
+                        parent_docs.append(full_doc)
+                        seen_sources.add(source)
+                    
+                    if len(parent_docs) >= config.top_k:
+                        break
+            
+            stage.set(documents=len(parent_docs))
+            if stage.detailed:
+                stage.set(result_chars=sum(len(doc.page_content) for doc in parent_docs))
         
         return parent_docs
     
-    def _hybrid_retrieval(self, question: str, config: RAGConfig) -> List[Document]:
+    def _hybrid_retrieval(self, question: str, config: RAGConfig, search=None) -> List[Document]:
         """Hybrid retrieval combining multiple strategies"""
         
         # Get results from both naive and parent document retrieval
-        naive_results = self._naive_retrieval(question, config)
-        parent_results = self._parent_document_retrieval(question, config)
+        naive_results = self._naive_retrieval(question, config, search)
+        parent_results = self._parent_document_retrieval(question, config, search)
         
         # Combine and rank results
         all_results = naive_results + parent_results
         
         # Simple deduplication based on content similarity
-        unique_results = []
-        for doc in all_results:
-            is_duplicate = False
-            for existing in unique_results:
-                if self._calculate_similarity(doc.page_content, existing.page_content) > 0.8:
-                    is_duplicate = True
+        with span('dedup', candidates=len(all_results)) as stage:
+            if stage.detailed:
+                stage.set(candidate_chars=sum(len(doc.page_content) for doc in all_results))
+            unique_results = []
+            for doc in all_results:
+                is_duplicate = False
+                for existing in unique_results:
+                    if self._calculate_similarity(doc.page_content, existing.page_content) > 0.8:
+                        is_duplicate = True
+                        break
+                
+                if not is_duplicate:
+                    unique_results.append(doc)
+                
+                if len(unique_results) >= config.top_k:
                     break
-            
-            if not is_duplicate:
-                unique_results.append(doc)
-            
-            if len(unique_results) >= config.top_k:
-                break
+            stage.set(documents=len(unique_results))
         
         return unique_results
     
+    def _search_depths(self, config: RAGConfig) -> Tuple[List[int], List[int]]:
+        """Which semantic and keyword search depths a strategy runs per question"""
+        if config.retrieval_method == "semantic":
+            naive = ([config.top_k], [])
+        elif config.retrieval_method == "keyword":
+            naive = ([], [config.top_k])
+        else:
+            naive = ([config.top_k // 2], [config.top_k // 2])
+        
+        if config.strategy == "parent_document":
+            return ([config.top_k * 2], [])
+        elif config.strategy == "hybrid":
+            return (naive[0] + [config.top_k * 2], naive[1])
+        return naive
+    
+    def _batched_search(self, questions: List[str], needs: Dict[int, List[int]],
+                        keyword: bool, store) -> Dict[int, Dict[int, List[Document]]]:
+        """Run every (question, depth) search with one embedding batch and one ANN call per depth"""
+        results = {i: {} for i in needs}
+        if not needs:
+            return results
+        
+        indices = sorted(needs)
+        texts = [questions[i] for i in indices]
+        if keyword:
+            embeddings = store.embed_keyword_queries(texts)
+            search = store.keyword_search_batch
+        else:
+            embeddings = store.embed_queries(texts)
+            search = store.similarity_search_batch
+        embedding_by_index = dict(zip(indices, embeddings))
+        
+        # Adaptive top_k gives only a handful of distinct depths per batch
+        for k in sorted({k for ks in needs.values() for k in ks}):
+            group = [i for i in indices if k in needs[i]]
+            batch = search(
+                [questions[i] for i in group], k=k,
+                query_embeddings=[embedding_by_index[i] for i in group]
+            )
+            for i, documents in zip(group, batch):
+                results[i][k] = documents
+        
+        return results
+    
+    def _retrieve_batch(self, questions: List[str], rag_configs: List[RAGConfig],
+                        progress: ProgressCallback) -> List[List[Document]]:
+        """Retrieve documents for many questions with batched embedding and ANN search"""
+        batchable = [config.strategy in ("naive", "parent_document", "hybrid") for config in rag_configs]
+        depths = [self._search_depths(config) for config in rag_configs]
+        stores = [self._store_for(config) for config in rag_configs]
+        
+        # Searches are batched per granularity, since each has its own collection
+        semantic, keyword = {}, {}
+        for store in {id(store): store for store in stores}.values():
+            group = [i for i in range(len(questions)) if stores[i] is store and batchable[i]]
+            semantic.update(self._batched_search(questions, {
+                i: [k for k in depths[i][0] if k > 0] for i in group if any(k > 0 for k in depths[i][0])
+            }, keyword=False, store=store))
+            keyword.update(self._batched_search(questions, {
+                i: [k for k in depths[i][1] if k > 0] for i in group if any(k > 0 for k in depths[i][1])
+            }, keyword=True, store=store))
+        
+        all_documents = []
+        for i, (question, config) in enumerate(zip(questions, rag_configs)):
+            if not batchable[i]:
+                # Agentic retrieval plans with the LLM step by step; run it as usual
+                all_documents.append(self._retrieve(question, config, progress))
+                continue
+            
+            search = PrefetchedSearch(stores[i], question,
+                                      semantic=semantic.get(i, {}), keyword=keyword.get(i, {}))
+            if config.strategy == "parent_document":
+                all_documents.append(self._parent_document_retrieval(question, config, search))
+            elif config.strategy == "hybrid":
+                all_documents.append(self._hybrid_retrieval(question, config, search))
+            else:
+                all_documents.append(self._naive_retrieval(question, config, search))
+        
+        return all_documents
+    
+    def query_batch(self, questions: List[str], config: Dict[str, Any], generate: bool = True,
+                    max_workers: int = 4,
+                    progress: Optional[ProgressCallback] = None) -> List[Dict[str, Any]]:
+        """Process many questions with batched retrieval, for offline evaluation
+        
+        Retrieval for all questions shares one embedding batch per search kind
+        and one ANN call per distinct search depth. With generate=True each result is the dict query()
+        returns, with answers generated on up to max_workers threads; with
+        generate=False results carry only the retrieved documents and sources.
+        """
+        progress = get_progress(progress)
+        rag_configs = [self._build_rag_config(question, config) for question in questions]
+        
+        if not generate:
+            return [
+                {
+                    'question': question,
+                    'documents': documents,
+                    'sources': [doc.metadata.get('source', 'Unknown') for doc in documents]
+                }
+                for question, documents in zip(questions, self._retrieve_batch(questions, rag_configs, progress))
+            ]
+        
+        trace_ids = [
+            self.obs_tracker.start_trace(question, rag_config.__dict__)
+            for question, rag_config in zip(questions, rag_configs)
+        ]
+        
+        try:
+            batch_documents = self._retrieve_batch(questions, rag_configs, progress)
+        except Exception as e:
+            for trace_id in trace_ids:
+                self.obs_tracker.log_error(trace_id, str(e))
+            raise e
+        
+        def answer(i: int) -> Dict[str, Any]:
+            try:
+                with self.obs_tracker.activate(trace_ids[i]):
+                    response = self._generate_response(questions[i], batch_documents[i], rag_configs[i], progress)
+                self.obs_tracker.end_trace(trace_ids[i], response, len(batch_documents[i]))
+                response['trace_id'] = trace_ids[i]
+                return response
+            except Exception as e:
+                self.obs_tracker.log_error(trace_ids[i], str(e))
+                raise e
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            return list(pool.map(answer, range(len(questions))))
+    
     def _calculate_similarity(self, text1: str, text2: str) -> float:
         """Simple similarity calculation based on word overlap"""
         words1 = set(text1.lower().split())
@@ -267,14 +499,18 @@ class RAGEngine:
         
         return len(intersection) / len(union)
     
-    def _agentic_retrieval(self, question: str, config: RAGConfig) -> List[Document]:
+    def _agentic_retrieval(self, question: str, config: RAGConfig,
+                           progress: Optional[ProgressCallback] = None) -> List[Document]:
         """Agentic RAG with multi-step reasoning and iterative retrieval"""
         
-        st.info("🤖 Agentic RAG: Analyzing query with intelligent reasoning...")
+        progress = get_progress(progress)
+        progress.info("🤖 Agentic RAG: Analyzing query with intelligent reasoning...")
+        store = self._store_for(config)
         
         # Step 1: Plan - Decompose the query
-        plan = self._agent_plan(question)
-        st.write(f"**Agent Plan:** {plan['reasoning']}")
+        with span('agent_plan'):
+            plan = self._agent_plan(question)
+        progress.write(f"**Agent Plan:** {plan['reasoning']}")
         
         # Initialize agent state
         all_documents = []
@@ -283,7 +519,7 @@ class RAGEngine:
         
         # Step 2: Iterative retrieval loop
         for step in range(config.max_agent_steps):
-            st.write(f"**Step {step + 1}/{config.max_agent_steps}**")
+            progress.write(f"**Step {step + 1}/{config.max_agent_steps}**")
             
             # Decide next action
             action = self._agent_decide_action(
@@ -294,16 +530,16 @@ class RAGEngine:
                 config
             )
             
-            st.write(f"  Action: {action['type']} - {action['reasoning']}")
+            progress.write(f"  Action: {action['type']} - {action['reasoning']}")
             
             # Execute action
             if action['type'] == 'retrieve_semantic':
-                docs = self.vector_store.similarity_search(
+                docs = store.similarity_search(
                     action.get('query', question), 
                     k=config.top_k
                 )
             elif action['type'] == 'retrieve_parent':
-                chunk_results = self.vector_store.similarity_search(action.get('query', question), k=config.top_k)
+                chunk_results = store.similarity_search(action.get('query', question), k=config.top_k)
                 docs = []
                 for chunk in chunk_results[:3]:
                     source = chunk.metadata.get('source', '')
@@ -312,10 +548,10 @@ class RAGEngine:
                         if full_doc:
                             docs.append(full_doc)
             elif action['type'] == 'stop':
-                st.write(f"  ✓ Agent decision: Sufficient information gathered")
+                progress.write(f"  ✓ Agent decision: Sufficient information gathered")
                 break
             else:
-                docs = self.vector_store.similarity_search(question, k=config.top_k)
+                docs = store.similarity_search(question, k=config.top_k)
             
             # Add unique documents
             for doc in docs:
@@ -334,16 +570,16 @@ class RAGEngine:
             
             # Check if we have enough confidence
             if action.get('confidence', 0) >= config.agent_confidence_threshold:
-                st.write(f"  ✓ Confidence threshold met ({action['confidence']:.2f})")
+                progress.write(f"  ✓ Confidence threshold met ({action['confidence']:.2f})")
                 break
         
         # Step 3: Reflection (optional)
         if config.enable_reflection and len(all_documents) > 0:
-            st.write("**Reflection:** Synthesizing multi-step findings...")
+            progress.write("**Reflection:** Synthesizing multi-step findings...")
             # Keep best documents based on relevance
             all_documents = all_documents[:config.top_k * 2]
         
-        st.success(f"🎯 Agentic RAG complete: Retrieved {len(all_documents)} unique documents across {len(agent_scratchpad)} reasoning steps")
+        progress.success(f"🎯 Agentic RAG complete: Retrieved {len(all_documents)} unique documents across {len(agent_scratchpad)} reasoning steps")
         
         return all_documents[:config.top_k * 2] if all_documents else self._naive_retrieval(question, config)
     
@@ -351,8 +587,7 @@ class RAGEngine:
         """Use LLM to create a retrieval plan"""
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-5",
+            response = self.llm.complete(
                 messages=[
                     {
                         "role": "system",
@@ -372,10 +607,10 @@ Provide:
 Respond in JSON format with: {{"complexity": "simple|complex", "sub_queries": [...], "reasoning": "...""}}"""
                     }
                 ],
-                max_completion_tokens=500
+                max_tokens=500
             )
             
-            plan_text = response.choices[0].message.content
+            plan_text = response.text
             
             # Try to parse JSON, fallback to text
             try:
@@ -440,40 +675,48 @@ Respond in JSON format with: {{"complexity": "simple|complex", "sub_queries": [.
                 "confidence": 0.6
             }
     
-    def _generate_response(self, question: str, documents: List[Document], config: RAGConfig) -> Dict[str, Any]:
-        """Generate response using OpenAI API"""
-        
-        # Prepare context from retrieved documents
-        context = self._prepare_context(documents)
-        
-        # Create prompt
-        prompt = self._create_prompt(question, context)
+    def _generate_response(self, question: str, documents: List[Document], config: RAGConfig,
+                           progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Generate response using the LLM backend"""
+        progress = get_progress(progress)
+        
+        with span('context_build', chunks=len(documents)) as stage:
+            # Prepare context from retrieved documents
+            context = self._prepare_context(documents)
+            
+            # Create prompt
+            prompt = self._create_prompt(question, context)
+            stage.set(prompt_chars=len(prompt))
+            if stage.detailed:
+                stage.set(context_chars=len(context))
         
         try:
-            # Generate response using OpenAI
+            # Generate response
             start_time = time.time()
             
-            response = self.openai_client.chat.completions.create(
-                model="gpt-5",  # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self._get_system_prompt()
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=config.temperature,
-                max_completion_tokens=config.max_tokens,
-                stream=False
-            )
+            with span('llm', model=self.llm.model, prompt_chars=len(prompt)) as stage:
+                response = self.llm.complete(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": self._get_system_prompt()
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=config.temperature,
+                    max_tokens=config.max_tokens
+                )
+                stage.set(prompt_tokens=response.prompt_tokens, completion_tokens=response.completion_tokens)
+                if stage.detailed:
+                    stage.set(answer_chars=len(response.text or ''))
             
             end_time = time.time()
             
-            answer = response.choices[0].message.content
-            tokens_used = response.usage.total_tokens if response.usage else 0
+            answer = response.text
+            tokens_used = response.total_tokens
             
             # Extract sources
             sources = [doc.metadata.get('source', 'Unknown') for doc in documents]
@@ -482,6 +725,8 @@ Respond in JSON format with: {{"complexity": "simple|complex", "sub_queries": [.
                 "answer": answer,
                 "sources": sources,
                 "tokens_used": tokens_used,
+                "prompt_tokens": response.prompt_tokens,
+                "completion_tokens": response.completion_tokens,
                 "response_time": end_time - start_time,
                 "context_length": len(context)
             }
@@ -489,19 +734,111 @@ Respond in JSON format with: {{"complexity": "simple|complex", "sub_queries": [.
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
-            st.error(f"Error generating response: {str(e)}")
-            st.error(f"Full error: {error_details}")
+            progress.error(f"Error generating response: {str(e)}")
+            progress.error(f"Full error: {error_details}")
             
             # Return error with sources so user knows retrieval worked
             sources = [doc.metadata.get('source', 'Unknown') for doc in documents]
             return {
                 "answer": f"❌ I apologize, but I encountered an error while generating a response: {str(e)}\n\nThe sources were retrieved successfully, but the OpenAI API call failed. Please check your API key and try again.",
                 "sources": sources,
+                "error": str(e),
                 "tokens_used": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
                 "response_time": 0,
                 "context_length": len(context) if 'context' in locals() else 0
             }
-    
+
+    def _generate_response_stream(self, question: str, documents: List[Document], config: RAGConfig,
+                                  progress: Optional[ProgressCallback] = None,
+                                  trace_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Generate response using the LLM backend, yielding token events as they arrive
+        
+        With a trace_id, context building and the LLM call are recorded as
+        stages of that trace.
+        """
+        progress = get_progress(progress)
+
+        build_start = time.perf_counter()
+        context = self._prepare_context(documents)
+        prompt = self._create_prompt(question, context)
+        sources = [doc.metadata.get('source', 'Unknown') for doc in documents]
+        detailed = bool(trace_id) and self.obs_tracker.is_detailed(trace_id)
+        if trace_id:
+            build_attributes = {'chunks': len(documents), 'prompt_chars': len(prompt)}
+            if detailed:
+                build_attributes['context_chars'] = len(context)
+            self.obs_tracker.record_span(trace_id, 'context_build', time.perf_counter() - build_start,
+                                         **build_attributes)
+
+        start_time = time.time()
+        llm_start = time.perf_counter()
+        first_token = None
+        answer_parts = []
+        usage = LLMResponse("")
+        error = None
+
+        try:
+            stream = self.llm.stream(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": self._get_system_prompt()
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=config.temperature,
+                max_tokens=config.max_tokens
+            )
+
+            for chunk in stream:
+                if isinstance(chunk, LLMResponse):
+                    usage = chunk
+                else:
+                    if first_token is None:
+                        first_token = time.perf_counter() - llm_start
+                    answer_parts.append(chunk)
+                    yield {'event': 'token', 'text': chunk}
+
+        except Exception as e:
+            progress.error(f"Error generating response: {str(e)}")
+            answer_parts = [f"❌ I apologize, but I encountered an error while generating a response: {str(e)}"]
+            error = str(e)
+            yield {'event': 'error', 'message': error}
+
+        if trace_id:
+            llm_attributes = {
+                'model': self.llm.model,
+                'prompt_chars': len(prompt),
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens
+            }
+            if first_token is not None:
+                llm_attributes['time_to_first_token'] = first_token
+            if detailed:
+                llm_attributes['answer_chars'] = sum(len(part) for part in answer_parts)
+            if error:
+                llm_attributes['error'] = error
+            self.obs_tracker.record_span(trace_id, 'llm', time.perf_counter() - llm_start, **llm_attributes)
+
+        done = {
+            'event': 'done',
+            'answer': "".join(answer_parts),
+            'sources': sources,
+            'tokens_used': usage.total_tokens,
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'response_time': time.time() - start_time,
+            'context_length': len(context)
+        }
+        if error:
+            done['error'] = error
+        yield done
+
     def _prepare_context(self, documents: List[Document]) -> str:
         """Prepare context from retrieved documents"""
         context_parts = []
@@ -549,11 +886,3 @@ Key guidelines:
 7. If the context doesn't contain sufficient information, clearly state this limitation
 
 Your responses should be professional, informative, and focused on helping the user understand Samsara's value proposition through real customer examples."""
-
-    def update_text_splitter(self, chunk_size: int, chunk_overlap: int):
-        """Update text splitter configuration"""
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
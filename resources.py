@@ -0,0 +1,92 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from vector_store import VectorStore, parse_granularities
+from rag_engine import RAGEngine
+from observability import ObservabilityTracker
+from evaluation import EvaluationMetrics
+from perf_log import PerformanceLog
+from ingest_jobs import IngestRunner, parse_interval
+
+# (chunk_size:chunk_overlap) pairs indexed by the app
+DEFAULT_GRANULARITIES = "500:100,1000:200,2000:400"
+
+@dataclass
+class SharedResources:
+    """Heavy engine components shared by every session in the process"""
+    obs_tracker: ObservabilityTracker
+    vector_store: VectorStore
+    rag_engine: RAGEngine
+    evaluator: EvaluationMetrics
+    # Scrapes and indexes in the background; None when the store is read-only
+    ingest_runner: Optional[IngestRunner] = None
+
+# Streamlit runs each browser session in its own script thread, but imported
+# modules (and therefore these globals) are shared by the whole process.
+_resources: Dict[str, SharedResources] = {}
+_resources_lock = threading.Lock()
+
+def get_shared_resources(persist_directory: str = "./chromadb") -> SharedResources:
+    """Get the process-wide resources for a persist directory, building them once"""
+    key = os.path.abspath(persist_directory)
+
+    resources = _resources.get(key)
+    if resources is not None:
+        return resources
+
+    with _resources_lock:
+        # Another session may have finished building while we waited
+        resources = _resources.get(key)
+        if resources is None:
+            # Traces beyond the in-memory window roll out beside the index, and
+            # every query's performance goes to a durable log shared by all sessions
+            data_dir = os.path.dirname(key)
+            obs_tracker = ObservabilityTracker(
+                archive_dir=os.getenv("RAG_TRACE_DIR", os.path.join(data_dir, "traces")),
+                perf_log=PerformanceLog(os.getenv("RAG_PERF_LOG_DIR", os.path.join(data_dir, "perf_log")))
+            )
+            if os.getenv("RAG_SNAPSHOT"):
+                # A replica serves read-only straight from a snapshot file
+                from snapshot import open_snapshot
+                vector_store = open_snapshot(os.environ["RAG_SNAPSHOT"])
+            else:
+                # Index several chunk granularities so the chunking sliders take effect
+                vector_store = VectorStore(
+                    persist_directory=persist_directory,
+                    granularities=parse_granularities(os.getenv("RAG_CHUNK_GRANULARITIES", DEFAULT_GRANULARITIES))
+                )
+            rag_engine = RAGEngine(vector_store=vector_store, obs_tracker=obs_tracker)
+
+            # Ingest jobs keep their state beside the index so any session can poll them
+            ingest_runner = None
+            if not vector_store.read_only:
+                ingest_runner = IngestRunner(
+                    vector_store,
+                    jobs_dir=os.getenv("RAG_INGEST_JOB_DIR", os.path.join(data_dir, "ingest_jobs")),
+                    interval=parse_interval(os.getenv("RAG_INGEST_INTERVAL", ""))
+                )
+                ingest_runner.start()
+
+            resources = SharedResources(
+                obs_tracker=obs_tracker,
+                vector_store=vector_store,
+                rag_engine=rag_engine,
+                evaluator=EvaluationMetrics(),
+                ingest_runner=ingest_runner
+            )
+            _resources[key] = resources
+
+    return resources
+
+def reset_shared_resources():
+    """Stop and drop all cached resources (used by tests and after a full reset)"""
+    with _resources_lock:
+        for resources in _resources.values():
+            # A running ingest job is cancelled and stays resumable
+            if resources.ingest_runner is not None:
+                resources.ingest_runner.stop()
+            # Flushes archived traces and closes the exporter and performance log
+            resources.obs_tracker.close()
+        _resources.clear()
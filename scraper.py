@@ -1,16 +1,18 @@
 import requests
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Collection
 import json
 import re
 from bs4 import BeautifulSoup
-import streamlit as st
 import time
 
+from progress import ProgressCallback, get_progress
+
 class SamsaraCustomerScraper:
     """Scraper for Samsara customer stories"""
     
-    def __init__(self):
+    def __init__(self, progress: Optional[ProgressCallback] = None):
+        self.progress = get_progress(progress)
         self.base_url = "https://www.samsara.com/customers"
         self.customer_stories = []
         self.session = requests.Session()
@@ -18,21 +20,30 @@ class SamsaraCustomerScraper:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
     
-    def scrape_customer_stories(self) -> List[Dict[str, Any]]:
-        """Scrape customer stories from Samsara website"""
+    def scrape_customer_stories(self, skip_urls: Optional[Collection[str]] = None,
+                                on_story: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                should_stop: Optional[Callable[[], bool]] = None) -> List[Dict[str, Any]]:
+        """Scrape customer stories from Samsara website
+        
+        Stories whose URL is in skip_urls are not fetched again (to resume an
+        interrupted crawl); on_story is called with each story as it is
+        scraped, and the crawl stops early once should_stop returns True.
+        """
         try:
-            return self._scrape_stories()
+            return self._scrape_stories(skip_urls or (), on_story, should_stop)
         except Exception as e:
-            st.error(f"Error during scraping: {str(e)}")
+            self.progress.error(f"Error during scraping: {str(e)}")
             return []
     
-    def _scrape_stories(self) -> List[Dict[str, Any]]:
+    def _scrape_stories(self, skip_urls: Collection[str] = (),
+                        on_story: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        should_stop: Optional[Callable[[], bool]] = None) -> List[Dict[str, Any]]:
         """Scrape customer stories using requests"""
         stories = []
         
         try:
             # First, scrape the main customers page
-            st.info("Fetching main customers page...")
+            self.progress.info("Fetching main customers page...")
             response = self.session.get(self.base_url, timeout=30)
             
             if response.status_code == 200:
@@ -41,12 +52,18 @@ class SamsaraCustomerScraper:
                 # Extract customer story links and basic info
                 customer_links = self._extract_customer_links(soup)
                 
-                st.info(f"Found {len(customer_links)} customer story links")
+                self.progress.info(f"Found {len(customer_links)} customer story links")
                 
                 # Process all customer stories
                 total_stories = len(customer_links)
                 for i, link_info in enumerate(customer_links, 1):
-                    st.text(f"Processing customer story {i}/{total_stories}")
+                    if should_stop is not None and should_stop():
+                        self.progress.warning(f"Stopped after {i - 1}/{total_stories} customer stories")
+                        break
+                    if link_info['url'] in skip_urls:
+                        continue
+                    self.progress.write(f"Processing customer story {i}/{total_stories}")
+                    self.progress.progress(i / total_stories)
                     
                     try:
                         time.sleep(0.2)  # Be polite to the server
@@ -59,16 +76,18 @@ class SamsaraCustomerScraper:
                             )
                             if story_data:
                                 stories.append(story_data)
+                                if on_story is not None:
+                                    on_story(story_data)
                     
                     except Exception as e:
-                        st.warning(f"Failed to scrape {link_info['url']}: {str(e)}")
+                        self.progress.warning(f"Failed to scrape {link_info['url']}: {str(e)}")
                         continue
             
             else:
-                st.error(f"Failed to scrape main customers page. Status code: {response.status_code}")
+                self.progress.error(f"Failed to scrape main customers page. Status code: {response.status_code}")
             
         except Exception as e:
-            st.error(f"Scraping error: {str(e)}")
+            self.progress.error(f"Scraping error: {str(e)}")
         
         return stories
     
@@ -113,12 +132,12 @@ class SamsaraCustomerScraper:
                             'title': title
                         })
             else:
-                st.warning(f"Contentful API returned status {response.status_code}. Falling back to HTML scraping...")
+                self.progress.warning(f"Contentful API returned status {response.status_code}. Falling back to HTML scraping...")
                 # Fallback to original method if API fails
                 return self._extract_customer_links_fallback(soup)
                 
         except Exception as e:
-            st.warning(f"Contentful API error: {str(e)}. Falling back to HTML scraping...")
+            self.progress.warning(f"Contentful API error: {str(e)}. Falling back to HTML scraping...")
             return self._extract_customer_links_fallback(soup)
         
         return links
@@ -0,0 +1,238 @@
+"""Headless HTTP query service
+
+Serves the shared RAGEngine over a plain ASGI app, so query serving can run
+and scale on its own; the Streamlit app is just one more client.
+
+    POST /query          {"question": "...", "config": {...}} -> answer JSON
+    POST /query/stream   same body -> NDJSON events (progress, sources, token, done)
+    POST /retrieve       same body -> retrieved documents, no LLM call
+    GET  /stats          knowledge base and query statistics
+    GET  /health
+
+Run with:
+    uvicorn service:app --host 0.0.0.0 --port 8000
+or:
+    python service.py --port 8000 --max-workers 16
+
+To serve on several cores, run several processes with RAG_READ_ONLY=1
+against an index kept up to date by one writer; each reloads the index
+when the writer publishes a new generation.
+"""
+import json
+import asyncio
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from progress import EventProgress, logger
+
+_STREAM_END = object()
+
+class BadRequest(Exception):
+    """Raised for malformed request bodies (HTTP 400)"""
+    pass
+
+def _default_engine_factory():
+    from resources import get_shared_resources
+    return get_shared_resources().rag_engine
+
+def _document_to_dict(doc) -> Dict[str, Any]:
+    return {'content': doc.page_content, 'metadata': doc.metadata}
+
+class QueryService:
+    """ASGI application exposing one shared RAGEngine
+
+    Engine calls are blocking, so they run on a bounded thread pool; the event
+    loop only parses requests and writes responses. All requests share one
+    engine instance, built on first use (or at startup via the lifespan hook).
+    """
+
+    def __init__(self, engine=None, engine_factory: Optional[Callable[[], Any]] = None,
+                 max_workers: int = 8):
+        self._engine = engine
+        self._engine_factory = engine_factory or _default_engine_factory
+        self._engine_lock = threading.Lock()
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-query")
+
+        self.routes = {
+            ('GET', '/health'): self._health,
+            ('GET', '/stats'): self._stats,
+            ('POST', '/query'): self._query,
+            ('POST', '/query/stream'): self._query_stream,
+            ('POST', '/retrieve'): self._retrieve,
+        }
+
+    @property
+    def engine(self):
+        """The shared engine, built once on first access"""
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    self._engine = self._engine_factory()
+        return self._engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path'].rstrip('/') or '/'
+        handler = self.routes.get((scope['method'], path))
+
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                await self._send_json(send, 405, {'error': 'Method not allowed'})
+            else:
+                await self._send_json(send, 404, {'error': 'Not found'})
+            return
+
+        try:
+            await handler(receive, send)
+        except BadRequest as e:
+            await self._send_json(send, 400, {'error': str(e)})
+        except Exception as e:
+            logger.exception("Error handling %s %s", scope['method'], path)
+            await self._send_json(send, 500, {'error': str(e)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    # Load the index and clients before accepting traffic
+                    await self._run(lambda: self.engine)
+                    await send({'type': 'lifespan.startup.complete'})
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                # Export queued telemetry before the process exits
+                obs_tracker = getattr(self._engine, 'obs_tracker', None)
+                if obs_tracker is not None:
+                    obs_tracker.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run(self, fn: Callable, *args, **kwargs):
+        """Run a blocking engine call on the worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def _read_query(self, receive) -> Tuple[str, Dict[str, Any]]:
+        """Read and validate a {"question", "config"} request body"""
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise BadRequest("Request body must be JSON")
+
+        question = payload.get('question') if isinstance(payload, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise BadRequest("'question' must be a non-empty string")
+
+        config = payload.get('config') or {}
+        if not isinstance(config, dict):
+            raise BadRequest("'config' must be an object")
+
+        return question, config
+
+    async def _send_json(self, send, status: int, payload: Any):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _health(self, receive, send):
+        await self._send_json(send, 200, {'status': 'ok', 'engine_loaded': self._engine is not None})
+
+    async def _stats(self, receive, send):
+        stats = await self._run(lambda: self.engine.get_stats())
+        await self._send_json(send, 200, stats)
+
+    async def _query(self, receive, send):
+        question, config = await self._read_query(receive)
+        response = await self._run(lambda: self.engine.query(question, config))
+        await self._send_json(send, 200, response)
+
+    async def _retrieve(self, receive, send):
+        question, config = await self._read_query(receive)
+        documents = await self._run(lambda: self.engine.retrieve(question, config))
+        await self._send_json(send, 200, {
+            'documents': [_document_to_dict(doc) for doc in documents]
+        })
+
+    async def _query_stream(self, receive, send):
+        question, config = await self._read_query(receive)
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def sink(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        def produce():
+            try:
+                for event in self.engine.query_stream(question, config, progress=EventProgress(sink)):
+                    if cancelled.is_set():
+                        break
+                    sink(event)
+            except Exception as e:
+                logger.exception("Error streaming query")
+                sink({'event': 'error', 'message': str(e)})
+            finally:
+                sink(_STREAM_END)
+
+        producer = loop.run_in_executor(self.executor, produce)
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson')]
+        })
+
+        try:
+            while True:
+                event = await events.get()
+                if event is _STREAM_END:
+                    break
+                line = json.dumps(event, default=str).encode('utf-8') + b'\n'
+                await send({'type': 'http.response.body', 'body': line, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Stop generating if the client went away mid-stream
+            cancelled.set()
+            await producer
+
+app = QueryService()
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless RAG query service")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-workers', type=int, default=8,
+                        help="Engine calls served concurrently per process")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(QueryService(max_workers=args.max_workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Collections split across shards and searched in parallel
+
+A ShardedCollection presents the collection API of vector_backends over
+several backend collections. Every record lives in exactly one shard,
+chosen from its metadata:
+
+    industry   all of an industry's chunks share a shard, so a query
+               filtered to one industry searches one shard
+    source     a hash of the story URL, which spreads stories evenly
+
+Writes are grouped by shard and touch only the shards their records (or
+their where filter) map to. Queries fan out to every shard the filter
+leaves possible, on a shared thread pool, and each query's results are
+merged across shards by distance.
+"""
+import hashlib
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+from vector_backends import DEFAULT_INCLUDE
+
+SHARD_KEYS = ('source', 'industry')
+
+def shard_names(name: str, shards: int, shard_by: str) -> List[str]:
+    """Backend collection names for the shards of a collection"""
+    return [f"{name}_{shard_by}_{i}of{shards}" for i in range(shards)]
+
+def shard_index(value: Any, shards: int) -> int:
+    """Stable shard for a metadata value (the same in every process)"""
+    return int(hashlib.md5(str(value).encode()).hexdigest()[:8], 16) % shards
+
+def pinned_values(where: Optional[Dict[str, Any]], field: str) -> Optional[Set[Any]]:
+    """Values a where filter restricts field to, or None when it allows any"""
+    if not where:
+        return None
+    values = None
+    for key, condition in where.items():
+        if key == '$and':
+            found = [pinned_values(clause, field) for clause in condition]
+        elif key == '$or':
+            branches = [pinned_values(clause, field) for clause in condition]
+            found = [set().union(*branches)] if branches and None not in branches else []
+        elif key == field:
+            if not isinstance(condition, dict):
+                found = [{condition}]
+            elif '$eq' in condition:
+                found = [{condition['$eq']}]
+            elif '$in' in condition:
+                found = [set(condition['$in'])]
+            else:
+                found = []
+        else:
+            found = []
+        for clause_values in found:
+            if clause_values is not None:
+                values = clause_values if values is None else values & clause_values
+    return values
+
+class ShardedCollection:
+    """One logical collection stored as several backend collections"""
+
+    def __init__(self, name: str, shards: Sequence[Any], shard_by: str, executor: Executor):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key {shard_by!r}; expected one of {SHARD_KEYS}")
+        self.name = name
+        self.shards = list(shards)
+        self.shard_by = shard_by
+        self.executor = executor
+
+    def shard_for(self, metadata: Dict[str, Any]) -> int:
+        return shard_index(metadata.get(self.shard_by, ''), len(self.shards))
+
+    def targets(self, where: Optional[Dict[str, Any]] = None) -> List[int]:
+        """Shards that can hold records matching the filter"""
+        values = pinned_values(where, self.shard_by)
+        if values is None:
+            return list(range(len(self.shards)))
+        return sorted({shard_index(value, len(self.shards)) for value in values})
+
+    def _map(self, function: Callable[[int], Any], shards: Sequence[int]) -> List[Any]:
+        """function(shard) for each shard, in parallel when there is more than one"""
+        if len(shards) == 1:
+            return [function(shards[0])]
+        return list(self.executor.map(function, shards))
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def add(self, ids: Sequence[str], documents: Optional[Sequence[str]] = None,
+            metadatas: Optional[Sequence[Dict[str, Any]]] = None, embeddings: Optional[Any] = None):
+        rows_by_shard: Dict[int, List[int]] = {}
+        for i in range(len(ids)):
+            rows_by_shard.setdefault(self.shard_for(metadatas[i] if metadatas else {}), []).append(i)
+
+        def add(shard: int):
+            rows = rows_by_shard[shard]
+            self.shards[shard].add(
+                ids=[ids[i] for i in rows],
+                documents=[documents[i] for i in rows] if documents is not None else None,
+                metadatas=[metadatas[i] for i in rows] if metadatas is not None else None,
+                embeddings=[embeddings[i] for i in rows] if embeddings is not None else None
+            )
+
+        self._map(add, sorted(rows_by_shard))
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None):
+        self._map(lambda shard: self.shards[shard].delete(ids=ids, where=where), self.targets(where))
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = DEFAULT_INCLUDE) -> Dict[str, Any]:
+        # Offsets only make sense over the concatenation, so each shard returns enough to cover them
+        per_shard = None if limit is None else (offset or 0) + limit
+        parts = self._map(lambda shard: self.shards[shard].get(ids=ids, where=where, limit=per_shard,
+                                                               include=list(include)),
+                          self.targets(where))
+
+        keys = ['ids'] + [key for key in ('documents', 'metadatas', 'embeddings') if key in include]
+        merged = {key: [] for key in keys}
+        for part in parts:
+            for key in keys:
+                merged[key].extend(part[key] if part.get(key) is not None else [])
+        end = None if limit is None else (offset or 0) + limit
+        return {key: values[offset or 0:end] for key, values in merged.items()}
+
+    def query(self, query_embeddings: Any, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = DEFAULT_INCLUDE + ('distances',)) -> Dict[str, List[List[Any]]]:
+        """Each shard's top n_results, merged per query by distance"""
+        fields = [key for key in ('documents', 'metadatas', 'embeddings') if key in include]
+        shards = [shard for shard in self.targets(where) if self.shards[shard].count() > 0]
+        parts = self._map(lambda shard: self.shards[shard].query(query_embeddings=query_embeddings,
+                                                                 n_results=n_results, where=where,
+                                                                 include=fields + ['distances']),
+                          shards)
+
+        keys = ['ids'] + fields + (['distances'] if 'distances' in include else [])
+        results = {key: [] for key in keys}
+        for i in range(len(query_embeddings)):
+            hits = sorted(((distance, part, j) for part in parts
+                           for j, distance in enumerate(part['distances'][i])),
+                          key=lambda hit: hit[0])[:n_results]
+            for key in keys:
+                source = 'distances' if key == 'distances' else key
+                results[key].append([part[source][i][j] for _, part, j in hits])
+        return results
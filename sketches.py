@@ -0,0 +1,257 @@
+"""Mergeable streaming statistics for latency and usage metrics
+
+QuantileSketch is a log-bucketed histogram (the DDSketch / HDR histogram
+idea): a value v lands in bucket ceil(log(v) / log(gamma)), so every
+quantile it reports is within `relative_accuracy` of the true value. Updates
+are O(1), memory is bounded by the dynamic range rather than the number of
+samples, and two sketches merge by adding bucket counts, which is what lets
+time buckets and strategies be combined after the fact.
+
+RollingWindow keeps one MetricStats per strategy per fixed-width time
+bucket, so a summary over the last N hours merges O(buckets) small objects
+instead of rescanning raw history.
+"""
+import math
+from typing import Dict, Iterable, List, Optional
+
+class QuantileSketch:
+    """Relative-error quantile sketch over non-negative values"""
+
+    __slots__ = ('relative_accuracy', 'gamma', '_log_gamma', 'buckets', 'zero_count', 'count')
+
+    # Values at or below this are counted as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        self.count += count
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch"):
+        """Add another sketch's counts into this one (same accuracy required)"""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _bucket_value(self, index: int) -> float:
+        # Midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (q in [0, 1]); 0 for an empty sketch"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return self._bucket_value(index)
+        return self._bucket_value(max(self.buckets))
+
+    def to_dict(self) -> Dict[str, object]:
+        return {'relative_accuracy': self.relative_accuracy, 'zero_count': self.zero_count,
+                'buckets': {str(index): count for index, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "QuantileSketch":
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.buckets = {int(index): count for index, count in data['buckets'].items()}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
+
+    def count_at_most(self, value: float) -> int:
+        """Approximate number of values <= value"""
+        total = self.zero_count
+        if value <= self.MIN_VALUE:
+            return total
+        limit = math.ceil(math.log(value) / self._log_gamma)
+        return total + sum(count for index, count in self.buckets.items() if index <= limit)
+
+class MetricStats:
+    """Running statistics for one stream of query metrics
+
+    Exact count, sum, min, max and variance (from running sums) for
+    response time, tokens and sources, plus a quantile sketch of response
+    time. Mergeable, O(1) to update.
+    """
+
+    __slots__ = ('count', 'response_time_sum', 'response_time_sq_sum', 'min_response_time',
+                 'max_response_time', 'tokens_sum', 'min_tokens', 'max_tokens', 'sources_sum',
+                 'first_timestamp', 'last_timestamp', 'response_times')
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.count = 0
+        self.response_time_sum = 0.0
+        self.response_time_sq_sum = 0.0
+        self.min_response_time = math.inf
+        self.max_response_time = 0.0
+        self.tokens_sum = 0
+        self.min_tokens = math.inf
+        self.max_tokens = 0
+        self.sources_sum = 0
+        self.first_timestamp: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self.response_times = QuantileSketch(relative_accuracy)
+
+    def add(self, response_time: float, tokens_used: int, num_sources: int, timestamp: float):
+        self.count += 1
+        self.response_time_sum += response_time
+        self.response_time_sq_sum += response_time * response_time
+        self.min_response_time = min(self.min_response_time, response_time)
+        self.max_response_time = max(self.max_response_time, response_time)
+        self.tokens_sum += tokens_used
+        self.min_tokens = min(self.min_tokens, tokens_used)
+        self.max_tokens = max(self.max_tokens, tokens_used)
+        self.sources_sum += num_sources
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        self.response_times.add(response_time)
+
+    def merge(self, other: "MetricStats"):
+        if not other.count:
+            return
+        self.count += other.count
+        self.response_time_sum += other.response_time_sum
+        self.response_time_sq_sum += other.response_time_sq_sum
+        self.min_response_time = min(self.min_response_time, other.min_response_time)
+        self.max_response_time = max(self.max_response_time, other.max_response_time)
+        self.tokens_sum += other.tokens_sum
+        self.min_tokens = min(self.min_tokens, other.min_tokens)
+        self.max_tokens = max(self.max_tokens, other.max_tokens)
+        self.sources_sum += other.sources_sum
+        for timestamp in (other.first_timestamp, other.last_timestamp):
+            if self.first_timestamp is None or timestamp < self.first_timestamp:
+                self.first_timestamp = timestamp
+            if self.last_timestamp is None or timestamp > self.last_timestamp:
+                self.last_timestamp = timestamp
+        self.response_times.merge(other.response_times)
+
+    @classmethod
+    def merged(cls, stats: Iterable["MetricStats"]) -> "MetricStats":
+        total = cls()
+        for item in stats:
+            total.merge(item)
+        return total
+
+    def to_dict(self) -> Dict[str, object]:
+        """JSON-serializable form, for persisting rollups"""
+        data = {name: getattr(self, name) for name in self.__slots__ if name != 'response_times'}
+        for name in ('min_response_time', 'min_tokens'):
+            if data[name] == math.inf:
+                data[name] = None
+        data['response_times'] = self.response_times.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "MetricStats":
+        sketch = QuantileSketch.from_dict(data['response_times'])
+        stats = cls(sketch.relative_accuracy)
+        for name in cls.__slots__:
+            if name != 'response_times':
+                setattr(stats, name, data[name])
+        for name in ('min_response_time', 'min_tokens'):
+            if getattr(stats, name) is None:
+                setattr(stats, name, math.inf)
+        stats.response_times = sketch
+        return stats
+
+    @property
+    def mean_response_time(self) -> float:
+        return self.response_time_sum / self.count if self.count else 0.0
+
+    @property
+    def std_response_time(self) -> float:
+        """Sample standard deviation of response time"""
+        if self.count < 2:
+            return 0.0
+        variance = (self.response_time_sq_sum - self.response_time_sum ** 2 / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+class RollingWindow:
+    """Per-strategy MetricStats in fixed-width time buckets
+
+    Buckets older than `retention_buckets` are dropped as new ones open, so
+    memory is bounded by retention x strategies regardless of query volume.
+    """
+
+    def __init__(self, bucket_seconds: int = 300, retention_buckets: int = 2016,
+                 relative_accuracy: float = 0.01):
+        self.bucket_seconds = bucket_seconds
+        self.retention_buckets = retention_buckets
+        self.relative_accuracy = relative_accuracy
+        # bucket start (epoch seconds) -> strategy -> stats, in insertion order
+        self.buckets: Dict[int, Dict[str, MetricStats]] = {}
+
+    def add(self, strategy: str, response_time: float, tokens_used: int, num_sources: int,
+            timestamp: float):
+        start = int(timestamp // self.bucket_seconds) * self.bucket_seconds
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = {}
+            self._expire(start)
+
+        stats = bucket.get(strategy)
+        if stats is None:
+            stats = bucket[strategy] = MetricStats(self.relative_accuracy)
+        stats.add(response_time, tokens_used, num_sources, timestamp)
+
+    def _expire(self, newest_start: int):
+        cutoff = newest_start - self.retention_buckets * self.bucket_seconds
+        for start in [start for start in self.buckets if start <= cutoff]:
+            del self.buckets[start]
+
+    def window(self, since: float, strategy: Optional[str] = None) -> Dict[str, MetricStats]:
+        """Merged stats per strategy for buckets overlapping [since, now]
+
+        Resolution is one bucket: the oldest bucket is included whole.
+        """
+        first_bucket = int(since // self.bucket_seconds) * self.bucket_seconds
+        merged: Dict[str, MetricStats] = {}
+        for start, bucket in self.buckets.items():
+            if start < first_bucket:
+                continue
+            for name, stats in bucket.items():
+                if strategy and name != strategy:
+                    continue
+                if name not in merged:
+                    merged[name] = MetricStats(self.relative_accuracy)
+                merged[name].merge(stats)
+        return merged
+
+    def series(self, since: float) -> List[Dict[str, object]]:
+        """One row per (bucket, strategy) since a time, oldest first"""
+        first_bucket = int(since // self.bucket_seconds) * self.bucket_seconds
+        rows = []
+        for start in sorted(self.buckets):
+            if start < first_bucket:
+                continue
+            for name, stats in self.buckets[start].items():
+                rows.append({
+                    'bucket_start': start,
+                    'strategy': name,
+                    'count': stats.count,
+                    'avg_response_time': stats.mean_response_time,
+                    'p95_response_time': stats.response_times.quantile(0.95),
+                    'tokens_used': stats.tokens_sum,
+                })
+        return rows
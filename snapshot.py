@@ -0,0 +1,234 @@
+"""Portable index snapshots
+
+A snapshot is one file holding everything a replica needs to serve: every
+granularity's chunk vectors, ids, texts and metadata, the full documents,
+and a catalog of how the store was built. It is laid out for memory
+mapping:
+
+    b"RAGSNAP\\0"            magic
+    uint64 (little endian)  header length
+    header                  JSON: format version, catalog, and for every
+                            section its offset (from the data start),
+                            length and SHA-256
+    data                    sections, each aligned to 64 bytes: per
+                            collection a float32 matrix of normalized rows
+                            and a JSON records blob, then the full documents
+
+Vectors are never re-embedded: open_snapshot() maps the file and serves
+from it read-only with exact search, and import_snapshot() loads it into
+a regular store with its embeddings as they are.
+
+    python -m snapshot export [--persist-directory ./chromadb] index.ragsnap
+    python -m snapshot import index.ragsnap [--persist-directory ./replica]
+"""
+import os
+import json
+import struct
+import hashlib
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_backends import EmptyCollection, NumpyCollection, ReadOnlyError, VectorBackend
+
+MAGIC = b"RAGSNAP\0"
+SNAPSHOT_VERSION = 1
+ALIGNMENT = 64
+
+def embedding_name(embedding_function) -> str:
+    """Identity of an embedding function, recorded so a snapshot is only searched with its own model"""
+    name = getattr(embedding_function, 'name', None)
+    try:
+        return name() if callable(name) else type(embedding_function).__name__
+    except Exception:
+        return type(embedding_function).__name__
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _sha256(data) -> str:
+    digest = hashlib.sha256()
+    view = memoryview(data).cast('B')
+    for start in range(0, len(view), 1 << 24):
+        digest.update(view[start:start + (1 << 24)])
+    return digest.hexdigest()
+
+def write_snapshot(path: str, catalog: Dict[str, Any], collections: List[Dict[str, Any]],
+                   full_documents: Dict[str, Any]) -> Dict[str, Any]:
+    """Write a snapshot file atomically; returns its header
+
+    Each collection is {'name', 'granularity', 'ids', 'documents',
+    'metadatas', 'vectors'} with vectors as normalized float32 rows.
+    """
+    sections: List[Tuple[Dict[str, Any], bytes]] = []
+
+    def add_section(data: bytes) -> Dict[str, Any]:
+        entry = {'offset': _aligned(sum(_aligned(len(d)) for _, d in sections)), 'length': len(data),
+                 'sha256': _sha256(data)}
+        sections.append((entry, data))
+        return entry
+
+    entries = []
+    for collection in collections:
+        vectors = np.ascontiguousarray(collection['vectors'], dtype=np.float32)
+        records = json.dumps({'ids': collection['ids'], 'documents': collection['documents'],
+                              'metadatas': collection['metadatas']}, default=str).encode('utf-8')
+        entries.append({
+            'name': collection['name'], 'granularity': list(collection['granularity']),
+            'count': len(collection['ids']), 'dimensions': int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            'vectors': add_section(vectors.tobytes()), 'records': add_section(records),
+        })
+    documents = add_section(json.dumps(full_documents, default=str).encode('utf-8'))
+
+    header = {'format_version': SNAPSHOT_VERSION, 'created': time.time(), 'catalog': catalog,
+              'collections': entries, 'full_documents': documents}
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+        for entry, data in sections:
+            f.seek(data_start + entry['offset'])
+            f.write(data)
+        f.truncate(data_start + sum(_aligned(len(d)) for _, d in sections))
+    os.replace(temporary, path)
+    return header
+
+class Snapshot:
+    """A snapshot file opened for reading; vectors stay memory-mapped"""
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an index snapshot")
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            self.header = json.loads(f.read(header_length))
+        if self.header.get('format_version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} has snapshot format {self.header.get('format_version')}; "
+                             f"this version reads format {SNAPSHOT_VERSION}")
+        self.catalog = self.header['catalog']
+        self._data_start = _aligned(len(MAGIC) + 8 + header_length)
+        self._file = np.memmap(path, dtype=np.uint8, mode='r')
+        if verify:
+            self.verify()
+
+    def _section(self, entry: Dict[str, Any]) -> np.ndarray:
+        start = self._data_start + entry['offset']
+        return self._file[start:start + entry['length']]
+
+    def verify(self):
+        """Raise ValueError unless every section matches its checksum"""
+        entries = [self.header['full_documents']]
+        for collection in self.header['collections']:
+            entries += [collection['vectors'], collection['records']]
+        for entry in entries:
+            if _sha256(self._section(entry)) != entry['sha256']:
+                raise ValueError(f"{self.path} is corrupt: checksum mismatch at offset {entry['offset']}")
+
+    def collections(self) -> List[Dict[str, Any]]:
+        """Every collection's records, with its vectors as a read-only view of the file"""
+        collections = []
+        for entry in self.header['collections']:
+            records = json.loads(self._section(entry['records']).tobytes())
+            vectors = self._section(entry['vectors']).view(np.float32).reshape(entry['count'], entry['dimensions'])
+            collections.append({'name': entry['name'], 'granularity': tuple(entry['granularity']),
+                                'vectors': vectors, **records})
+        return collections
+
+    def full_documents(self) -> Dict[str, Any]:
+        return json.loads(self._section(self.header['full_documents']).tobytes())
+
+class SnapshotBackend(VectorBackend):
+    """Read-only collections served straight from a snapshot's mapped vectors"""
+
+    name = "snapshot"
+    read_only = True
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.collections = {
+            collection['name']: NumpyCollection.from_records(
+                collection['name'], {'chunk_size': collection['granularity'][0],
+                                     'chunk_overlap': collection['granularity'][1]},
+                collection['ids'], collection['documents'], collection['metadatas'], collection['vectors'])
+            for collection in snapshot.collections()
+        }
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        return self.collections.get(name) or EmptyCollection(name)
+
+    def delete_collection(self, name: str):
+        raise ReadOnlyError(f"Cannot delete collection {name}: snapshots are read-only")
+
+def _check_embedding(snapshot: Snapshot, embedding_function):
+    expected = snapshot.catalog.get('embedding')
+    if expected and embedding_name(embedding_function) != expected:
+        raise ValueError(f"Snapshot was embedded with {expected!r}; "
+                         f"queries would be embedded with {embedding_name(embedding_function)!r}")
+
+def open_snapshot(path: str, embedding_function=None, verify: bool = True, **store_kwargs):
+    """A read-only VectorStore serving from a snapshot file, with no copying or re-embedding"""
+    from embeddings import get_default_embedding_function
+    from vector_store import VectorStore
+
+    snapshot = Snapshot(path, verify=verify)
+    embedding_function = embedding_function or get_default_embedding_function()
+    _check_embedding(snapshot, embedding_function)
+    catalog = snapshot.catalog
+    store = VectorStore(persist_directory=path, embedding_function=embedding_function,
+                        granularities=[tuple(g) for g in catalog['granularities']],
+                        chunk_unit=catalog['chunk_unit'], backend=SnapshotBackend(snapshot),
+                        read_only=True, **{'shards': 1, **store_kwargs})
+    store.full_documents = snapshot.full_documents()
+    return store
+
+def import_snapshot(path: str, persist_directory: str, embedding_function=None, verify: bool = True,
+                    **store_kwargs):
+    """Replace a store's contents with a snapshot's; returns the writable VectorStore"""
+    from embeddings import get_default_embedding_function
+    from vector_store import VectorStore
+
+    snapshot = Snapshot(path, verify=verify)
+    embedding_function = embedding_function or get_default_embedding_function()
+    _check_embedding(snapshot, embedding_function)
+    catalog = snapshot.catalog
+    store = VectorStore(persist_directory=persist_directory, embedding_function=embedding_function,
+                        granularities=[tuple(g) for g in catalog['granularities']],
+                        chunk_unit=catalog['chunk_unit'],
+                        **{'hnsw': catalog.get('hnsw') or {}, **store_kwargs})
+    store.load_snapshot(snapshot)
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import an index snapshot")
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('path', help="Snapshot file")
+    parser.add_argument('--persist-directory', default="./chromadb")
+    parser.add_argument('--granularities', default=None,
+                        help="Granularities to export, e.g. 500:100,1000:200 (default: as the app indexes)")
+    parser.add_argument('--embedding', default='default', choices=['default', 'hashing'])
+    args = parser.parse_args()
+
+    from embeddings import HashingEmbeddingFunction, get_default_embedding_function
+    embedding_function = HashingEmbeddingFunction() if args.embedding == 'hashing' \
+        else get_default_embedding_function()
+
+    if args.action == 'export':
+        from resources import DEFAULT_GRANULARITIES
+        from vector_store import VectorStore, parse_granularities
+        granularities = args.granularities or os.getenv("RAG_CHUNK_GRANULARITIES", DEFAULT_GRANULARITIES)
+        store = VectorStore(persist_directory=args.persist_directory, embedding_function=embedding_function,
+                            granularities=parse_granularities(granularities), read_only=True)
+        header = store.export_snapshot(args.path)
+        print(f"Exported {sum(c['count'] for c in header['collections'])} chunks "
+              f"in {len(header['collections'])} collections to {args.path}")
+    else:
+        store = import_snapshot(args.path, args.persist_directory, embedding_function)
+        print(f"Imported {store.collection.count()} chunks into {args.persist_directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Background export of telemetry events
+
+ObservabilityTracker hands events to a TelemetryExporter instead of calling
+Logfire inside the request. Enqueueing is a bounds check plus a deque
+append under a lock held for nothing else; a daemon thread drains the
+queue in batches and passes each batch to the sink. When the queue is full
+new events are dropped and counted, so a slow or failing exporter can never
+block or slow a query.
+"""
+import time
+import atexit
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+from progress import logger
+
+class TelemetryExporter:
+    """Bounded queue drained by a background thread in batches"""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], None], max_queue: int = 10000,
+                 batch_size: int = 100, flush_interval: float = 1.0):
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = deque()
+        # Guards the bounds check, the queue and the counters, which sessions update concurrently
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+        self.enqueued = 0
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+        self.batches = 0
+
+        self._thread = threading.Thread(target=self._run, name="telemetry-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def emit(self, name: str, **attributes):
+        """Queue an event for export; never waits on the export"""
+        event = {'name': name, 'time': time.time(), **attributes}
+        with self._lock:
+            if self._closed or len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(event)
+            self.enqueued += 1
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+            if self._closed and not self._queue:
+                return
+
+    def _drain(self):
+        while self._queue:
+            self._idle.clear()
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+            try:
+                self.sink(batch)
+                failed = False
+            except Exception as e:
+                failed = True
+                logger.warning(f"Telemetry export failed, dropped {len(batch)} events: {str(e)}")
+            with self._lock:
+                if failed:
+                    self.export_errors += 1
+                    self.dropped += len(batch)
+                else:
+                    self.exported += len(batch)
+                self.batches += 1
+        self._idle.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until queued events have been exported; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self._queue or not self._idle.is_set():
+            if not self._thread.is_alive():
+                return False
+            self._wake.set()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._idle.wait(min(remaining, 0.05))
+            time.sleep(0.001)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Export what is queued and stop the background thread"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'queued': len(self._queue),
+                'enqueued': self.enqueued,
+                'exported': self.exported,
+                'dropped': self.dropped,
+                'export_errors': self.export_errors,
+                'batches': self.batches,
+            }
+
+def logfire_sink(batch: List[Dict[str, Any]]):
+    """Send a batch of events to Logfire as log records"""
+    import logfire
+
+    for event in batch:
+        attributes = dict(event)
+        name = attributes.pop('name')
+        if attributes.pop('level', None) == 'error':
+            logfire.error(name, **attributes)
+        else:
+            logfire.info(name, **attributes)
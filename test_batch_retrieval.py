@@ -0,0 +1,235 @@
+import os
+
+import numpy as np
+
+from embeddings import HashingEmbeddingFunction
+from quantized_index import QuantizedIndex, exact_search
+from vector_backends import NumpyBackend
+from vector_store import VectorStore, parse_hnsw
+from rag_engine import RAGEngine
+from observability import ObservabilityTracker
+
+WORDS = ['safety', 'fuel', 'cameras', 'routing', 'compliance', 'maintenance', 'dispatch', 'idling']
+
+STORIES = [
+    {
+        'url': f"https://www.samsara.com/customers/company-{i}",
+        'title': f"Company {i} story",
+        'company_name': f"Company {i}",
+        'industry': industry,
+        'content': " ".join(
+            f"In month {j} Company {i} improved {WORDS[(i + j) % len(WORDS)]} across its {industry.lower()} fleet."
+            for j in range(60)
+        ) + f" They cut idling by {i * 5}% with Samsara.",
+        'highlights': [f"Better {' and '.join(WORDS[i:i + i + 1])}"],
+        'roi_metrics': [f"{i * 5}% reduction in {WORDS[-i]} costs"],
+        'challenges': [],
+        'solutions': [],
+        'competitor_info': ''
+    }
+    for i, industry in enumerate(['Logistics', 'Construction', 'Education', 'Logistics', 'Energy', 'Food'])
+]
+
+QUESTIONS = [
+    "How did Company 1 reduce idling?",
+    "Which logistics customers use Samsara?",
+    "What ROI did Company 4 report?",
+]
+
+def make_store(tmp_path):
+    store = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                        embedding_function=HashingEmbeddingFunction())
+    store.populate_store(STORIES)
+    return store
+
+def test_batch_search_matches_single_queries(tmp_path):
+    store = make_store(tmp_path)
+    
+    batch = store.similarity_search_batch(QUESTIONS, k=4)
+    assert len(batch) == len(QUESTIONS)
+    for question, results in zip(QUESTIONS, batch):
+        single = store.similarity_search(question, k=4)
+        assert [d.page_content for d in results] == [d.page_content for d in single]
+    
+    filtered = store.similarity_search_batch(QUESTIONS, k=4, where={'industry': 'Logistics'})
+    assert all(d.metadata['industry'] == 'Logistics' for results in filtered for d in results)
+    assert store.similarity_search_batch([], k=4) == []
+
+def test_query_batch_retrieval_matches_retrieve(tmp_path):
+    engine = RAGEngine(vector_store=make_store(tmp_path), obs_tracker=ObservabilityTracker())
+    
+    for strategy in ['naive', 'parent_document', 'hybrid']:
+        for method in ['semantic', 'keyword', 'hybrid']:
+            config = {'strategy': strategy, 'retrieval_method': method, 'top_k': 3}
+            batch = engine.query_batch(QUESTIONS, config, generate=False)
+            
+            for question, result in zip(QUESTIONS, batch):
+                expected = engine.retrieve(question, config)
+                assert [d.page_content for d in result['documents']] == [d.page_content for d in expected]
+
+def test_queries_route_to_the_configured_chunk_granularity(tmp_path):
+    store = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                        embedding_function=HashingEmbeddingFunction(), granularities=[(300, 50)])
+    store.populate_store(STORIES)
+    
+    counts = store.get_stats()['granularities']
+    assert counts['300/50'] > counts['1000/200'] > 0
+    # Per-story documents are identical at both granularities and embedded once
+    assert store.build_stats['embedded'] < store.build_stats['documents']
+    
+    engine = RAGEngine(vector_store=store, obs_tracker=ObservabilityTracker())
+    config = {'strategy': 'naive', 'top_k': 4, 'chunk_size': 300, 'chunk_overlap': 50,
+              'use_adaptive_retrieval': False}
+    documents = engine.retrieve(QUESTIONS[0], config)
+    main_chunks = [d for d in documents if d.metadata['content_type'] == 'main_content']
+    assert main_chunks and all(len(d.page_content) <= 300 for d in main_chunks)
+    
+    batch = engine.query_batch(QUESTIONS, config, generate=False)
+    for question, result in zip(QUESTIONS, batch):
+        assert [d.page_content for d in result['documents']] == \
+            [d.page_content for d in engine.retrieve(question, config)]
+    
+    # Unindexed sizes use the nearest granularity
+    assert store.resolve_granularity(400, 100) == (300, 50)
+    assert store.resolve_granularity(1800, 0) == (1000, 200)
+    
+    # Reopening with a new granularity builds it from the saved stories
+    reopened = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                           embedding_function=HashingEmbeddingFunction(), granularities=[(300, 50), (2000, 400)])
+    assert reopened.ensure_granularities() == [(2000, 400)]
+    assert reopened.get_stats()['granularities']['2000/400'] > 0
+    assert reopened.ensure_granularities() == []
+
+def test_quantized_search_rescores_to_the_exact_neighbors(tmp_path):
+    store = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                        embedding_function=HashingEmbeddingFunction(), quantization='int8')
+    store.populate_store(STORIES)
+    
+    records = store.collection.get(include=['embeddings', 'documents'])
+    exact = exact_search(np.asarray(records['embeddings']), store.embed_queries(QUESTIONS), 3)
+    results = store.similarity_search_batch(QUESTIONS, k=3)
+    assert store._quantized[store.collection.name].quantization == 'int8'
+    for rows, documents in zip(exact, results):
+        assert [d.page_content for d in documents] == [records['documents'][row] for row in rows]
+    
+    filtered = store.similarity_search_batch(QUESTIONS, k=4, where={'industry': 'Logistics'})
+    assert all(d.metadata['industry'] == 'Logistics' for results in filtered for d in results)
+    
+    # A write invalidates the index; the next search rebuilds it from the collection
+    store.add_or_update_stories([dict(STORIES[0], url="https://www.samsara.com/customers/new", content="Tachograph data.")])
+    assert store.collection.name not in store._quantized
+    assert store.similarity_search("tachograph", k=1)[0].page_content == "Tachograph data."
+    assert len(store._quantized[store.collection.name]) == store.collection.count()
+
+def test_quantized_rebuild_leaves_open_indexes_readable(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 16)).astype(np.float32)
+    ids = [f"v{i}" for i in range(50)]
+    QuantizedIndex(str(tmp_path), 'int8').build(ids, vectors)
+    opened = QuantizedIndex(str(tmp_path), 'int8')
+    assert opened.load()
+    
+    # A smaller rebuild must not truncate the files the opened index has mapped
+    QuantizedIndex(str(tmp_path), 'int8').build(ids[:5], vectors[:5])
+    assert opened.search(vectors[40:41], 1)[0][0][0] == "v40"
+    reloaded = QuantizedIndex(str(tmp_path), 'int8')
+    assert reloaded.load() and len(reloaded) == 5
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("build-")]) == 1
+
+def test_numpy_backend_searches_exactly_and_persists(tmp_path):
+    store = VectorStore(persist_directory=str(tmp_path / "numpy"),
+                        embedding_function=HashingEmbeddingFunction(), backend='numpy')
+    store.populate_store(STORIES)
+    chroma = make_store(tmp_path)
+    assert store.collection.count() == chroma.collection.count()
+    
+    records = store.collection.get(include=['embeddings', 'documents'])
+    exact = exact_search(np.asarray(records['embeddings']), store.embed_queries(QUESTIONS), 3)
+    for rows, documents in zip(exact, store.similarity_search_batch(QUESTIONS, k=3)):
+        assert [d.page_content for d in documents] == [records['documents'][row] for row in rows]
+    
+    filtered = store.similarity_search_batch(QUESTIONS, k=4, where={'$and': [{'industry': 'Logistics'},
+                                                                           {'content_type': {'$ne': 'highlights'}}]})
+    assert all(d.metadata['industry'] == 'Logistics' and d.metadata['content_type'] != 'highlights'
+               for results in filtered for d in results)
+    
+    # Updates rewrite the story's rows; a new store over the same directory sees them
+    store.add_or_update_stories([dict(STORIES[1], content="Tachograph data.")])
+    reopened = VectorStore(persist_directory=str(tmp_path / "numpy"),
+                           embedding_function=HashingEmbeddingFunction(), backend='numpy')
+    assert reopened.collection.count() == store.collection.count()
+    assert reopened.similarity_search("tachograph", k=1)[0].page_content == "Tachograph data."
+    main_content = reopened.collection.get(where={'$and': [{'source': STORIES[1]['url']},
+                                                           {'content_type': 'main_content'}]})
+    assert main_content['documents'] == ["Tachograph data."]
+
+def test_numpy_adds_append_to_a_log_and_compact(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((40, 8)).astype(np.float32)
+    collection = NumpyBackend(str(tmp_path)).get_or_create_collection("log")
+    for start in range(0, 40, 4):
+        collection.add(ids=[f"id{i}" for i in range(start, start + 4)], documents=["doc"] * 4,
+                       metadatas=[{'row': i} for i in range(start, start + 4)], embeddings=vectors[start:start + 4])
+    # records.json was rewritten once the log outgrew it, at 12 and 28 rows; the log holds the rest
+    assert collection._base_rows == 28
+    with open(os.path.join(collection.directory, collection._log), 'ab') as f:
+        f.write(b'{"id": "torn')
+
+    reopened = NumpyBackend(str(tmp_path)).get_or_create_collection("log")
+    assert reopened.get(include=['metadatas'])['metadatas'] == [{'row': i} for i in range(40)]
+    reopened.add(ids=["id40"], documents=["doc"], metadatas=[{'row': 40}], embeddings=vectors[:1])
+    reopened.delete(ids=["id0"])
+    again = NumpyBackend(str(tmp_path)).get_or_create_collection("log")
+    assert again.get()['ids'] == [f"id{i}" for i in range(1, 41)]
+    assert again.query(vectors[5:6], n_results=1)['ids'] == [["id5"]]
+    # The delete rewrote records.json and dropped the old log
+    assert not [name for name in os.listdir(again.directory) if name.endswith(".log")]
+
+def test_hnsw_parameters_are_stored_with_the_collection(tmp_path):
+    assert parse_hnsw("M=32, search_ef=50") == {'M': 32, 'search_ef': 50}
+    assert parse_hnsw("") == {}
+    
+    store = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                        embedding_function=HashingEmbeddingFunction(), hnsw={'M': 32, 'search_ef': 50})
+    store.populate_store(STORIES)
+    hnsw = store.collection.configuration['hnsw']
+    assert (hnsw['max_neighbors'], hnsw['ef_search']) == (32, 50)
+    assert store.get_stats()['hnsw'] == {'M': 32, 'search_ef': 50}
+    
+    # search_ef can change on an existing collection; the graph keeps its M
+    reopened = VectorStore(persist_directory=str(tmp_path / "chromadb"),
+                           embedding_function=HashingEmbeddingFunction(), hnsw={'M': 16, 'search_ef': 80})
+    hnsw = reopened.collection.configuration['hnsw']
+    assert (hnsw['max_neighbors'], hnsw['ef_search']) == (32, 80)
+    assert reopened.get_stats()['hnsw'] == {'M': 32, 'search_ef': 80}
+    assert reopened.collection.count() == store.collection.count()
+
+def test_sharded_store_matches_unsharded_search(tmp_path):
+    single = VectorStore(persist_directory=str(tmp_path / "single"),
+                         embedding_function=HashingEmbeddingFunction(), backend='numpy')
+    single.populate_store(STORIES)
+    for shard_by in ['source', 'industry']:
+        store = VectorStore(persist_directory=str(tmp_path / shard_by), embedding_function=HashingEmbeddingFunction(),
+                            backend='numpy', shards=4, shard_by=shard_by)
+        store.populate_store(STORIES)
+        assert store.collection.count() == single.collection.count()
+        assert sum(store.get_stats()['shards']) == store.collection.count()
+        
+        # Merged shard results are the global top-k (near-duplicate chunks may swap places)
+        queries = store.embed_queries(QUESTIONS)
+        sharded = store.collection.query(query_embeddings=queries, n_results=5)
+        unsharded = single.collection.query(query_embeddings=queries, n_results=5)
+        assert np.allclose(sharded['distances'], unsharded['distances'], atol=1e-6)
+        assert [len(results) for results in store.similarity_search_batch(QUESTIONS, k=5)] == [5] * len(QUESTIONS)
+        
+        where = {'industry': 'Logistics'}
+        assert all(d.metadata['industry'] == 'Logistics'
+                   for results in store.similarity_search_batch(QUESTIONS, k=4, where=where) for d in results)
+        assert len(store.collection.targets(where)) == (1 if shard_by == 'industry' else 4)
+    
+    # An update rewrites only the story's own shard
+    shard = store.collection.shard_for({'industry': STORIES[2]['industry']})
+    untouched = [s._snapshot for i, s in enumerate(store.collection.shards) if i != shard]
+    store.add_or_update_stories([dict(STORIES[2], content="Tachograph data.")])
+    assert [s._snapshot for i, s in enumerate(store.collection.shards) if i != shard] == untouched
+    assert store.similarity_search("tachograph", k=1)[0].page_content == "Tachograph data."
+    assert store.collection.count() == sum(s.count() for s in store.collection.shards)
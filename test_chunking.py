@@ -0,0 +1,57 @@
+import random
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunking import DEFAULT_SEPARATORS, OffsetTextSplitter, sentence_chunk_spans
+from embeddings import HashingEmbeddingFunction, RegexTokenizer
+from test_batch_retrieval import STORIES
+from utils import chunk_text
+from vector_store import VectorStore
+
+def random_texts(n=150, seed=0):
+    rng = random.Random(seed)
+    pieces = ["fleet", "safety", " ", "  ", "\n", "\n\n", "\n\n\n", ".", "..", "!", "?", "x" * 60, " " * 20]
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 400))) for _ in range(n)]
+
+@pytest.mark.parametrize("size,overlap", [(1000, 200), (100, 20), (40, 40), (7, 3), (1, 0)])
+def test_offset_splitter_matches_recursive_splitter(size, overlap):
+    reference = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap,
+                                               separators=DEFAULT_SEPARATORS)
+    splitter = OffsetTextSplitter(size, overlap)
+
+    for text in random_texts():
+        assert splitter.split_text(text) == reference.split_text(text)
+
+def test_spans_index_the_source_and_sentence_chunks_match_chunk_text():
+    text = "Samsara cut idling. " * 80 + "\n\nDrivers improved!\nSafety scores rose?"
+    for start, end in OffsetTextSplitter(200, 50).split_spans(text):
+        assert 0 <= start < end <= len(text)
+        assert text[start:end] == text[start:end].strip()
+
+    for text in random_texts(seed=1) + [text]:
+        for size, overlap in [(200, 50), (1000, 200)]:
+            spans = sentence_chunk_spans(text, size, overlap)
+            assert [text[start:end] for start, end in spans] == chunk_text(text, size, overlap)
+
+    with pytest.raises(ValueError):
+        OffsetTextSplitter(100, 200)
+
+def test_token_chunks_fit_the_embedding_window(tmp_path):
+    tokenizer = RegexTokenizer(max_tokens=64)
+    text = STORIES[0]['content']
+    starts = [start for start, _ in tokenizer.offsets([text])[0]]
+    chunks = OffsetTextSplitter(64, 16).split_text(text, starts)
+    assert len(chunks) > 1
+    assert max(tokenizer.count(chunks)) <= 64
+
+    store = VectorStore(persist_directory=str(tmp_path / "chromadb"), embedding_function=HashingEmbeddingFunction(),
+                        granularities=[(64, 16), (1000, 200)], chunk_unit="tokens")
+    # Sizes past the window are capped; the default granularity fills it
+    assert store.granularities == [(64, 16), (256, 51)]
+    store.populate_store(STORIES)
+
+    documents = store.collections[(64, 16)].get(where={'content_type': 'main_content'})['documents']
+    assert max(RegexTokenizer().count(documents)) <= 64
+    assert store.for_granularity(60, 16).granularity == (64, 16)
+    assert store.similarity_search("idling", k=2)
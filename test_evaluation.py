@@ -0,0 +1,114 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from evaluation import EvaluationMetrics
+from perf_store import PerformanceStore
+from sketches import QuantileSketch, RollingWindow
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    values = np.random.default_rng(0).lognormal(mean=0.0, sigma=1.0, size=20000)
+    first, second = QuantileSketch(0.01), QuantileSketch(0.01)
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(float(value))
+    first.merge(second)
+
+    assert first.count == len(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = np.percentile(values, q * 100, method='lower')
+        assert abs(first.quantile(q) - exact) <= 0.02 * exact
+    assert abs(first.count_at_most(1.0) - int((values <= 1.0).sum())) <= 0.01 * len(values)
+
+def test_rolling_window_expires_old_buckets():
+    window = RollingWindow(bucket_seconds=60, retention_buckets=3)
+    for minute in range(10):
+        window.add('naive', 1.0 + minute, 10, 3, minute * 60)
+
+    assert sorted(window.buckets) == [420, 480, 540]
+    assert window.window(480)['naive'].count == 2
+    assert [row['bucket_start'] for row in window.series(0)] == [420, 480, 540]
+
+def test_summary_covers_all_history_beyond_recent_entries():
+    metrics = EvaluationMetrics(recent_entries=10)
+    now = datetime.now()
+    for i in range(200):
+        strategy = 'naive' if i % 2 else 'hybrid'
+        timestamp = now - timedelta(hours=48) if i < 100 else now - timedelta(seconds=200 - i)
+        metrics.log_query_performance(f"q{i}", strategy, 0.1 * (i % 10 + 1), 100 + i, 3, {},
+                                      timestamp=timestamp)
+
+    assert len(metrics.performance_data) == 10
+    summary = metrics.get_performance_summary()
+    assert summary['total_queries'] == 200
+    assert summary['strategy_breakdown']['naive']['count'] == 100
+    assert abs(summary['avg_response_time'] - 0.55) < 1e-9
+    assert abs(summary['median_response_time'] - 0.5) <= 0.02 * 0.5
+    assert summary['min_response_time'] == 0.1 and summary['max_response_time'] == 1.0
+
+    recent = metrics.get_performance_summary(strategy='naive', time_range_hours=1)
+    assert recent['total_queries'] == 50
+    assert set(recent['strategy_breakdown']) == {'naive'}
+
+    comparison = metrics.compare_strategies(['naive', 'hybrid', 'agentic'])
+    assert comparison['hybrid']['query_count'] == 100
+    assert comparison['agentic']['query_count'] == 0
+    assert metrics.evaluate_response_latency(0.5)['within_target'] == 100
+    assert metrics.get_token_usage_analysis()['strategy_token_usage']['hybrid']['min_tokens'] == 100
+
+    metrics.clear_performance_data()
+    assert metrics.get_performance_summary()['total_queries'] == 0
+
+def test_concurrent_sessions_log_every_query():
+    metrics = EvaluationMetrics(recent_entries=100)
+    threads, per_thread = 8, 250
+    barrier = threading.Barrier(threads)
+
+    def session(n):
+        barrier.wait()
+        for i in range(per_thread):
+            metrics.log_query_performance(f"q{n}-{i}", f"s{i % 3}", 0.1, 10, 3, {})
+            if i % 50 == 0:
+                metrics.get_performance_summary(time_range_hours=1)
+
+    workers = [threading.Thread(target=session, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    summary = metrics.get_performance_summary()
+    assert summary['total_queries'] == threads * per_thread
+    assert summary['total_tokens_used'] == threads * per_thread * 10
+    assert len(metrics.performance_data) == 100
+
+def test_performance_store_filters_and_exports_columns():
+    store = PerformanceStore(capacity=2)
+    now = datetime.now()
+    config = {'top_k': 5, 'chunk_size': 1000}
+    for i in range(9):
+        store.append(f"q{i}", 'naive' if i % 3 else 'hybrid', 0.1 * i, 10 * i, 3, dict(config),
+                     timestamp=now - timedelta(hours=9 - i))
+
+    assert len(store) == 9 and store.strategies == ['hybrid', 'naive']
+    assert len(store.configs) == 1
+    assert store.mask(strategy='hybrid').sum() == 3
+    assert store.mask(strategy='hybrid', since=now - timedelta(hours=4)).sum() == 1
+    assert store.mask(strategy='agentic').sum() == 0
+    assert [row['query'] for row in store.slowest(2)] == ['q8', 'q7']
+    assert store.recent(1)[0]['config'] == config
+
+    df = store.to_pandas()
+    assert list(df['strategy'].cat.categories) == ['hybrid', 'naive']
+    assert df['top_k'].tolist() == [5] * 9
+    assert np.shares_memory(df['response_time'].to_numpy(), store.column('response_time'))
+
+    table = store.to_arrow(store.mask(strategy='naive'))
+    assert table.num_rows == 6
+    assert table.column('strategy').to_pylist() == ['naive'] * 6
+
+    bounded = PerformanceStore(capacity=2, max_rows=8)
+    for i in range(20):
+        bounded.append(f"q{i}", 'naive', 1.0, 1, 1)
+    assert len(bounded) == 8 and bounded.recent(1)[0]['query'] == 'q19'
+    assert bounded.column('query').tolist() == [f"q{i}" for i in range(12, 20)]
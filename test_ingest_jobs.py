@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import socket
+import threading
+
+import pytest
+
+from embeddings import HashingEmbeddingFunction
+from ingest_jobs import IngestRunner, parse_interval
+from vector_store import VectorStore
+from test_batch_retrieval import STORIES, QUESTIONS
+
+class FakeScraper:
+    """Serves a fixed list of stories like SamsaraCustomerScraper, optionally pausing partway"""
+
+    def __init__(self, stories, pause_after=None):
+        self.stories = stories
+        self.pause_after = pause_after
+        self.paused = threading.Event()
+        self.release = threading.Event()
+        self.fetched = []
+
+    def __call__(self, progress):
+        self.progress = progress
+        return self
+
+    def scrape_customer_stories(self, skip_urls=(), on_story=None, should_stop=None):
+        scraped = []
+        for i, story in enumerate(self.stories, 1):
+            if i - 1 == self.pause_after:
+                self.paused.set()
+                self.release.wait(10)
+            if should_stop():
+                break
+            if story['url'] in skip_urls:
+                continue
+            self.fetched.append(story['url'])
+            scraped.append(story)
+            on_story(story)
+            self.progress.progress(i / len(self.stories))
+        return scraped
+
+def test_jobs_index_in_the_background_and_resume_after_cancel(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), HashingEmbeddingFunction(), backend="numpy")
+    store.populate_store(STORIES[:2])
+    jobs_dir = str(tmp_path / "jobs")
+
+    scraper = FakeScraper(STORIES, pause_after=3)
+    runner = IngestRunner(store, jobs_dir, scraper_factory=scraper, batch_size=2)
+    job = runner.submit('update')
+    assert runner.submit('refresh')['id'] == job['id']
+
+    # Mid-crawl the current index keeps serving, and the job reports where it is
+    assert scraper.paused.wait(10)
+    assert all(store.similarity_search_batch(QUESTIONS, k=3))
+    assert runner.get(job['id'])['status'] == 'running'
+    assert runner.cancel(job['id'])
+    scraper.release.set()
+    cancelled = runner.wait(job['id'], timeout=30)
+    assert cancelled['status'] == 'cancelled'
+    assert cancelled['scraped'] == 3 and not cancelled['scrape_complete']
+    assert len(store.full_documents) == 2
+
+    # Resuming fetches only the stories not yet scraped
+    scraper.pause_after = None
+    runner.resume(job['id'])
+    done = runner.wait(job['id'], timeout=30)
+    assert done['status'] == 'succeeded', done
+    assert scraper.fetched == [story['url'] for story in STORIES]
+    assert done['indexed'] == len(STORIES) and done['unchanged'] == 2
+    assert set(store.full_documents) == {story['url'] for story in STORIES}
+    assert 0 < done['progress'] == 1.0 and done['messages']
+
+    # A refresh re-indexes everything and drops stories no longer published
+    scraper.stories = STORIES[1:]
+    refreshed = runner.wait(runner.submit('refresh')['id'], timeout=30)
+    assert refreshed['status'] == 'succeeded' and refreshed['removed'] == 1
+    assert set(store.full_documents) == {story['url'] for story in STORIES[1:]}
+    assert not store.collection.get(where={'source': STORIES[0]['url']})['ids']
+    assert [j['id'] for j in runner.jobs()] == [refreshed['id'], job['id']]
+    runner.stop()
+
+def test_scheduled_jobs_are_submitted_every_interval(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), HashingEmbeddingFunction(), backend="numpy")
+    jobs_dir = str(tmp_path / "jobs")
+    assert IngestRunner(store, jobs_dir, scraper_factory=FakeScraper(STORIES)).next_scheduled() is None
+
+    runner = IngestRunner(store, jobs_dir, scraper_factory=FakeScraper(STORIES[:2]), interval=0.2)
+    assert runner.next_scheduled() == pytest.approx(time.time() + 0.2, abs=0.1)
+    runner.start()
+    deadline = time.monotonic() + 10
+    while not runner.jobs() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    job = runner.wait(runner.jobs()[-1]['id'], timeout=30)
+    runner.stop(timeout=30)
+
+    assert job['trigger'] == 'schedule' and job['kind'] == 'update'
+    assert job['status'] == 'succeeded' and job['indexed'] == 2
+    assert set(store.full_documents) == {story['url'] for story in STORIES[:2]}
+    # The next run is due one interval after the latest job was created
+    latest = runner.jobs(limit=1)[0]
+    assert runner.next_scheduled() == latest['created'] + 0.2
+
+def test_stopping_cancels_the_running_job(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), HashingEmbeddingFunction(), backend="numpy")
+    scraper = FakeScraper(STORIES, pause_after=2)
+    runner = IngestRunner(store, str(tmp_path / "jobs"), scraper_factory=scraper)
+    job = runner.submit('update')
+    assert scraper.paused.wait(10)
+
+    scraper.release.set()
+    runner.stop(timeout=30)
+    assert not runner._worker.is_alive()
+    stopped = runner.get(job['id'])
+    assert stopped['status'] == 'cancelled' and len(store.full_documents) == 0
+    with pytest.raises(RuntimeError):
+        runner.submit('update')
+    with pytest.raises(RuntimeError):
+        runner.resume(job['id'])
+    assert [j['id'] for j in runner.jobs()] == [job['id']]
+
+def test_jobs_left_running_by_a_dead_process_are_interrupted(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), HashingEmbeddingFunction(), backend="numpy")
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    for job_id, pid in [("dead", 2 ** 22 + 1), ("alive", os.getpid())]:
+        (jobs_dir / f"{job_id}.json").write_text(json.dumps({
+            'id': job_id, 'kind': 'update', 'trigger': 'manual', 'status': 'running', 'created': 0.0,
+            'host': socket.gethostname(), 'pid': pid}))
+
+    runner = IngestRunner(store, str(jobs_dir), scraper_factory=FakeScraper(STORIES))
+    assert runner.get("dead")['status'] == 'interrupted'
+    assert runner.get("alive")['status'] == 'running'
+
+def test_parse_interval():
+    assert parse_interval("") is None
+    assert parse_interval("90") == 90
+    assert parse_interval("30m") == 1800
+    assert parse_interval("6h") == 6 * 3600
+    with pytest.raises(ValueError):
+        parse_interval("soon")
@@ -0,0 +1,58 @@
+import pytest
+
+from llm_backend import LLMResponse, SimulatedLLMBackend, create_llm_backend
+from observability import ObservabilityTracker
+from rag_engine import RAGEngine
+from test_batch_retrieval import make_store
+
+MESSAGES = [
+    {'role': 'system', 'content': "You are helpful."},
+    {'role': 'user', 'content': "--- Source 1: Company 1 (Logistics) ---\nURL: x\nContent: idling\n\nUser Question: idling?"}
+]
+
+def test_simulated_backend_is_deterministic():
+    llm = SimulatedLLMBackend(sleep=False, completion_tokens=30)
+    first = llm.complete(MESSAGES)
+    second = llm.complete(MESSAGES)
+
+    assert first == second
+    assert "Company 1" in first.text
+    assert first.completion_tokens == 30
+    assert first.total_tokens == first.prompt_tokens + first.completion_tokens
+
+    # Latency is sampled per prompt, so it is reproducible too
+    assert llm._plan(MESSAGES, None)[1] == llm._plan(MESSAGES, None)[1]
+
+def test_simulated_stream_matches_complete():
+    llm = SimulatedLLMBackend(latency="fixed", latency_ms=20, completion_tokens=10)
+    chunks = list(llm.stream(MESSAGES))
+
+    assert isinstance(chunks[-1], LLMResponse)
+    assert "".join(chunks[:-1]) == chunks[-1].text == llm.complete(MESSAGES).text
+
+def test_simulated_latency_distributions():
+    samples = SimulatedLLMBackend(latency="empirical", latency_samples_ms=[100, 200], sleep=False)
+    assert samples._plan(MESSAGES, None)[1] in (0.1, 0.2)
+
+    with pytest.raises(ValueError):
+        SimulatedLLMBackend(latency="empirical")
+    with pytest.raises(RuntimeError):
+        SimulatedLLMBackend(failure_rate=1.0, sleep=False).complete(MESSAGES)
+
+def test_engine_runs_offline_with_simulated_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_LLM_BACKEND", "simulated")
+    llm = create_llm_backend(sleep=False)
+    assert isinstance(llm, SimulatedLLMBackend)
+
+    engine = RAGEngine(vector_store=make_store(tmp_path), obs_tracker=ObservabilityTracker(), llm=llm)
+
+    for strategy in ['naive', 'parent_document', 'hybrid', 'agentic']:
+        response = engine.query("How did Company 1 reduce idling?", {'strategy': strategy, 'top_k': 3})
+        assert response['answer'].startswith("Simulated answer")
+        assert response['tokens_used'] > 0
+
+    events = list(engine.query_stream("How did Company 1 reduce idling?", {'top_k': 3}))
+    done = events[-1]
+    assert done['event'] == 'done'
+    assert done['answer'] == "".join(e['text'] for e in events if e['event'] == 'token')
+    assert done['completion_tokens'] > 0
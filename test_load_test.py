@@ -0,0 +1,32 @@
+from benchmarks.load_test import EngineTarget, run_load_test
+from llm_backend import SimulatedLLMBackend
+from observability import ObservabilityTracker
+from rag_engine import RAGEngine
+from test_batch_retrieval import QUESTIONS, make_store
+
+def make_engine(tmp_path, **llm_kwargs):
+    llm = SimulatedLLMBackend(latency="fixed", latency_ms=5, **llm_kwargs)
+    return RAGEngine(vector_store=make_store(tmp_path), obs_tracker=ObservabilityTracker(), llm=llm)
+
+def test_closed_loop_reports_every_strategy(tmp_path):
+    target = EngineTarget(make_engine(tmp_path))
+    report = run_load_test(target, QUESTIONS, concurrency=3, requests=9, config={'top_k': 3})
+
+    assert report['mode'] == 'closed'
+    assert set(report['strategies']) == {'naive', 'parent_document', 'hybrid', 'agentic'}
+    for stats in report['strategies'].values():
+        assert stats['requests'] == 9
+        assert stats['error_rate'] == 0.0
+        assert stats['throughput_qps'] > 0
+        assert stats['latency']['p50_ms'] <= stats['latency']['p99_ms']
+        assert stats['stages']['llm']['p50_ms'] >= 5
+        assert 'ann_search' in stats['stages']
+
+def test_open_loop_counts_errors(tmp_path):
+    target = EngineTarget(make_engine(tmp_path, failure_rate=1.0))
+    report = run_load_test(target, QUESTIONS, strategies=['naive'], qps=50, requests=5)
+
+    stats = report['strategies']['naive']
+    assert report['mode'] == 'open'
+    assert stats['errors'] == 5 and stats['error_rate'] == 1.0
+    assert stats['sample_errors'] == ["Simulated LLM failure"]
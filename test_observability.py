@@ -0,0 +1,275 @@
+import time
+import threading
+
+from llm_backend import SimulatedLLMBackend
+from observability import ObservabilityTracker
+from perf_log import PerformanceLog
+from telemetry import TelemetryExporter
+from rag_engine import RAGEngine
+from test_batch_retrieval import make_store
+from tracing import span
+from trace_store import TraceArchive
+
+def make_engine(tmp_path, tracker):
+    llm = SimulatedLLMBackend(sleep=False)
+    return RAGEngine(vector_store=make_store(tmp_path), obs_tracker=tracker, llm=llm)
+
+def test_query_records_nested_stage_spans(tmp_path):
+    tracker = ObservabilityTracker(stage_spans=True)
+    engine = make_engine(tmp_path, tracker)
+
+    response = engine.query("How did Company 1 reduce idling?", {'strategy': 'hybrid', 'top_k': 3})
+    spans = tracker.get_trace(response['trace_id'])['spans']
+    by_name = {s['name']: s for s in spans}
+
+    assert {'retrieval', 'embedding', 'ann_search', 'parent_assembly', 'dedup',
+            'context_build', 'llm'} <= set(by_name)
+    assert by_name['ann_search']['parent'] == 'retrieval'
+    assert by_name['ann_search']['attributes']['candidates'] > 0
+    assert by_name['retrieval']['attributes']['documents'] > 0
+    assert by_name['context_build']['attributes']['prompt_chars'] > 0
+    assert by_name['llm']['attributes']['prompt_tokens'] == response['prompt_tokens']
+
+    summary = tracker.get_metrics_summary()
+    assert summary['stage_breakdown']['llm']['count'] == 1
+
+def test_streamed_query_records_generation_stages(tmp_path):
+    tracker = ObservabilityTracker(stage_spans=True)
+    engine = make_engine(tmp_path, tracker)
+
+    events = list(engine.query_stream("Which logistics customers use Samsara?", {'top_k': 3}))
+    stages = tracker.get_stage_durations(events[0]['trace_id'])
+
+    assert {'retrieval', 'ann_search', 'context_build', 'llm'} <= set(stages)
+
+def test_disabled_spans_record_nothing(tmp_path):
+    tracker = ObservabilityTracker(stage_spans=False)
+    engine = make_engine(tmp_path, tracker)
+
+    response = engine.query("How did Company 1 reduce idling?", {'top_k': 3})
+    assert tracker.get_trace(response['trace_id'])['spans'] == []
+
+    # Outside any trace, span() is a shared no-op
+    with span('embedding') as stage:
+        stage.set(queries=1)
+    assert span('a') is span('b')
+
+def run_queries(tracker, n, strategy='naive'):
+    for i in range(n):
+        trace_id = tracker.start_trace(f"question {i}", {'strategy': strategy})
+        if i % 5 == 4:
+            tracker.log_error(trace_id, "boom")
+        else:
+            tracker.end_trace(trace_id, {'tokens_used': 10}, 3)
+
+def test_ring_buffer_rolls_old_traces_to_archive(tmp_path):
+    tracker = ObservabilityTracker(capacity=10, archive_dir=str(tmp_path / "traces"))
+    tracker.archive.segment_records = 20
+    tracker.archive.flush_every = 7
+
+    run_queries(tracker, 55)
+    run_queries(tracker, 5, strategy='hybrid')
+
+    assert len(tracker.traces) == 10 and len(tracker.metrics) == 10
+    assert len(tracker.archive.segments()) == 3
+
+    # Aggregates cover everything, not just the in-memory window
+    summary = tracker.get_metrics_summary()
+    assert summary['total_queries'] == 60
+    assert summary['successful_queries'] == 48
+    assert summary['strategy_breakdown']['naive']['count'] == 55
+    assert summary['strategy_breakdown']['hybrid']['avg_tokens'] == 8
+
+    queries = [t['query'] for t in tracker.iter_traces()]
+    assert len(queries) == 60 and queries[0] == "question 0"
+
+    tracker.archive.convert_to_parquet()
+    assert any(path.endswith('.parquet') for path in tracker.archive.segments())
+    assert [t['query'] for t in tracker.iter_traces()] == queries
+
+    tracker.clear_data()
+    assert tracker.get_metrics_summary()['total_queries'] == 0
+    assert list(tracker.iter_traces()) == []
+
+def test_archive_retention_bounds_segments(tmp_path):
+    tracker = ObservabilityTracker(capacity=1, archive_dir=str(tmp_path / "traces"))
+    tracker.archive.segment_records = 5
+    tracker.archive.flush_every = 1
+    tracker.archive.max_segments = 2
+
+    run_queries(tracker, 31)
+
+    assert len(tracker.archive.segments()) == 2
+    assert len(list(tracker.archive.iter_records())) == 10
+
+    # Reopening continues the sequence instead of reusing a surviving segment's number
+    archive = TraceArchive(str(tmp_path / "traces"))
+    archive.append({'trace_id': 'reopened'})
+    archive.flush()
+    assert len(archive.segments()) == 3
+    assert archive.segments()[-1].endswith("-000006.jsonl.gz")
+
+def test_exporter_never_blocks_and_counts_drops():
+    release = threading.Event()
+    exported = []
+
+    def slow_sink(batch):
+        release.wait(5)
+        exported.extend(batch)
+
+    exporter = TelemetryExporter(slow_sink, max_queue=10, batch_size=5, flush_interval=0.01)
+    start = time.perf_counter()
+    for i in range(100):
+        exporter.emit('event', i=i)
+    assert time.perf_counter() - start < 0.5
+
+    release.set()
+    assert exporter.flush()
+    stats = exporter.stats()
+    assert stats['dropped'] > 0
+    assert stats['exported'] == len(exported) == stats['enqueued']
+    exporter.close()
+
+def test_concurrent_emits_respect_the_bound_and_count_every_event():
+    release = threading.Event()
+    exporter = TelemetryExporter(lambda batch: release.wait(5), max_queue=50, batch_size=1000,
+                                 flush_interval=60)
+    threads, per_thread = 8, 500
+    barrier = threading.Barrier(threads)
+
+    def emit():
+        barrier.wait()
+        for i in range(per_thread):
+            exporter.emit('event', i=i)
+
+    workers = [threading.Thread(target=emit) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    stats = exporter.stats()
+    assert stats['queued'] == stats['enqueued'] == 50
+    assert stats['enqueued'] + stats['dropped'] == threads * per_thread
+    release.set()
+    exporter.close()
+
+def test_tracker_exports_in_background_and_flushes_on_close(tmp_path):
+    batches = []
+
+    def failing_then_recording_sink(batch):
+        if not batches:
+            batches.append(None)
+            raise ConnectionError("collector unavailable")
+        batches.append(batch)
+
+    exporter = TelemetryExporter(failing_then_recording_sink, batch_size=2, flush_interval=0.01)
+    tracker = ObservabilityTracker(exporter=exporter)
+    engine = make_engine(tmp_path, tracker)
+
+    # Export failures surface as counters, never as query errors
+    engine.query("How did Company 1 reduce idling?", {'top_k': 3})
+    engine.query("Which logistics customers use Samsara?", {'top_k': 3})
+    tracker.close()
+
+    names = {event['name'] for batch in batches[1:] for event in batch}
+    assert 'rag_query_complete' in names and 'retrieval_step_llm' in names
+    telemetry = tracker.get_metrics_summary()['telemetry']
+    assert telemetry['export_errors'] == 1
+    assert telemetry['queued'] == 0
+
+def test_tail_sampling_keeps_slow_and_failed_traces():
+    tracker = ObservabilityTracker(sample_rate=0.0, slow_threshold=0.05)
+
+    fast = tracker.start_trace("fast", {'strategy': 'naive'})
+    tracker.end_trace(fast, {'tokens_used': 1}, 1)
+
+    slow = tracker.start_trace("slow", {'strategy': 'naive'})
+    time.sleep(0.06)
+    tracker.end_trace(slow, {'tokens_used': 1}, 1)
+
+    failed = tracker.start_trace("failed", {'strategy': 'hybrid'})
+    tracker.log_error(failed, "boom")
+
+    assert tracker.get_trace(fast) is None
+    assert tracker.get_trace(slow)['kept_because'] == 'slow'
+    assert tracker.get_trace(failed)['kept_because'] == 'error'
+
+    # Dropped traces still count toward the aggregates
+    summary = tracker.get_metrics_summary()
+    assert summary['total_queries'] == 3
+    assert summary['sampling'] == {'head': 0, 'slow': 1, 'error': 1, 'dropped': 1}
+
+def test_detailed_mode_records_payload_sizes_for_head_sampled_traces(tmp_path):
+    detailed = ObservabilityTracker(detailed=True)
+    engine = make_engine(tmp_path, detailed)
+    response = engine.query("How did Company 1 reduce idling?", {'strategy': 'parent_document', 'top_k': 3})
+    by_name = {s['name']: s['attributes'] for s in detailed.get_trace(response['trace_id'])['spans']}
+
+    assert by_name['ann_search']['result_chars'] > 0
+    assert by_name['parent_assembly']['result_chars'] > 0
+    assert by_name['llm']['answer_chars'] == len(response['answer'])
+
+    plain = ObservabilityTracker(detailed=False)
+    engine.obs_tracker = plain
+    response = engine.query("How did Company 1 reduce idling?", {'strategy': 'parent_document', 'top_k': 3})
+    by_name = {s['name']: s['attributes'] for s in plain.get_trace(response['trace_id'])['spans']}
+
+    assert 'result_chars' not in by_name['ann_search']
+    assert 'answer_chars' not in by_name['llm']
+
+def test_performance_log_is_durable_queryable_and_compacts(tmp_path):
+    log = PerformanceLog(str(tmp_path / "perf"), flush_interval=0.01)
+    tracker = ObservabilityTracker(sample_rate=0.0, perf_log=log)
+    run_queries(tracker, 10)
+    run_queries(tracker, 5, strategy='hybrid')
+
+    # Ten days ago, in its own partition
+    old = time.time() - 10 * 86400
+    for i in range(4):
+        log.append(old + i, f"old {i}", 'naive', 'completed', 0.5, tokens_used=20, intent='factoid')
+    tracker.close()
+
+    # A new process sees everything the old one wrote
+    log = PerformanceLog(str(tmp_path / "perf"))
+    assert len(log.partitions()) == 2
+    groups = log.summarize()
+    assert groups['naive']['stats'].count == 12 and groups['naive']['errors'] == 2
+    assert groups['hybrid']['errors'] == 1
+    assert log.summarize(by='intent')['factoid']['stats'].count == 4
+    assert len(log.query(since=time.time() - 3600, strategy='hybrid')) == 5
+    assert log.query(limit=1, newest_first=True)[0]['query'] == "question 4"
+    assert len(log.to_store(strategy='naive')) == 12
+
+    oldest = log.partitions()[0]
+    assert log.compact(older_than_days=7) == [oldest]
+    assert len(log.partitions()) == 1
+    groups = log.summarize()
+    assert groups['naive']['stats'].count == 12
+    assert abs(groups['naive']['stats'].response_times.quantile(1.0) - 0.5) < 0.01
+    assert log.summarize(since=time.time() - 3600)['naive']['stats'].count == 8
+    assert sum(row['count'] for row in log.timeseries(bucket_seconds=86400)) == 16
+
+    log.clear()
+    assert log.summarize() == {}
+    log.close()
+
+def test_performance_log_compacts_on_open_and_as_days_roll_over(tmp_path):
+    old = time.time() - 10 * 86400
+    log = PerformanceLog(str(tmp_path / "perf"), flush_interval=0.01)
+    log.append(old, "old", 'naive', 'completed', 0.5)
+    log.close()
+    assert len(PerformanceLog(str(tmp_path / "perf")).partitions()) == 1
+
+    # Opened with a shorter retention, the old partition is rolled up straight away
+    log = PerformanceLog(str(tmp_path / "perf"), raw_retention_days=7, flush_interval=0.01)
+    assert log.partitions() == []
+    assert log.summarize()['naive']['stats'].count == 1
+
+    # The writer compacts again whenever it starts a new day's partition
+    log.append(old + 86400, "older", 'naive', 'completed', 0.5)
+    log.append(time.time(), "new", 'naive', 'completed', 0.5)
+    assert log.flush()
+    assert log.partitions() == [time.strftime("%Y%m%d", time.gmtime())]
+    assert log.summarize()['naive']['stats'].count == 3
+    log.close()
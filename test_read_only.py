@@ -0,0 +1,166 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from embeddings import HashingEmbeddingFunction
+from index_lock import WriterLock, read_active_index, read_generation
+from progress import ProgressCallback
+from vector_backends import ReadOnlyError
+from vector_store import VectorStore
+from test_batch_retrieval import STORIES, QUESTIONS
+
+def file_state(directory):
+    """Every file under directory with its size and mtime, except SQLite's own journal files"""
+    state = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(("-wal", "-shm")):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            state[path] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_read_only_store_never_touches_files_and_reloads_new_generations(tmp_path, backend):
+    persist_directory = str(tmp_path / "index")
+
+    # Before anything is written a reader sees an empty index and creates nothing
+    empty = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    assert empty.similarity_search_batch(QUESTIONS, k=3) == [[], [], []]
+    assert not os.path.exists(persist_directory)
+
+    writer = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    writer.populate_store(STORIES[:3])
+    assert read_generation(persist_directory) == writer.generation == 1
+
+    before = file_state(persist_directory)
+    reader = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    assert reader.collection.count() == writer.collection.count()
+    assert all(reader.similarity_search_batch(QUESTIONS, k=3))
+    with pytest.raises(ReadOnlyError):
+        reader.add_or_update_stories(STORIES[3:])
+    with pytest.raises(ReadOnlyError):
+        reader.clear_store()
+    assert file_state(persist_directory) == before
+
+    # The reader keeps its snapshot until the writer publishes a new generation
+    writer.add_or_update_stories([dict(STORIES[1], content="Tachograph data.")])
+    assert writer.generation == 2
+    assert reader.reload_if_changed()
+    assert not reader.reload_if_changed()
+    assert reader.similarity_search("tachograph", k=1)[0].page_content == "Tachograph data."
+    assert reader.collection.count() == writer.collection.count()
+    assert reader.full_documents[STORIES[1]['url']]['content'] == "Tachograph data."
+    assert empty.reload_if_changed() and empty.collection.count() == writer.collection.count()
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_refresh_switches_to_a_complete_new_version(tmp_path, backend):
+    persist_directory = str(tmp_path / "index")
+    writer = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    writer.populate_store(STORIES[:3])
+    reader = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    before = reader.collection.count()
+    original = writer._backend_collection_names(writer.default_granularity)
+    
+    class ReaderProbe(ProgressCallback):
+        """Looks at the reader every time the rebuild reports progress"""
+        seen = set()
+        
+        def progress(self, fraction):
+            reader.reload_if_changed()
+            self.seen.add((writer.write_lock.depth, reader.version, reader.collection.count(),
+                           len(reader.full_documents)))
+    
+    # The new version is built without holding the writer lock, and readers
+    # only ever see the old one whole meanwhile
+    assert writer.refresh_store(STORIES[2:], progress=ReaderProbe())
+    assert ReaderProbe.seen == {(0, '', before, 3)}
+    
+    assert writer.version and reader.reload_if_changed() and reader.version == writer.version
+    assert reader.collection.count() == writer.collection.count() > 0
+    assert set(reader.full_documents) == {story['url'] for story in STORIES[2:]}
+    assert reader.similarity_search(QUESTIONS[2], k=1)[0].metadata['source'] == STORIES[4]['url']
+    
+    # The replaced version outlives the grace period for readers still on it
+    assert writer.collect_garbage() == []
+    assert writer.collect_garbage(grace=0) == ['']
+    reader.backend.reload()
+    assert all(reader.backend.get_or_create_collection(name).count() == 0 for name in original)
+    
+    # A version that fails validation is discarded and the live one kept
+    version, count = writer.version, writer.collection.count()
+    assert not writer.refresh_store([])
+    assert writer.version == version and writer.collection.count() == count
+    assert read_active_index(persist_directory) == {'version': version, 'building': [], 'retired': []}
+    reopened = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    assert reopened.version == version and reopened.collection.count() == count
+    assert set(reopened.full_documents) == set(reader.full_documents)
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_writable_stores_follow_each_others_switches(tmp_path, backend):
+    persist_directory = str(tmp_path / "index")
+    first = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    first.populate_store(STORIES[:3])
+    second = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    
+    # The second store writes into the version the first switched to, keeping its stories
+    assert first.refresh_store(STORIES[2:5])
+    second.add_or_update_stories([STORIES[5]])
+    assert second.version == first.version
+    expected = {story['url'] for story in STORIES[2:]}
+    assert set(second.full_documents) == expected
+    
+    reopened = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    assert reopened.version == first.version and set(reopened.full_documents) == expected
+    assert reopened.collection.count() == second.collection.count()
+    assert {metadata['source'] for metadata in reopened.collection.get()['metadatas']} == expected
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_writes_made_during_a_refresh_reach_the_new_version(tmp_path, backend):
+    persist_directory = str(tmp_path / "index")
+    writer = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    writer.populate_store(STORIES[:3])
+    other = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend)
+    
+    class ConcurrentWrites(ProgressCallback):
+        """Writes from this and another store while the new version is being built"""
+        
+        def emit(self, level, message):
+            if message.startswith("Processing and storing"):
+                other.add_or_update_stories([STORIES[5], dict(STORIES[3], content="Tachograph data.")])
+                writer.remove_stories([STORIES[2]['url']])
+    
+    assert writer.refresh_store(STORIES[2:5], progress=ConcurrentWrites())
+    expected = {story['url'] for story in STORIES[3:6]}
+    assert set(writer.full_documents) == expected
+    assert not [name for name in os.listdir(persist_directory) if name.startswith("pending_writes")]
+    
+    reopened = VectorStore(persist_directory, HashingEmbeddingFunction(), backend=backend, read_only=True)
+    assert reopened.version == writer.version and set(reopened.full_documents) == expected
+    assert {metadata['source'] for metadata in reopened.collection.get()['metadatas']} == expected
+    assert reopened.similarity_search("tachograph", k=1)[0].page_content == "Tachograph data."
+    assert reopened.collection.count() == writer.collection.count()
+
+def test_writer_lock_excludes_other_processes(tmp_path):
+    holder = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, time; from index_lock import WriterLock; "
+         f"lock = WriterLock({str(tmp_path)!r}); lock.acquire(); print('locked', flush=True); time.sleep(30)"],
+        stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        lock = WriterLock(str(tmp_path))
+        assert not lock.acquire(blocking=False)
+    finally:
+        holder.kill()
+        holder.wait()
+
+    # Released when the holder exits; reentrant within a process
+    assert lock.acquire(blocking=False)
+    with lock:
+        assert lock.depth == 2
+    lock.release()
+    assert lock.depth == 0
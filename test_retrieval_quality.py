@@ -0,0 +1,47 @@
+import math
+
+from benchmarks.retrieval_quality import (compare_to_baseline, format_table, ndcg_at_k, recall_at_k,
+                                          reciprocal_rank, run_benchmark, unique_sources)
+from observability import ObservabilityTracker
+from rag_engine import RAGEngine
+from test_batch_retrieval import STORIES, make_store
+
+def test_ranking_metrics():
+    ranked = unique_sources(['a', 'a', 'b', 'c', 'b', 'd'])
+    assert ranked == ['a', 'b', 'c', 'd']
+
+    assert recall_at_k(ranked, ['b', 'd'], 2) == 0.5
+    assert reciprocal_rank(ranked, ['c', 'd']) == 1 / 3
+    assert reciprocal_rank(ranked, ['z']) == 0.0
+    assert ndcg_at_k(ranked, ['a'], 3) == 1.0
+    assert math.isclose(ndcg_at_k(ranked, ['b'], 3), 1 / math.log2(3))
+
+def test_benchmark_scores_each_run_and_compares_to_baseline(tmp_path):
+    engine = RAGEngine(vector_store=make_store(tmp_path), obs_tracker=ObservabilityTracker())
+    dataset = {'version': 1, 'questions': [
+        {'question': "How did Company 1 reduce idling?", 'relevant': [STORIES[1]['url']]},
+        {'question': "Which logistics customers use Samsara?", 'relevant': [STORIES[0]['url'], STORIES[3]['url']]},
+    ]}
+
+    report = run_benchmark(engine, dataset, strategies=['naive', 'parent_document'], ks=[1, 3])
+    assert set(report['runs']) == {'naive/semantic', 'naive/keyword', 'naive/hybrid', 'parent_document/semantic'}
+    for run in report['runs'].values():
+        assert 0.0 <= run['recall@3'] <= 1.0 and 0.0 <= run['ndcg@1'] <= 1.0
+        assert run['p50_ms'] > 0
+
+    baseline = {'dataset_version': 1, 'runs': {'naive/semantic': dict(report['runs']['naive/semantic'], mrr=0.0)}}
+    rows = compare_to_baseline(report, baseline, metrics=['mrr', 'recall@3'])
+    by_run = {row['run']: row for row in rows}
+    assert by_run['naive/semantic']['mrr_delta'] == report['runs']['naive/semantic']['mrr']
+    assert by_run['naive/semantic']['recall@3_delta'] == 0.0
+    assert by_run['naive/keyword']['mrr_delta'] is None
+    assert "naive/semantic" in format_table(rows, metrics=['mrr', 'recall@3'])
+
+    # The default table follows the ks that were measured, and missing values read n/a
+    assert [key for key in compare_to_baseline(report, None)[0] if not key.endswith('_delta')] == \
+        ['run', 'recall@3', 'mrr', 'ndcg@3', 'p50_ms', 'p95_ms']
+    assert "n/a" in format_table(rows, metrics=['mrr', 'recall@5'])
+
+    # A baseline over another dataset version is ignored
+    rows = compare_to_baseline(report, dict(baseline, dataset_version=2), metrics=['mrr'])
+    assert all(row['mrr_delta'] is None for row in rows)
@@ -0,0 +1,117 @@
+import json
+import time
+import asyncio
+import threading
+from langchain_core.documents import Document
+from service import QueryService
+
+class RecordingEngine:
+    """Minimal engine exposing the interface the service calls"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+
+    def query(self, question, config, progress=None):
+        self._enter()
+        return {'answer': f"answer to {question}", 'sources': ['a'], 'tokens_used': 3,
+                'response_time': self.delay, 'context_length': 10}
+
+    def query_stream(self, question, config, progress=None):
+        progress.info("retrieving")
+        yield {'event': 'sources', 'sources': ['a']}
+        for word in ["hello", " world"]:
+            yield {'event': 'token', 'text': word}
+        yield {'event': 'done', 'answer': "hello world", 'sources': ['a']}
+
+    def retrieve(self, question, config, progress=None):
+        return [Document(page_content="chunk", metadata={'source': 'a'})]
+
+    def get_stats(self):
+        return {'vector_store': {'total_chunks': 1}, 'queries': {'total_queries': 0}}
+
+async def call(app, method, path, payload=None):
+    """Drive the ASGI app directly and collect the response"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path}, receive, send)
+    status = sent[0]['status']
+    content = b''.join(m.get('body', b'') for m in sent[1:])
+    return status, content
+
+def test_query_retrieve_and_stats():
+    app = QueryService(engine=RecordingEngine())
+
+    status, content = asyncio.run(call(app, 'POST', '/query', {'question': 'hi', 'config': {'strategy': 'naive'}}))
+    assert status == 200
+    assert json.loads(content)['answer'] == "answer to hi"
+
+    status, content = asyncio.run(call(app, 'POST', '/retrieve', {'question': 'hi'}))
+    assert status == 200
+    assert json.loads(content)['documents'] == [{'content': 'chunk', 'metadata': {'source': 'a'}}]
+
+    status, content = asyncio.run(call(app, 'GET', '/stats'))
+    assert status == 200
+    assert json.loads(content)['vector_store']['total_chunks'] == 1
+
+def test_stream_emits_ndjson_events_in_order():
+    app = QueryService(engine=RecordingEngine())
+
+    status, content = asyncio.run(call(app, 'POST', '/query/stream', {'question': 'hi'}))
+    events = [json.loads(line) for line in content.decode().splitlines()]
+
+    assert status == 200
+    assert [e['event'] for e in events] == ['progress', 'sources', 'token', 'token', 'done']
+    assert "".join(e['text'] for e in events if e['event'] == 'token') == events[-1]['answer']
+
+def test_bad_requests():
+    app = QueryService(engine=RecordingEngine())
+
+    assert asyncio.run(call(app, 'POST', '/query', {'config': {}}))[0] == 400
+    assert asyncio.run(call(app, 'GET', '/query'))[0] == 405
+    assert asyncio.run(call(app, 'GET', '/nope'))[0] == 404
+
+def test_concurrent_queries_share_one_engine():
+    engine = RecordingEngine(delay=0.2)
+    app = QueryService(engine=engine, max_workers=8)
+
+    async def burst():
+        return await asyncio.gather(*[
+            call(app, 'POST', '/query', {'question': f"q{i}"}) for i in range(8)
+        ])
+
+    start = time.time()
+    results = asyncio.run(burst())
+    elapsed = time.time() - start
+
+    assert all(status == 200 for status, _ in results)
+    assert engine.max_active > 1
+    assert elapsed < 8 * 0.2
+
+def test_engine_is_built_off_the_event_loop():
+    built_on = []
+
+    def factory():
+        built_on.append(threading.current_thread())
+        return RecordingEngine()
+
+    app = QueryService(engine_factory=factory)
+    assert asyncio.run(call(app, 'GET', '/stats'))[0] == 200
+    assert built_on and built_on[0] is not threading.main_thread()
@@ -0,0 +1,36 @@
+import threading
+from resources import get_shared_resources, reset_shared_resources
+
+def test_sessions_share_one_index(tmp_path):
+    """N concurrent sessions must all get the same engine, store and index"""
+
+    reset_shared_resources()
+    persist_directory = str(tmp_path / "chromadb")
+    num_sessions = 8
+
+    barrier = threading.Barrier(num_sessions)
+    session_resources = [None] * num_sessions
+
+    def session(i):
+        # Start all sessions at once to exercise the first-build race
+        barrier.wait()
+        session_resources[i] = get_shared_resources(persist_directory)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(num_sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    first = session_resources[0]
+    for resources in session_resources:
+        assert resources is first
+        assert resources.vector_store is first.vector_store
+        assert resources.vector_store.collection is first.vector_store.collection
+        assert resources.vector_store.full_documents is first.vector_store.full_documents
+        assert resources.rag_engine.vector_store is first.vector_store
+
+    # A later session still sees the same in-memory index
+    assert get_shared_resources(persist_directory).vector_store is first.vector_store
+
+    reset_shared_resources()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from embeddings import HashingEmbeddingFunction
+from snapshot import Snapshot, import_snapshot, open_snapshot
+from vector_backends import ReadOnlyError
+from vector_store import VectorStore
+from test_batch_retrieval import STORIES, QUESTIONS
+
+GRANULARITIES = [(500, 100), (1000, 200)]
+
+def test_snapshot_round_trip_without_re_embedding(tmp_path):
+    store = VectorStore(str(tmp_path / "source"), HashingEmbeddingFunction(), granularities=GRANULARITIES,
+                        shards=2)
+    store.populate_store(STORIES)
+    path = str(tmp_path / "index.ragsnap")
+    header = store.export_snapshot(path)
+    assert [c['count'] for c in header['collections']] == [store.collections[g].count() for g in GRANULARITIES]
+    
+    class CountingEmbedding(HashingEmbeddingFunction):
+        calls = 0
+        def __call__(self, input):
+            CountingEmbedding.calls += len(input)
+            return super().__call__(input)
+    
+    replica = open_snapshot(path, CountingEmbedding())
+    assert replica.read_only and replica.granularities == GRANULARITIES
+    assert replica.get_full_document(STORIES[2]['url']).page_content == \
+        store.get_full_document(STORIES[2]['url']).page_content
+    # Only the queries are embedded; chunk vectors come from the mapped file
+    view = replica.for_granularity(500, 100)
+    results = view.similarity_search_batch(QUESTIONS, k=3)
+    assert CountingEmbedding.calls == len(QUESTIONS)
+    expected = store.collections[(500, 100)].query(query_embeddings=store.embed_queries(QUESTIONS), n_results=3)
+    assert [[d.page_content for d in docs] for docs in results] == expected['documents']
+    with pytest.raises(ReadOnlyError):
+        replica.clear_store()
+    
+    imported = import_snapshot(path, str(tmp_path / "imported"), HashingEmbeddingFunction(), backend='numpy')
+    assert {g: c.count() for g, c in imported.collections.items()} == \
+        {g: c.count() for g, c in store.collections.items()}
+    assert imported.full_documents == replica.full_documents
+    records = imported.collection.get(include=['embeddings'])
+    snapshot_vectors = Snapshot(path).collections()[1]['vectors']
+    assert np.allclose(np.sort(np.asarray(records['embeddings']), axis=0), np.sort(snapshot_vectors, axis=0))
+
+def test_snapshot_rejects_corruption_and_other_models(tmp_path):
+    store = VectorStore(str(tmp_path / "source"), HashingEmbeddingFunction())
+    store.populate_store(STORIES[:2])
+    path = str(tmp_path / "index.ragsnap")
+    header = store.export_snapshot(path)
+    
+    class OtherModel(HashingEmbeddingFunction):
+        @staticmethod
+        def name():
+            return "other"
+    
+    with pytest.raises(ValueError, match="embedded with"):
+        open_snapshot(path, OtherModel())
+    
+    # Flip one byte of the first vector
+    position = Snapshot(path)._data_start + header['collections'][0]['vectors']['offset']
+    with open(path, 'r+b') as f:
+        f.seek(position)
+        byte = f.read(1)
+        f.seek(position)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError, match="checksum"):
+        Snapshot(path)
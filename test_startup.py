@@ -0,0 +1,22 @@
+from benchmarks.startup import DEFERRED_MODULES, parse_importtime, run_benchmark
+
+def test_parse_importtime():
+    """Nested records keep their depth and timings"""
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     json.decoder",
+        "import time:       300 |        420 |   json",
+        "import time:        50 |        470 | app",
+    ])
+    records = parse_importtime(stderr)
+    
+    assert [(r.module, r.depth) for r in records] == [('json.decoder', 2), ('json', 1), ('app', 0)]
+    assert records[-1].cumulative_us == 470
+
+def test_app_first_paint_imports_stay_light():
+    """Importing app must not pull in heavy engine modules and must stay under the cold-start threshold"""
+    report = run_benchmark(targets={'app': 3000.0}, runs=1, deferred={'app': DEFERRED_MODULES})
+    stats = report['targets']['app']
+    
+    assert stats['leaked_heavy_modules'] == []
+    assert report['passed'], stats
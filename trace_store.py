@@ -0,0 +1,163 @@
+"""On-disk archive for traces rolled out of ObservabilityTracker's memory
+
+Traces are appended to segmented, gzip-compressed JSONL files:
+
+    <directory>/traces-<UTC start time>-<sequence>.jsonl.gz
+
+Records are buffered and written as one gzip member per flush, so every
+segment on disk is always a complete, readable gzip stream. A segment is
+closed after segment_records records; when max_segments is set the oldest
+segments are deleted, bounding disk use. Closed segments can be converted to
+Parquet (one file per segment) when pyarrow is installed.
+"""
+import os
+import re
+import glob
+import gzip
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from progress import logger
+
+SEGMENT_PATTERN = "traces-*"
+SEGMENT_SEQUENCE = re.compile(r"^traces-[^-]+-(\d+)\.")
+
+class TraceArchive:
+    """Append-only, segmented store for archived trace records"""
+
+    def __init__(self, directory: str, segment_records: int = 10000, flush_every: int = 256,
+                 max_segments: Optional[int] = None):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.flush_every = flush_every
+        self.max_segments = max_segments
+
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._segment_path: Optional[str] = None
+        self._segment_count = 0
+        # Retention may have deleted early segments, so continue after the highest
+        # sequence on disk rather than reusing a name that is still there
+        sequences = [int(match.group(1)) for match in
+                     (SEGMENT_SEQUENCE.match(os.path.basename(path)) for path in self.segments()) if match]
+        self._sequence = max(sequences, default=-1) + 1
+
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self) -> List[str]:
+        """Segment files in write order (JSONL and converted Parquet)"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            path for path in glob.glob(os.path.join(self.directory, SEGMENT_PATTERN))
+            if path.endswith(('.jsonl.gz', '.parquet'))
+        )
+
+    def append(self, record: Dict[str, Any]):
+        """Queue a record; it reaches disk on the next flush"""
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        """Write buffered records to the current segment"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        while self._buffer:
+            if self._segment_path is None or self._segment_count >= self.segment_records:
+                self._start_segment()
+
+            room = self.segment_records - self._segment_count
+            lines, self._buffer = self._buffer[:room], self._buffer[room:]
+            try:
+                # Each flush appends a complete gzip member
+                with gzip.open(self._segment_path, 'at', encoding='utf-8') as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not archive {len(lines)} traces: {str(e)}")
+                return
+            self._segment_count += len(lines)
+
+    def _start_segment(self):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._segment_path = os.path.join(
+            self.directory, f"traces-{stamp}-{self._sequence:06d}.jsonl.gz"
+        )
+        self._sequence += 1
+        self._segment_count = 0
+
+        if self.max_segments:
+            # The new segment is not on disk yet, so keep one fewer
+            for old_segment in self.segments()[:-(self.max_segments - 1) or None]:
+                os.remove(old_segment)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Stream every archived record, oldest first, one segment at a time"""
+        self.flush()
+        for path in self.segments():
+            if path.endswith('.parquet'):
+                import pyarrow.parquet as pq
+
+                for batch in pq.ParquetFile(path).iter_batches():
+                    for line in batch.column('record').to_pylist():
+                        yield json.loads(line)
+                continue
+
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def convert_to_parquet(self) -> List[str]:
+        """Rewrite closed JSONL segments as Parquet (needs pyarrow)
+
+        Records are kept as JSON strings in a 'record' column next to a few
+        flattened query columns, so nothing is lost and Parquet readers can
+        filter without parsing.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.flush()
+        with self._lock:
+            current = self._segment_path
+
+        converted = []
+        for path in self.segments():
+            if not path.endswith('.jsonl.gz') or path == current:
+                continue
+
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                lines = [line.rstrip("\n") for line in f if line.strip()]
+            records = [json.loads(line) for line in lines]
+            table = pa.table({
+                'trace_id': [r.get('trace_id') for r in records],
+                'strategy': [(r.get('config') or {}).get('strategy') for r in records],
+                'status': [r.get('status') for r in records],
+                'start_time': [r.get('start_time') for r in records],
+                'duration': [r.get('duration') for r in records],
+                'record': lines,
+            })
+
+            target = path[:-len('.jsonl.gz')] + '.parquet'
+            pq.write_table(table, target + '.tmp', compression='zstd')
+            os.replace(target + '.tmp', target)
+            os.remove(path)
+            converted.append(target)
+
+        return converted
+
+    def clear(self):
+        """Delete every archived segment"""
+        with self._lock:
+            self._buffer.clear()
+            for path in self.segments():
+                os.remove(path)
+            self._segment_path = None
+            self._segment_count = 0
@@ -0,0 +1,112 @@
+"""Per-stage timing spans for the query path
+
+The engine and vector store wrap each stage in span(); spans attach to the
+trace activated for the current thread by ObservabilityTracker.activate().
+This module has no third-party imports, so the store can use it without
+pulling in the observability stack.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+# The trace the current query is running under, if stage spans are enabled
+_active_trace = contextvars.ContextVar('rag_active_trace', default=None)
+
+class _NullSpan:
+    """Stand-in returned by span() when no trace is active"""
+    
+    detailed = False
+    
+    def set(self, **attributes):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _ActiveTrace:
+    """Span bookkeeping for one trace on one thread"""
+    
+    __slots__ = ('trace_id', 'start', 'spans', 'stack', 'detailed')
+    
+    def __init__(self, trace_id: str, spans: List[Dict[str, Any]], detailed: bool):
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.spans = spans
+        self.stack = []
+        self.detailed = detailed
+
+class Span:
+    """A timed stage within a trace; attributes carry counts and sizes"""
+    
+    __slots__ = ('trace', 'name', 'attributes', 'parent', 'depth', 'start', 'duration')
+    
+    def __init__(self, trace: _ActiveTrace, name: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+    
+    @property
+    def detailed(self) -> bool:
+        """Whether to record payload sizes (only for traces that are kept)"""
+        return self.trace.detailed
+    
+    def set(self, **attributes):
+        """Add attributes (e.g. result counts) once they are known"""
+        self.attributes.update(attributes)
+    
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        trace = self.trace
+        trace.stack.pop()
+        if exc is not None:
+            self.attributes['error'] = str(exc)
+        
+        trace.spans.append({
+            'name': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'offset': self.start - trace.start,
+            'duration': self.duration,
+            'attributes': self.attributes
+        })
+        return False
+
+def span(name: str, **attributes) -> Any:
+    """Time a stage of the query running on this thread
+    
+    Use as a context manager. Outside an active trace (or with stage spans
+    disabled) this returns a shared no-op object, so instrumented code costs
+    one context variable lookup.
+    """
+    trace = _active_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return Span(trace, name, attributes)
+
+@contextmanager
+def activate_trace(trace_id: str, spans: List[Dict[str, Any]], detailed: bool = False):
+    """Send span() calls on this thread to `spans` until the block exits
+    
+    With detailed=True, instrumented code also records payload sizes
+    (checked through span.detailed).
+    """
+    token = _active_trace.set(_ActiveTrace(trace_id, spans, detailed))
+    try:
+        yield
+    finally:
+        _active_trace.reset(token)
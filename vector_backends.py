@@ -0,0 +1,525 @@
+"""Storage and search engines behind VectorStore
+
+A backend hands out named collections. Every collection supports the same
+calls VectorStore makes, shaped like Chroma's collection API so either
+engine can sit behind it unchanged:
+
+    add(ids, documents, metadatas, embeddings=None)
+    delete(ids)
+    query(query_embeddings, n_results, where=None, include=...) -> {'ids': [[...]], ...}
+    get(ids=None, where=None, limit=None, include=...) -> {'ids': [...], ...}
+    count()
+
+ChromaBackend is a PersistentClient; its collections are Chroma's own.
+NumpyBackend keeps each collection as one contiguous matrix of normalized
+float32 rows in a memory-mapped file, and answers queries exactly with a
+BLAS matrix product and argpartition. At thousands to tens of thousands of
+chunks that beats an ANN index's per-query overhead and never misses a
+neighbor.
+
+Select one with RAG_VECTOR_BACKEND=chroma|numpy.
+
+A backend opened read_only never creates, modifies or deletes files: a
+collection that does not exist yet reads as empty, and writes raise
+ReadOnlyError. reload() makes it pick up what another process has written
+since it was opened.
+"""
+import os
+import json
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from progress import logger
+
+BACKENDS = ('chroma', 'numpy')
+
+DEFAULT_INCLUDE = ('documents', 'metadatas')
+
+class ReadOnlyError(RuntimeError):
+    """Raised when something opened read-only is asked to write"""
+    pass
+
+class VectorBackend(ABC):
+    """Named vector collections in one persist directory"""
+
+    name = ""
+    read_only = False
+
+    @abstractmethod
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        """Open a collection, creating it unless the backend is read-only"""
+
+    @abstractmethod
+    def delete_collection(self, name: str):
+        """Remove a collection and its files"""
+
+    def reload(self):
+        """Drop cached state so collections opened afterwards see the files as they are now"""
+        pass
+
+class EmptyCollection:
+    """A collection a read-only backend could not find: nothing to read, no way to write"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def count(self) -> int:
+        return 0
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include: Sequence[str] = DEFAULT_INCLUDE):
+        return {'ids': [], **{key: [] for key in include}}
+
+    def query(self, query_embeddings: Any, n_results: int = 10, where=None,
+              include: Sequence[str] = DEFAULT_INCLUDE + ('distances',)):
+        return {'ids': [[] for _ in query_embeddings], **{key: [[] for _ in query_embeddings] for key in include}}
+
+    def add(self, *args, **kwargs):
+        raise ReadOnlyError(f"Collection {self.name} is not in the index and it is open read-only")
+
+    delete = add
+
+class ChromaBackend(VectorBackend):
+    """Chroma's PersistentClient with HNSW collections"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, embedding_function=None, read_only: bool = False,
+                 repair: bool = True):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.read_only = read_only
+        # Removing the WAL or the directory is only safe when no other writer is using them
+        self.client = self._connect(repair and not read_only)
+
+    def _connect(self, repair: bool):
+        import chromadb
+        from chromadb.config import Settings
+
+        settings = Settings(anonymized_telemetry=False, allow_reset=True)
+        persist_directory = self.persist_directory
+        if self.read_only:
+            # Opening the client would create the database; until a writer has, there is nothing to read
+            if not os.path.exists(os.path.join(persist_directory, "chroma.sqlite3")):
+                return None
+            return chromadb.PersistentClient(path=persist_directory, settings=settings)
+        if not repair:
+            return chromadb.PersistentClient(path=persist_directory, settings=settings)
+
+        try:
+            # Clear any existing lock files
+            lock_file = os.path.join(persist_directory, "chroma.sqlite3-wal")
+            if os.path.exists(lock_file):
+                try:
+                    os.remove(lock_file)
+                except:
+                    pass
+
+            return chromadb.PersistentClient(path=persist_directory, settings=settings)
+        except Exception as e:
+            logger.error(f"Error initializing ChromaDB client: {str(e)}")
+            # Create a fresh client if there's an issue
+            if os.path.exists(persist_directory):
+                shutil.rmtree(persist_directory)
+            os.makedirs(persist_directory, exist_ok=True)
+            return chromadb.PersistentClient(path=persist_directory, settings=settings)
+
+    def reload(self):
+        """Reconnect, so indexes are loaded afresh from disk
+
+        Chroma keeps one system per path per process and serves queries from
+        the HNSW index it loaded first, however the files change. Dropping
+        the cached system makes the next client load them again; collections
+        opened before keep working on the old one until they are released.
+        """
+        from chromadb.api.shared_system_client import SharedSystemClient
+
+        if self.client is not None:
+            SharedSystemClient._identifier_to_system.pop(self.client._identifier, None)
+        self.client = self._connect(repair=False)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        if self.read_only:
+            if self.client is None:
+                return EmptyCollection(name)
+            try:
+                return self.client.get_collection(name=name, embedding_function=self.embedding_function)
+            except Exception:
+                return EmptyCollection(name)
+        try:
+            collection = self.client.get_collection(name=name, embedding_function=self.embedding_function)
+        except:
+            # Create new collection if it doesn't exist; hnsw:* keys configure its index
+            return self.client.create_collection(name=name, metadata=metadata,
+                                                 embedding_function=self.embedding_function)
+        self._reconcile_hnsw(collection, metadata or {})
+        return collection
+
+    def _reconcile_hnsw(self, collection, metadata: Dict[str, Any]):
+        """Apply a changed search_ef to an existing collection; graph parameters need a rebuild
+
+        Chroma reads search_ef when it loads the index, on the first query
+        after the client opens, so a change takes effect at the next start.
+        """
+        current = (collection.configuration or {}).get('hnsw') or {}
+        search_ef = metadata.get('hnsw:search_ef')
+        if search_ef is not None and current.get('ef_search') != search_ef:
+            collection.modify(configuration={'hnsw': {'ef_search': search_ef}})
+        for key, built in (('hnsw:M', 'max_neighbors'), ('hnsw:construction_ef', 'ef_construction')):
+            if metadata.get(key) is not None and current.get(built) not in (None, metadata[key]):
+                logger.warning(f"Collection {collection.name} was built with {built}={current[built]}; "
+                               f"{key}={metadata[key]} takes effect once it is rebuilt")
+
+    def delete_collection(self, name: str):
+        if self.read_only:
+            raise ReadOnlyError(f"Cannot delete collection {name}: the index is open read-only")
+        self.client.delete_collection(name=name)
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evaluate a Chroma-style metadata filter against one record"""
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == '$eq' and value != operand:
+                    return False
+                if operator == '$ne' and value == operand:
+                    return False
+                if operator == '$in' and value not in operand:
+                    return False
+                if operator == '$nin' and value in operand:
+                    return False
+                if operator in ('$gt', '$gte', '$lt', '$lte'):
+                    if value is None:
+                        return False
+                    if ((operator == '$gt' and not value > operand) or (operator == '$gte' and not value >= operand)
+                            or (operator == '$lt' and not value < operand)
+                            or (operator == '$lte' and not value <= operand)):
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class _Snapshot:
+    """One immutable version of a NumpyCollection's contents
+
+    Writers build a new snapshot and swap it in, so a query that started on
+    the old one finishes on consistent data without taking a lock.
+    """
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                 vectors: np.ndarray):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.rows = {doc_id: row for row, doc_id in enumerate(ids)}
+
+class NumpyCollection:
+    """A collection searched exactly over a memory-mapped float32 matrix
+
+    Files in the collection directory:
+
+        vectors.f32    normalized float32 rows, in record order
+        records.json   collection metadata, ids, documents and metadatas
+        records.N.log  one JSON line per record added since records.json
+                       was written, named by records.json
+
+Adds append to the vector file and the log, so a batch costs its own size
+rather than the collection's. records.json is rewritten (starting a new
+log) by deletes and once the log outgrows it, which keeps the total
+rewrite cost linear in the number of records added.
+
+    from_records() opens a read-only collection with no directory over rows
+    held elsewhere, such as a memory-mapped snapshot.
+    """
+
+    def __init__(self, directory: Optional[str], name: str, metadata: Optional[Dict[str, Any]] = None,
+                 embedding_function=None, read_only: bool = False):
+        self.directory = directory
+        self.name = name
+        self.metadata = metadata or {}
+        self.embedding_function = embedding_function
+        self.read_only = read_only
+        self._write_lock = threading.Lock()
+        self._snapshot = _Snapshot([], [], [], np.zeros((0, 0), dtype=np.float32))
+        # The log named by records.json, the rows records.json itself holds,
+        # and the bytes of complete lines in the log
+        self._log: Optional[str] = None
+        self._base_rows = 0
+        self._log_size = 0
+        if directory is not None and os.path.exists(self._path("records.json")):
+            self._load()
+        elif not read_only:
+            os.makedirs(directory, exist_ok=True)
+            self._save(self._snapshot, rewrite_vectors=True)
+
+    @classmethod
+    def from_records(cls, name: str, metadata: Optional[Dict[str, Any]], ids: List[str], documents: List[str],
+                     metadatas: List[Dict[str, Any]], vectors: np.ndarray) -> "NumpyCollection":
+        """A read-only collection over normalized float32 rows that are already in memory or mapped"""
+        collection = cls(None, name, metadata, read_only=True)
+        collection._snapshot = _Snapshot(ids, documents, metadatas, vectors)
+        return collection
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        with open(self._path("records.json"), encoding='utf-8') as f:
+            records = json.load(f)
+        self.metadata = records.get('metadata') or self.metadata
+        ids, documents, metadatas = records['ids'], records['documents'], records['metadatas']
+        self._log = records.get('log')
+        self._base_rows = len(ids)
+        self._log_size = 0
+        if self._log and os.path.exists(self._path(self._log)):
+            with open(self._path(self._log), 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    ids.append(record['id'])
+                    documents.append(record['document'])
+                    metadatas.append(record['metadata'])
+                    self._log_size += len(line)
+        self._snapshot = _Snapshot(ids, documents, metadatas,
+                                   self._map_vectors(len(ids), records.get('dimensions', 0)))
+
+    def _map_vectors(self, rows: int, dimensions: int) -> np.ndarray:
+        if not rows or not dimensions:
+            return np.zeros((0, dimensions), dtype=np.float32)
+        return np.memmap(self._path("vectors.f32"), dtype=np.float32, mode='r', shape=(rows, dimensions))
+
+    def _save(self, snapshot: _Snapshot, rewrite_vectors: bool = False):
+        """Persist a whole snapshot: optionally rewrite the vector file, then replace the records file
+
+        The new records file names a fresh, empty log, so records logged
+        against the old one are never read twice.
+        """
+        if rewrite_vectors:
+            temporary = self._path("vectors.f32.tmp")
+            np.ascontiguousarray(snapshot.vectors, dtype=np.float32).tofile(temporary)
+            os.replace(temporary, self._path("vectors.f32"))
+
+        previous = self._log
+        sequence = int(previous.split(".")[1]) + 1 if previous else 0
+        log = f"records.{sequence}.log"
+        temporary = self._path("records.json.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'name': self.name, 'metadata': self.metadata,
+                       'dimensions': int(snapshot.vectors.shape[1]) if snapshot.vectors.ndim == 2 else 0,
+                       'ids': snapshot.ids, 'documents': snapshot.documents,
+                       'metadatas': snapshot.metadatas, 'log': log}, f)
+        os.replace(temporary, self._path("records.json"))
+        self._log, self._base_rows, self._log_size = log, len(snapshot.ids), 0
+        if previous and os.path.exists(self._path(previous)):
+            os.remove(self._path(previous))
+
+    def _append_vectors(self, vectors: np.ndarray):
+        with open(self._path("vectors.f32"), 'r+b') as f:
+            # Drop rows left by an append whose records never made it to disk
+            f.truncate(self._snapshot.vectors.nbytes)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def _append_records(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Log records whose vectors are already appended, so every complete line has its row on disk"""
+        lines = b"".join(
+            json.dumps({'id': doc_id, 'document': document, 'metadata': metadata}).encode('utf-8') + b"\n"
+            for doc_id, document, metadata in zip(ids, documents, metadatas))
+        with open(self._path(self._log), 'a+b') as f:
+            # Drop a line torn by an append that never finished
+            f.truncate(self._log_size)
+            f.write(lines)
+        self._log_size += len(lines)
+
+    @staticmethod
+    def _normalize(embeddings: Any) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def count(self) -> int:
+        return len(self._snapshot.ids)
+
+    def add(self, ids: Sequence[str], documents: Optional[Sequence[str]] = None,
+            metadatas: Optional[Sequence[Dict[str, Any]]] = None, embeddings: Optional[Any] = None):
+        if self.read_only:
+            raise ReadOnlyError(f"Collection {self.name} is open read-only")
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self.embedding_function(list(documents))
+        vectors = self._normalize(embeddings)
+        documents = list(documents) if documents is not None else [""] * len(ids)
+        metadatas = [dict(metadata) for metadata in metadatas] if metadatas is not None else [{}] * len(ids)
+
+        with self._write_lock:
+            current = self._snapshot
+            if set(ids) & current.rows.keys() or len(set(ids)) < len(ids):
+                # Chroma ignores ids that already exist; keep the first of each
+                keep = []
+                seen = set(current.rows)
+                for i, doc_id in enumerate(ids):
+                    if doc_id not in seen:
+                        seen.add(doc_id)
+                        keep.append(i)
+                ids = [ids[i] for i in keep]
+                documents = [documents[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                vectors = vectors[keep]
+                if not ids:
+                    return
+
+            dimensions = vectors.shape[1]
+            if current.ids:
+                if current.vectors.shape[1] != dimensions:
+                    raise ValueError(f"Embedding dimension {dimensions} does not match collection "
+                                     f"dimensionality {current.vectors.shape[1]}")
+                snapshot = _Snapshot(current.ids + list(ids), current.documents + documents,
+                                     current.metadatas + metadatas, current.vectors)
+                # Appending leaves the rows already mapped by readers untouched
+                self._append_vectors(vectors)
+                if self._log is None or len(snapshot.ids) - self._base_rows > self._base_rows:
+                    self._save(snapshot)
+                else:
+                    self._append_records(list(ids), documents, metadatas)
+            else:
+                snapshot = _Snapshot(list(ids), documents, metadatas, vectors)
+                self._save(snapshot, rewrite_vectors=True)
+            snapshot.vectors = self._map_vectors(len(snapshot.ids), dimensions)
+            self._snapshot = snapshot
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None):
+        if self.read_only:
+            raise ReadOnlyError(f"Collection {self.name} is open read-only")
+        with self._write_lock:
+            current = self._snapshot
+            doomed = set(ids or [])
+            if where:
+                doomed |= {doc_id for doc_id, metadata in zip(current.ids, current.metadatas)
+                           if _matches(metadata, where)}
+            keep = [row for row, doc_id in enumerate(current.ids) if doc_id not in doomed]
+            if len(keep) == len(current.ids):
+                return
+
+            snapshot = _Snapshot([current.ids[row] for row in keep], [current.documents[row] for row in keep],
+                                 [current.metadatas[row] for row in keep], np.asarray(current.vectors)[keep])
+            self._save(snapshot, rewrite_vectors=True)
+            snapshot.vectors = self._map_vectors(len(keep), current.vectors.shape[1])
+            self._snapshot = snapshot
+
+    def _filter_rows(self, snapshot: _Snapshot, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        return np.fromiter((row for row, metadata in enumerate(snapshot.metadatas) if _matches(metadata, where)),
+                           dtype=np.intp)
+
+    def _records(self, snapshot: _Snapshot, rows: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        result = {'ids': [snapshot.ids[row] for row in rows]}
+        if 'documents' in include:
+            result['documents'] = [snapshot.documents[row] for row in rows]
+        if 'metadatas' in include:
+            result['metadatas'] = [snapshot.metadatas[row] for row in rows]
+        if 'embeddings' in include:
+            result['embeddings'] = np.asarray(snapshot.vectors[np.asarray(rows, dtype=np.intp)])
+        return result
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = DEFAULT_INCLUDE) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if ids is not None:
+            rows = [snapshot.rows[doc_id] for doc_id in ids if doc_id in snapshot.rows]
+        else:
+            rows = range(len(snapshot.ids))
+        if where:
+            rows = [row for row in rows if _matches(snapshot.metadatas[row], where)]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._records(snapshot, rows, include)
+
+    def query(self, query_embeddings: Any, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = DEFAULT_INCLUDE + ('distances',)) -> Dict[str, List[List[Any]]]:
+        """Exact cosine top-n for each query embedding"""
+        snapshot = self._snapshot
+        queries = self._normalize(query_embeddings)
+        results = {'ids': []}
+        for key in ('documents', 'metadatas', 'embeddings', 'distances'):
+            if key in include:
+                results[key] = []
+
+        candidates = self._filter_rows(snapshot, where)
+        matrix = snapshot.vectors if candidates is None else snapshot.vectors[candidates]
+        available = len(matrix)
+        if available == 0 or n_results <= 0:
+            for key in results:
+                results[key] = [[] for _ in queries]
+            return results
+
+        # One BLAS product scores every query against every row
+        scores = queries @ matrix.T
+        n = min(n_results, available)
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n] if n < available else \
+            np.broadcast_to(np.arange(available), (len(queries), available))
+        for query_scores, query_top in zip(scores, top):
+            order = query_top[np.argsort(-query_scores[query_top], kind='stable')]
+            rows = order if candidates is None else candidates[order]
+            records = self._records(snapshot, rows, include)
+            for key, values in records.items():
+                results[key].append(values)
+            if 'distances' in include:
+                results['distances'].append((1.0 - query_scores[order]).tolist())
+        return results
+
+class NumpyBackend(VectorBackend):
+    """Collections as memory-mapped NumPy matrices searched exactly"""
+
+    name = "numpy"
+
+    def __init__(self, persist_directory: str, embedding_function=None, read_only: bool = False):
+        self.directory = os.path.join(persist_directory, "numpy")
+        self.embedding_function = embedding_function
+        self.read_only = read_only
+        self._collections: Dict[str, NumpyCollection] = {}
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = NumpyCollection(
+                os.path.join(self.directory, name), name, metadata, self.embedding_function, self.read_only)
+        return collection
+
+    def reload(self):
+        # Collections reopen from their records file; queries in flight keep their snapshot
+        self._collections = {}
+
+    def delete_collection(self, name: str):
+        if self.read_only:
+            raise ReadOnlyError(f"Cannot delete collection {name}: the index is open read-only")
+        self._collections.pop(name, None)
+        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+def create_backend(name: Optional[str], persist_directory: str, embedding_function=None,
+                   read_only: bool = False, repair: bool = True) -> VectorBackend:
+    """Backend by name ('chroma' or 'numpy'); None reads RAG_VECTOR_BACKEND"""
+    name = (name or os.getenv("RAG_VECTOR_BACKEND", "chroma")).lower()
+    if name == "numpy":
+        return NumpyBackend(persist_directory, embedding_function, read_only)
+    if name != "chroma":
+        raise ValueError(f"Unknown vector backend {name!r}; expected one of {BACKENDS}")
+    return ChromaBackend(persist_directory, embedding_function, read_only, repair)
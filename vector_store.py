@@ -1,76 +1,447 @@
 import os
+import uuid
+import shutil
 import pickle
 import hashlib
-from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+import math
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import numpy as np
-import streamlit as st
+from langchain_core.documents import Document
+
+from progress import ProgressCallback, get_progress, logger
+from embeddings import get_default_embedding_function, get_embedding_tokenizer
+from tracing import span
+from chunking import OffsetTextSplitter
+from quantized_index import QuantizedIndex, normalize
+from vector_backends import ReadOnlyError, VectorBackend, create_backend
+from index_lock import (WriterLock, bump_generation, owner, owner_gone, read_active_index, read_generation,
+                        shared_lock, write_active_index)
+from sharding import SHARD_KEYS, ShardedCollection, shard_names
+
+COLLECTION_NAME = "samsara_customer_stories"
+
+# (chunk_size, chunk_overlap) the default collection is chunked at
+DEFAULT_GRANULARITY = (1000, 200)
+
+# How often a read-only store checks whether a writer published a new index
+RELOAD_CHECK_SECONDS = 1.0
+
+# How long a replaced index version is kept for readers still searching it
+RETIRED_GRACE_SECONDS = 30.0
+
+def parse_granularities(value: str) -> List[Tuple[int, int]]:
+    """Parse "500:100,1000:200" into [(500, 100), (1000, 200)]"""
+    granularities = []
+    for item in value.split(","):
+        if item.strip():
+            size, overlap = item.split(":")
+            granularities.append((int(size), int(overlap)))
+    return granularities
+
+# HNSW parameters a store can set; Chroma's defaults apply to any left out.
+# M and construction_ef shape the graph when a collection is built;
+# search_ef can change at any time.
+HNSW_PARAMS = ('M', 'construction_ef', 'search_ef')
+
+def parse_hnsw(value: str) -> Dict[str, int]:
+    """Parse "M=32,construction_ef=200,search_ef=64" into HNSW parameters"""
+    params = {}
+    for item in value.split(","):
+        if item.strip():
+            key, number = item.split("=")
+            key = key.strip()
+            if key not in HNSW_PARAMS:
+                raise ValueError(f"Unknown HNSW parameter {key!r}; expected one of {HNSW_PARAMS}")
+            params[key] = int(number)
+    return params
+
+def collection_name(granularity: Tuple[int, int], unit: str = "chars", version: str = "") -> str:
+    """Collection for a chunk granularity; the default keeps the original name
+    
+    Index versions after the original (see VectorStore.refresh_store) add
+    their version as a suffix.
+    """
+    suffix = f"_v{version}" if version else ""
+    if unit == "tokens":
+        return f"{COLLECTION_NAME}_t{granularity[0]}_o{granularity[1]}{suffix}"
+    if tuple(granularity) == DEFAULT_GRANULARITY:
+        return COLLECTION_NAME + suffix
+    return f"{COLLECTION_NAME}_c{granularity[0]}_o{granularity[1]}{suffix}"
+
+class GranularityView:
+    """The VectorStore search API bound to one granularity's collection
+    
+    RAGEngine retrieves through a view, so every strategy searches the
+    chunks the config asks for without knowing about collections.
+    """
+    
+    def __init__(self, store: "VectorStore", granularity: Tuple[int, int]):
+        self.store = store
+        self.granularity = granularity
+    
+    @property
+    def collection(self):
+        # Looked up each time, so a reloaded store's views search the new collections
+        return self.store.collections[self.granularity]
+    
+    def similarity_search(self, query: str, k: int = 5,
+                          where: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return self.store.similarity_search(query, k=k, where=where, collection=self.collection)
+    
+    def similarity_search_batch(self, queries: List[str], k: int = 5,
+                                where: Optional[Dict[str, Any]] = None,
+                                query_embeddings: Optional[List[Any]] = None) -> List[List[Document]]:
+        return self.store.similarity_search_batch(queries, k=k, where=where, query_embeddings=query_embeddings,
+                                                  collection=self.collection)
+    
+    def keyword_search(self, query: str, k: int = 5,
+                       where: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return self.store.keyword_search(query, k=k, where=where, collection=self.collection)
+    
+    def keyword_search_batch(self, queries: List[str], k: int = 5,
+                             where: Optional[Dict[str, Any]] = None,
+                             query_embeddings: Optional[List[Any]] = None) -> List[List[Document]]:
+        return self.store.keyword_search_batch(queries, k=k, where=where, query_embeddings=query_embeddings,
+                                               collection=self.collection)
+    
+    def embed_queries(self, queries: List[str]) -> List[Any]:
+        return self.store.embed_queries(queries)
+    
+    def embed_keyword_queries(self, queries: List[str]) -> List[Any]:
+        return self.store.embed_keyword_queries(queries)
+    
+    def get_full_document(self, source: str) -> Optional[Document]:
+        return self.store.get_full_document(source)
 
 class VectorStore:
-    """Vector store implementation using ChromaDB"""
+    """Vector store over a pluggable backend (ChromaDB by default)
+    
+    Stories are indexed at one or more chunk granularities, (chunk_size,
+    chunk_overlap) pairs, each in its own collection. The default
+    granularity lives in the original collection; RAG_CHUNK_GRANULARITIES
+    (e.g. "500:100,1000:200,2000:400") adds more. Use for_granularity() to
+    search the collection closest to a config's chunking parameters.
+    
+    Sizes count characters unless chunk_unit (or RAG_CHUNK_UNIT) is "tokens":
+    then they count the embedding model's own tokens, are capped at its
+    window, and the default granularity fills the window.
+    
+    Collections live in a VectorBackend: Chroma's HNSW, or exact NumPy
+    search with backend="numpy" (or RAG_VECTOR_BACKEND=numpy). HNSW
+    parameters come from hnsw (or RAG_HNSW, e.g. "M=32,search_ef=64") and
+    are stored in each collection's metadata.
     
-    def __init__(self, persist_directory: str = "./chromadb"):
+    With quantization (or RAG_VECTOR_QUANTIZATION) set to "int8" or
+    "binary", semantic search runs on a QuantizedIndex kept beside each
+    collection and rescored at full precision, instead of on Chroma's HNSW.
+    
+    With shards (or RAG_SHARDS) above 1, each collection is split into that
+    many backend collections by shard_by (RAG_SHARD_BY): "source" hashes
+    story URLs, "industry" keeps an industry together. Queries search the
+    shards in parallel and merge by distance; writes touch only the shards
+    their stories map to.
+    
+    Serving processes open the index with read_only (or RAG_READ_ONLY=1):
+    nothing on disk is created, changed or deleted, and writes raise
+    ReadOnlyError. One writer at a time holds an advisory lock on the
+    directory and publishes a new generation after each write; read-only
+    stores notice it within RELOAD_CHECK_SECONDS and reopen the index.
+    
+    refresh_store() and load_snapshot() build a new version of every
+    collection beside the live one, validate it and only then switch the
+    active version, so no reader ever searches a partial index; the old
+    version is dropped RETIRED_GRACE_SECONDS later.
+    
+    export_snapshot() writes the whole index to one file that
+    snapshot.open_snapshot() serves from directly, or load_snapshot()
+    loads into another store, without re-embedding.
+    """
+    
+    def __init__(self, persist_directory: str = "./chromadb", embedding_function=None,
+                 granularities: Optional[Sequence[Tuple[int, int]]] = None,
+                 chunk_unit: Optional[str] = None, quantization: Optional[str] = None,
+                 backend=None, hnsw: Optional[Dict[str, int]] = None,
+                 shards: Optional[int] = None, shard_by: Optional[str] = None,
+                 read_only: Optional[bool] = None):
         self.persist_directory = persist_directory
+        # Held explicitly so queries can be embedded in one batch up front
+        self.embedding_function = embedding_function or get_default_embedding_function()
         
-        # Initialize ChromaDB client with proper settings
-        try:
-            # Clear any existing lock files
-            import shutil
-            lock_file = os.path.join(persist_directory, "chroma.sqlite3-wal")
-            if os.path.exists(lock_file):
-                try:
-                    os.remove(lock_file)
-                except:
-                    pass
-            
-            # Initialize ChromaDB client with settings
-            self.client = chromadb.PersistentClient(
-                path=persist_directory,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
-        except Exception as e:
-            st.error(f"Error initializing ChromaDB client: {str(e)}")
-            # Create a fresh client if there's an issue
-            if os.path.exists(persist_directory):
-                import shutil
-                shutil.rmtree(persist_directory)
-            os.makedirs(persist_directory, exist_ok=True)
-            self.client = chromadb.PersistentClient(
-                path=persist_directory,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
+        # Serializes writers, across threads (one store instance is shared by
+        # all sessions) and across processes sharing the directory
+        self.write_lock = WriterLock(persist_directory)
+        self._writes = 0
+        self.read_only = read_only if read_only is not None else \
+            os.getenv("RAG_READ_ONLY", "").lower() in ("1", "true", "yes")
         
-        # Create or get collection
-        self.collection_name = "samsara_customer_stories"
-        try:
-            self.collection = self.client.get_collection(name=self.collection_name)
-        except:
-            # Create new collection if it doesn't exist
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+        self.hnsw = dict(hnsw) if hnsw is not None else parse_hnsw(os.getenv("RAG_HNSW", ""))
+        
+        # Collections are stored and searched by a backend, given or named
+        if isinstance(backend, VectorBackend):
+            self.backend = backend
+        elif self.read_only:
+            self.backend = create_backend(backend, persist_directory, self.embedding_function, read_only=True)
+        else:
+            # Startup repairs (a stale WAL, an unreadable database) only run with no other writer active
+            repair = self.write_lock.acquire(blocking=False)
+            try:
+                self.backend = create_backend(backend, persist_directory, self.embedding_function, repair=repair)
+            finally:
+                if repair:
+                    self.write_lock.release()
+        
+        # Collections split into shards searched on a shared pool
+        self.shards = max(1, shards if shards is not None else int(os.getenv("RAG_SHARDS", "1")))
+        self.shard_by = (shard_by or os.getenv("RAG_SHARD_BY", "source")).lower()
+        if self.shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key {self.shard_by!r}; expected one of {SHARD_KEYS}")
+        self._shard_pool = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix="rag-shard") \
+            if self.shards > 1 else None
+        
+        # Chunk sizes count characters, or tokens of the embedding model's tokenizer
+        self.chunk_unit = (chunk_unit or os.getenv("RAG_CHUNK_UNIT", "chars")).lower()
+        self.tokenizer = None
+        self.default_granularity = DEFAULT_GRANULARITY
+        if self.chunk_unit == "tokens":
+            self.tokenizer = get_embedding_tokenizer(self.embedding_function)
+            if self.tokenizer is None:
+                logger.warning("No tokenizer is known for this embedding function; chunking by characters")
+                self.chunk_unit = "chars"
+            else:
+                window = self.tokenizer.window
+                self.default_granularity = (window, window // 5)
+        
+        # One collection per chunk granularity; the default one always exists
+        if granularities is None:
+            granularities = parse_granularities(os.getenv("RAG_CHUNK_GRANULARITIES", "")) or [self.default_granularity]
+        self.granularities = sorted({self._fit_window(tuple(g)) for g in granularities} | {self.default_granularity})
+        self.collection_name = collection_name(self.default_granularity, self.chunk_unit)
         
         # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+        self.text_splitter = self._make_splitter(self.default_granularity)
+        self._splitters = {self.default_granularity: self.text_splitter}
+        self._views = {}
+        
+        # Quantized first-stage indexes by collection name, built on first search
+        self.quantization = (quantization if quantization is not None
+                             else os.getenv("RAG_VECTOR_QUANTIZATION", "")).lower() or None
+        self._quantized: Dict[str, QuantizedIndex] = {}
+        self._quantized_lock = threading.Lock()
+        
+        # Collections and full documents (for parent document retrieval), as
+        # of the generation they were opened at
+        self._reload_lock = threading.Lock()
+        self._generation_checked = time.monotonic()
+        with shared_lock(persist_directory) if self.read_only else nullcontext():
+            self.generation = read_generation(persist_directory)
+            self.version = read_active_index(persist_directory)['version']
+            self.collections = {granularity: self._get_or_create_collection(granularity)
+                                for granularity in self.granularities}
+            self.collection = self.collections[self.default_granularity]
+            self.full_documents = {}
+            self._load_full_documents()
+            if self.read_only:
+                self._load_indexes(self.collections)
+    
+    @contextmanager
+    def _writing(self):
+        """Hold the writer lock for a write; the outermost one publishes a new generation
+        
+        Another writable store on the directory (another process, say) may
+        have written or switched versions since this one opened, so the
+        outermost write first catches up with it.
+        """
+        if self.read_only:
+            raise ReadOnlyError("The vector store is open read-only")
+        with self.write_lock:
+            if self._writes == 0 and (read_generation(self.persist_directory) != self.generation or
+                                      read_active_index(self.persist_directory)['version'] != self.version):
+                with self._reload_lock:
+                    self._reload()
+            self._writes += 1
+            try:
+                yield
+            finally:
+                self._writes -= 1
+                if self._writes == 0:
+                    self.generation = bump_generation(self.persist_directory)
+    
+    def reload_if_changed(self) -> bool:
+        """Reopen the index if a writer has published a new generation; True when it did"""
+        if read_generation(self.persist_directory) == self.generation:
+            return False
+        with self._reload_lock, shared_lock(self.persist_directory):
+            if read_generation(self.persist_directory) == self.generation:
+                return False
+            self._reload()
+        return True
+    
+    def _reload(self):
+        """Reopen the live version's collections and documents; hold the writer lock or a shared lock"""
+        generation = read_generation(self.persist_directory)
+        self.backend.reload()
+        version = read_active_index(self.persist_directory)['version']
+        collections = {granularity: self._get_or_create_collection(granularity, version)
+                       for granularity in self.granularities}
+        if self.read_only:
+            self._load_indexes(collections)
+        full_documents = self._read_full_documents(version)
+        
+        # Searches already running finish on the collections they started with
+        self.version = version
+        self.collections = collections
+        self.collection = collections[self.default_granularity]
+        self._quantized = {}
+        self.full_documents = full_documents
+        self.generation = generation
+        logger.info(f"Reloaded vector store at generation {generation}")
+    
+    def _check_generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked >= RELOAD_CHECK_SECONDS:
+            self._generation_checked = now
+            self.reload_if_changed()
+    
+    def export_snapshot(self, path: str) -> Dict[str, Any]:
+        """Write every granularity, the full documents and a build catalog to one snapshot file
+        
+        Writers are held off meanwhile, so the snapshot is a single generation
+        of the index. Returns the snapshot header.
+        """
+        from snapshot import embedding_name, write_snapshot
+        
+        with shared_lock(self.persist_directory) if self.read_only else self.write_lock:
+            if self.read_only:
+                self.reload_if_changed()
+            collections = []
+            for granularity in self.granularities:
+                records = self.collections[granularity].get(include=['embeddings', 'documents', 'metadatas'])
+                collections.append({
+                    'name': collection_name(granularity, self.chunk_unit), 'granularity': granularity,
+                    'ids': list(records['ids']), 'documents': list(records['documents']),
+                    'metadatas': list(records['metadatas']),
+                    'vectors': normalize(records['embeddings']) if len(records['ids'])
+                               else np.zeros((0, 0), dtype=np.float32),
+                })
+            catalog = {
+                'embedding': embedding_name(self.embedding_function),
+                'chunk_unit': self.chunk_unit,
+                'granularities': [list(granularity) for granularity in self.granularities],
+                'default_granularity': list(self.default_granularity),
+                'hnsw': self._built_hnsw(),
+                'backend': self.backend.name,
+                'generation': self.generation,
+            }
+            return write_snapshot(path, catalog, collections, self.full_documents)
+    
+    def load_snapshot(self, snapshot) -> Dict[str, int]:
+        """Replace the store's contents with a snapshot's, using its embeddings as they are
+        
+        Returns the number of chunks loaded per collection; granularities
+        this store is not configured for are skipped. Like refresh_store(),
+        the snapshot is loaded into a new index version that only goes live
+        once complete; ValueError if it fails validation.
+        """
+        batch_size = 1000
+        loaded = {}
+        
+        def build(collections):
+            expected = {}
+            for entry in snapshot.collections():
+                granularity = tuple(entry['granularity'])
+                collection = collections.get(granularity)
+                if collection is None:
+                    logger.warning(f"Snapshot granularity {granularity} is not configured; skipped")
+                    continue
+                for i in range(0, len(entry['ids']), batch_size):
+                    collection.add(ids=entry['ids'][i:i + batch_size],
+                                   documents=entry['documents'][i:i + batch_size],
+                                   metadatas=entry['metadatas'][i:i + batch_size],
+                                   embeddings=np.asarray(entry['vectors'][i:i + batch_size]))
+                loaded[entry['name']] = expected[granularity] = len(entry['ids'])
+            return snapshot.full_documents(), expected
+        
+        self._build_and_switch(build)
+        return loaded
+    
+    @staticmethod
+    def _load_indexes(collections: Dict[Tuple[int, int], Any]):
+        """Load each collection's search index now, while writers are locked out, not on its first query"""
+        for collection in collections.values():
+            try:
+                sample = collection.get(limit=1, include=['embeddings'])
+                if len(sample['ids']):
+                    collection.query(query_embeddings=[sample['embeddings'][0]], n_results=1, include=[])
+            except Exception as e:
+                logger.warning(f"Error loading index of {collection.name}: {str(e)}")
+    
+    def _fit_window(self, granularity: Tuple[int, int]) -> Tuple[int, int]:
+        """Cap a token granularity at the embedding window, scaling its overlap to match"""
+        if self.tokenizer is None or granularity[0] <= self.tokenizer.window:
+            return granularity
+        window = self.tokenizer.window
+        return (window, granularity[1] * window // granularity[0])
+    
+    def _backend_collection_names(self, granularity: Tuple[int, int], version: Optional[str] = None) -> List[str]:
+        """Names of the backend collections holding a granularity (one per shard), in the live version by default"""
+        name = collection_name(granularity, self.chunk_unit, self.version if version is None else version)
+        return [name] if self.shards == 1 else shard_names(name, self.shards, self.shard_by)
+    
+    def _get_or_create_collection(self, granularity: Tuple[int, int], version: Optional[str] = None):
+        version = self.version if version is None else version
+        metadata = {"hnsw:space": "cosine", "chunk_size": granularity[0],
+                    "chunk_overlap": granularity[1], "chunk_unit": self.chunk_unit,
+                    **{f"hnsw:{key}": value for key, value in self.hnsw.items()}}
+        if self.shards == 1:
+            return self.backend.get_or_create_collection(collection_name(granularity, self.chunk_unit, version),
+                                                         metadata=metadata)
+        
+        shards = [self.backend.get_or_create_collection(
+                      name, metadata={**metadata, "shard": i, "shards": self.shards, "shard_by": self.shard_by})
+                  for i, name in enumerate(self._backend_collection_names(granularity, version))]
+        return ShardedCollection(collection_name(granularity, self.chunk_unit, version), shards, self.shard_by,
+                                 self._shard_pool)
+    
+    @staticmethod
+    def _make_splitter(granularity: Tuple[int, int]) -> OffsetTextSplitter:
+        return OffsetTextSplitter(
+            chunk_size=granularity[0],
+            chunk_overlap=granularity[1],
             separators=["\n\n", "\n", ".", " ", ""]
         )
+    
+    def _splitter(self, granularity: Tuple[int, int]) -> OffsetTextSplitter:
+        splitter = self._splitters.get(granularity)
+        if splitter is None:
+            splitter = self._splitters[granularity] = self._make_splitter(granularity)
+        return splitter
+    
+    def resolve_granularity(self, chunk_size: Optional[int] = None,
+                            chunk_overlap: Optional[int] = None) -> Tuple[int, int]:
+        """The indexed granularity closest to the requested chunking parameters
         
-        # Store for full documents (for parent document retrieval)
-        self.full_documents = {}
-        self._load_full_documents()
+        An exact match wins; otherwise the nearest chunk size (by ratio),
+        then the nearest overlap.
+        """
+        requested = (chunk_size or self.default_granularity[0],
+                     self.default_granularity[1] if chunk_overlap is None else chunk_overlap)
+        if requested in self.collections:
+            return requested
+        return min(self.granularities, key=lambda g: (abs(math.log(g[0] / requested[0])),
+                                                      abs(g[1] - requested[1])))
+    
+    def for_granularity(self, chunk_size: Optional[int] = None,
+                        chunk_overlap: Optional[int] = None) -> GranularityView:
+        """Search API bound to the collection closest to the given chunking"""
+        granularity = self.resolve_granularity(chunk_size, chunk_overlap)
+        view = self._views.get(granularity)
+        if view is None:
+            view = self._views[granularity] = GranularityView(self, granularity)
+        return view
     
     def is_populated(self) -> bool:
         """Check if the vector store has any documents"""
@@ -80,45 +451,134 @@ class VectorStore:
         except:
             return False
     
-    def populate_store(self, customer_stories: List[Dict[str, Any]]):
+    def populate_store(self, customer_stories: List[Dict[str, Any]], progress: Optional[ProgressCallback] = None):
         """Populate the vector store with customer stories"""
+        progress = get_progress(progress)
         
-        st.info("Processing and storing customer stories...")
-        progress_bar = st.progress(0)
-        
-        all_documents = []
+        with self._writing():
+            progress.info("Processing and storing customer stories...")
+            
+            # Build into a copy so concurrent readers never see a half-filled dict
+            full_documents = dict(self.full_documents)
+            documents_by_granularity = self._chunk_stories(customer_stories, full_documents, progress)
+            
+            # Add documents to ChromaDB
+            all_documents = documents_by_granularity[self.default_granularity]
+            if all_documents:
+                self._index_granularities(documents_by_granularity, progress)
+                self.full_documents = full_documents
+                self._save_full_documents()
+                progress.success(f"Successfully stored {len(all_documents)} document chunks!")
+            else:
+                progress.error("No documents were processed successfully")
+    
+    def _chunk_stories(self, customer_stories: List[Dict[str, Any]], full_documents: Dict[str, Any],
+                       progress: Optional[ProgressCallback] = None) -> Dict[Tuple[int, int], List[Document]]:
+        """Chunk stories at every granularity, recording each in full_documents"""
+        progress = get_progress(progress)
+        documents_by_granularity = {granularity: [] for granularity in self.granularities}
+        token_starts = self._token_starts(customer_stories)
         
         for i, story in enumerate(customer_stories):
             try:
-                # Create documents from the story
-                documents = self._create_documents_from_story(story)
-                all_documents.extend(documents)
+                # Create documents from the story at every granularity
+                for granularity, documents in documents_by_granularity.items():
+                    documents.extend(self._create_documents_from_story(story, granularity, token_starts[i]))
                 
                 # Store full document for parent retrieval
-                doc_id = self._generate_doc_id(story['url'])
-                self.full_documents[story['url']] = story
+                full_documents[story['url']] = story
                 
-                progress_bar.progress((i + 1) / len(customer_stories))
+                progress.progress((i + 1) / len(customer_stories))
                 
             except Exception as e:
-                st.warning(f"Error processing story {story.get('title', 'Unknown')}: {str(e)}")
+                progress.warning(f"Error processing story {story.get('title', 'Unknown')}: {str(e)}")
+        return documents_by_granularity
+    
+    def _index_granularities(self, documents_by_granularity: Dict[Tuple[int, int], List[Document]],
+                             progress: Optional[ProgressCallback] = None,
+                             collections: Optional[Dict[Tuple[int, int], Any]] = None) -> Dict[str, int]:
+        """Add documents to each granularity's collection, embedding each distinct text once
         
-        # Add documents to ChromaDB
-        if all_documents:
-            self._add_documents_to_collection(all_documents)
-            self._save_full_documents()
-            st.success(f"Successfully stored {len(all_documents)} document chunks!")
-        else:
-            st.error("No documents were processed successfully")
+        Highlights, ROI metrics and the other per-story documents are the same
+        at every granularity, as are stories short enough to be one chunk, so
+        their embeddings are computed once and shared by every collection.
+        Collections default to the live ones.
+        """
+        collections = collections if collections is not None else self.collections
+        embeddings = self._embed_texts(
+            doc.page_content for documents in documents_by_granularity.values() for doc in documents
+        )
+        for granularity, documents in documents_by_granularity.items():
+            self._add_documents_to_collection(
+                documents, progress, collection=collections[granularity],
+                embeddings=[embeddings[doc.page_content] for doc in documents]
+            )
+        
+        self.build_stats = {
+            'documents': sum(len(documents) for documents in documents_by_granularity.values()),
+            'embedded': len(embeddings),
+        }
+        return self.build_stats
+    
+    def _embed_texts(self, texts, batch_size: int = 256) -> Dict[str, Any]:
+        """Embeddings for the distinct texts, keyed by text"""
+        unique = list(dict.fromkeys(texts))
+        embeddings = {}
+        for i in range(0, len(unique), batch_size):
+            batch = unique[i:i + batch_size]
+            embeddings.update(zip(batch, self.embedding_function(batch)))
+        return embeddings
+    
+    def ensure_granularities(self, progress: Optional[ProgressCallback] = None) -> List[Tuple[int, int]]:
+        """Build any configured granularity whose collection is still empty
+        
+        Stores created before a granularity was configured only have the
+        default collection; the missing ones are chunked from the saved full
+        documents. Returns the granularities that were built.
+        """
+        progress = get_progress(progress)
+        if not self.full_documents or all(self.collections[g].count() for g in self.granularities):
+            return []
+        with self._writing():
+            missing = [g for g in self.granularities if self.collections[g].count() == 0]
+            if not missing or not self.full_documents:
+                return []
+            
+            progress.info(f"Indexing {len(missing)} additional chunk granularities...")
+            stories = list(self.full_documents.values())
+            token_starts = self._token_starts(stories)
+            documents_by_granularity = {
+                granularity: [doc for story, starts in zip(stories, token_starts)
+                              for doc in self._create_documents_from_story(story, granularity, starts)]
+                for granularity in missing
+            }
+            self._index_granularities(documents_by_granularity, progress)
+            return missing
     
-    def _create_documents_from_story(self, story: Dict[str, Any]) -> List[Document]:
+    def _token_starts(self, stories: List[Dict[str, Any]]) -> List[Optional[List[int]]]:
+        """Where each story's content tokens begin (None when chunking by characters)
+        
+        Whole stories go to the tokenizer in one batch, so each is tokenized
+        once however many granularities are chunked from it.
+        """
+        if self.tokenizer is None:
+            return [None] * len(stories)
+        offsets = self.tokenizer.offsets([story.get('content') or '' for story in stories])
+        return [[start for start, _ in spans] for spans in offsets]
+    
+    def _create_documents_from_story(self, story: Dict[str, Any],
+                                     granularity: Optional[Tuple[int, int]] = None,
+                                     token_starts: Optional[List[int]] = None) -> List[Document]:
         """Create Document objects from a customer story"""
         documents = []
+        granularity = granularity or self.default_granularity
+        if self.tokenizer is not None and token_starts is None:
+            token_starts = self._token_starts([story])[0]
         
         # Main content
         content = story.get('content', '')
         if content:
-            chunks = self.text_splitter.split_text(content)
+            chunks = self._splitter(granularity).split_text(content, token_starts)
             
             for i, chunk in enumerate(chunks):
                 metadata = {
@@ -211,8 +671,14 @@ class VectorStore:
         
         return documents
     
-    def _add_documents_to_collection(self, documents: List[Document]):
-        """Add documents to ChromaDB collection"""
+    def _add_documents_to_collection(self, documents: List[Document], progress: Optional[ProgressCallback] = None,
+                                     collection=None, embeddings: Optional[List[Any]] = None):
+        """Add documents to ChromaDB collection (the default one unless given)
+        
+        Precomputed embeddings, one per document, skip the embedding function.
+        """
+        progress = get_progress(progress)
+        collection = collection if collection is not None else self.collection
         
         if not documents:
             return
@@ -237,49 +703,177 @@ class VectorStore:
             batch_metadatas = metadatas[i:i+batch_size]
             
             try:
-                self.collection.add(
+                collection.add(
                     ids=batch_ids,
                     documents=batch_texts,
-                    metadatas=batch_metadatas
+                    metadatas=batch_metadatas,
+                    embeddings=embeddings[i:i+batch_size] if embeddings is not None else None
                 )
             except Exception as e:
-                st.warning(f"Error adding batch {i//batch_size + 1}: {str(e)}")
+                progress.warning(f"Error adding batch {i//batch_size + 1}: {str(e)}")
+        self._invalidate_quantized(collection)
     
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
+    def similarity_search(self, query: str, k: int = 5,
+                          where: Optional[Dict[str, Any]] = None, collection=None) -> List[Document]:
         """Perform similarity search"""
+        return self.similarity_search_batch([query], k=k, where=where, collection=collection)[0]
+    
+    def embed_queries(self, queries: List[str]) -> List[Any]:
+        """Embed queries in one encoder batch"""
+        return self.embedding_function(list(queries))
+    
+    def similarity_search_batch(self, queries: List[str], k: int = 5,
+                                where: Optional[Dict[str, Any]] = None,
+                                query_embeddings: Optional[List[Any]] = None,
+                                collection=None) -> List[List[Document]]:
+        """Perform similarity search for many queries at once
+        
+        All queries are embedded in one encoder batch (unless embeddings from
+        embed_queries are passed in) and searched with a single ANN call.
+        Returns one result list per query, in query order.
+        """
+        if not queries:
+            return []
+        if self.read_only:
+            self._check_generation()
+        
+        collection = collection if collection is not None else self.collection
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=min(k, self.collection.count())
-            )
+            n_results = min(k, collection.count())
+            if n_results <= 0:
+                return [[] for _ in queries]
             
-            documents = []
-            if results['documents'] and results['documents'][0]:
-                for i, (text, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
-                    documents.append(Document(
-                        page_content=text,
-                        metadata=metadata
-                    ))
+            if query_embeddings is None:
+                with span('embedding', queries=len(queries)) as stage:
+                    if stage.detailed:
+                        stage.set(query_chars=sum(len(query) for query in queries))
+                    query_embeddings = self.embed_queries(queries)
             
-            return documents
+            with span('ann_search', queries=len(queries), k=n_results) as ann:
+                if isinstance(collection, ShardedCollection):
+                    ann.set(shards=len(collection.targets(where)))
+                index = self._quantized_index(collection)
+                if index is not None:
+                    ann.set(quantization=index.quantization)
+                    results = self._query_quantized(index, collection, query_embeddings, n_results, where)
+                else:
+                    results = collection.query(
+                        query_embeddings=query_embeddings,
+                        n_results=n_results,
+                        where=where
+                    )
+                
+                batch_documents = []
+                for texts, metadatas in zip(results['documents'] or [], results['metadatas'] or []):
+                    batch_documents.append([
+                        Document(page_content=text, metadata=metadata)
+                        for text, metadata in zip(texts or [], metadatas or [])
+                    ])
+                ann.set(candidates=sum(len(documents) for documents in batch_documents))
+                if ann.detailed:
+                    ann.set(result_chars=sum(len(doc.page_content)
+                                             for documents in batch_documents for doc in documents))
+            
+            # Pad in case the backend returned fewer result lists than queries
+            batch_documents.extend([] for _ in range(len(queries) - len(batch_documents)))
+            return batch_documents
             
         except Exception as e:
-            st.warning(f"Error during similarity search: {str(e)}")
-            return []
+            logger.warning(f"Error during similarity search: {str(e)}")
+            return [[] for _ in queries]
+    
+    def _quantized_dir(self, collection) -> str:
+        return os.path.join(self.persist_directory, "quantized", collection.name)
+    
+    def _quantized_index(self, collection) -> Optional[QuantizedIndex]:
+        """The collection's quantized index, loaded or (re)built when missing or stale"""
+        if not self.quantization:
+            return None
+        count = collection.count()
+        index = self._quantized.get(collection.name)
+        if index is not None and len(index) == count:
+            return index
+        
+        with self._quantized_lock:
+            index = QuantizedIndex(self._quantized_dir(collection), self.quantization)
+            if not index.load() or len(index) != count:
+                if self.read_only:
+                    # Built in memory until a writer saves a current one beside the collection
+                    index = QuantizedIndex(None, self.quantization)
+                records = collection.get(include=['embeddings'])
+                index.build(records['ids'], records['embeddings'])
+            self._quantized[collection.name] = index
+            return index
     
-    def keyword_search(self, query: str, k: int = 5) -> List[Document]:
+    def _invalidate_quantized(self, collection):
+        """Drop a collection's quantized index after a write; it is rebuilt on the next search"""
+        if not self.quantization:
+            return
+        self._quantized.pop(collection.name, None)
+        meta = os.path.join(self._quantized_dir(collection), "meta.json")
+        if os.path.exists(meta):
+            os.remove(meta)
+    
+    def _query_quantized(self, index: QuantizedIndex, collection, query_embeddings: List[Any],
+                         n_results: int, where: Optional[Dict[str, Any]] = None) -> Dict[str, List]:
+        """collection.query()-shaped results from the quantized index
+        
+        A where filter is resolved to ids by Chroma's metadata index, and the
+        quantized search is restricted to those rows.
+        """
+        rows = None
+        if where:
+            rows = index.rows_for(collection.get(where=where, include=[])['ids'])
+        hits = index.search(query_embeddings, n_results, rows)
+        
+        ids = list(dict.fromkeys(doc_id for hit in hits for doc_id, _ in hit))
+        records = collection.get(ids=ids, include=['documents', 'metadatas']) if ids else \
+            {'ids': [], 'documents': [], 'metadatas': []}
+        by_id = {doc_id: (text, metadata)
+                 for doc_id, text, metadata in zip(records['ids'], records['documents'], records['metadatas'])}
+        
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for hit in hits:
+            found = [(doc_id, score) for doc_id, score in hit if doc_id in by_id]
+            results['ids'].append([doc_id for doc_id, _ in found])
+            results['documents'].append([by_id[doc_id][0] for doc_id, _ in found])
+            results['metadatas'].append([by_id[doc_id][1] for doc_id, _ in found])
+            results['distances'].append([1.0 - score for _, score in found])
+        return results
+    
+    def _expand_keyword_query(self, query: str) -> str:
+        """Rewrite a query to emphasize its keywords"""
+        # ChromaDB doesn't have built-in keyword search, so we'll use similarity search
+        # but with query preprocessing to emphasize keywords
+        keywords = query.lower().split()
+        return " ".join(keywords + [f"important: {word}" for word in keywords])
+    
+    def embed_keyword_queries(self, queries: List[str]) -> List[Any]:
+        """Embed the keyword-expanded form of queries in one encoder batch"""
+        return self.embed_queries([self._expand_keyword_query(query) for query in queries])
+    
+    def keyword_search(self, query: str, k: int = 5,
+                       where: Optional[Dict[str, Any]] = None, collection=None) -> List[Document]:
         """Perform keyword-based search"""
+        return self.keyword_search_batch([query], k=k, where=where, collection=collection)[0]
+    
+    def keyword_search_batch(self, queries: List[str], k: int = 5,
+                             where: Optional[Dict[str, Any]] = None,
+                             query_embeddings: Optional[List[Any]] = None,
+                             collection=None) -> List[List[Document]]:
+        """Perform keyword-based search for many queries at once
+        
+        Precomputed query_embeddings must be of the expanded keyword queries
+        (see embed_keyword_queries).
+        """
         try:
-            # ChromaDB doesn't have built-in keyword search, so we'll use similarity search
-            # but with query preprocessing to emphasize keywords
-            keywords = query.lower().split()
-            expanded_query = " ".join(keywords + [f"important: {word}" for word in keywords])
-            
-            return self.similarity_search(expanded_query, k)
+            expanded_queries = [self._expand_keyword_query(query) for query in queries]
+            return self.similarity_search_batch(expanded_queries, k=k, where=where,
+                                                query_embeddings=query_embeddings, collection=collection)
             
         except Exception as e:
-            st.warning(f"Error during keyword search: {str(e)}")
-            return []
+            logger.warning(f"Error during keyword search: {str(e)}")
+            return [[] for _ in queries]
     
     def get_full_document(self, source: str) -> Optional[Document]:
         """Get the full document for parent document retrieval"""
@@ -318,25 +912,58 @@ class VectorStore:
         """Generate unique document ID"""
         return hashlib.md5(content.encode()).hexdigest()
     
-    def _save_full_documents(self):
-        """Save full documents to disk"""
+    def _full_documents_path(self, version: Optional[str] = None) -> str:
+        """The live full documents, or those staged for an index version that is not live yet"""
+        path = os.path.join(self.persist_directory, "full_documents.pkl")
+        return f"{path}.{version}" if version else path
+    
+    def _save_full_documents(self, full_documents: Optional[Dict[str, Any]] = None, version: Optional[str] = None):
+        """Save full documents (the store's own unless given) to disk, staged for version when given"""
         try:
-            full_docs_path = os.path.join(self.persist_directory, "full_documents.pkl")
-            with open(full_docs_path, 'wb') as f:
-                pickle.dump(self.full_documents, f)
+            # Written aside and renamed, so readers in other processes never load half a file
+            full_docs_path = self._full_documents_path(version)
+            with open(full_docs_path + ".tmp", 'wb') as f:
+                pickle.dump(self.full_documents if full_documents is None else full_documents, f)
+            os.replace(full_docs_path + ".tmp", full_docs_path)
+            if version is None and self.version and os.path.exists(self._full_documents_path(self.version)):
+                # Superseded by what was just saved
+                os.remove(self._full_documents_path(self.version))
         except Exception as e:
-            st.warning(f"Error saving full documents: {str(e)}")
+            logger.warning(f"Error saving full documents: {str(e)}")
     
     def _load_full_documents(self):
         """Load full documents from disk"""
+        self.full_documents = self._read_full_documents(self.version)
+    
+    def _read_full_documents(self, version: str = "") -> Dict[str, Any]:
         try:
-            full_docs_path = os.path.join(self.persist_directory, "full_documents.pkl")
+            # A version's staged documents are only left behind if the writer
+            # stopped between switching to it and moving them into place
+            full_docs_path = self._full_documents_path(version)
+            if not os.path.exists(full_docs_path):
+                full_docs_path = self._full_documents_path()
             if os.path.exists(full_docs_path):
                 with open(full_docs_path, 'rb') as f:
-                    self.full_documents = pickle.load(f)
+                    return pickle.load(f)
         except Exception as e:
-            st.warning(f"Error loading full documents: {str(e)}")
-            self.full_documents = {}
+            logger.warning(f"Error loading full documents: {str(e)}")
+        return {}
+    
+    def _built_hnsw(self) -> Dict[str, int]:
+        """HNSW parameters the live index has, which may differ from those this store was opened with
+        
+        M and construction_ef come from the metadata the collection was
+        created with; search_ef from its configuration, since it can change.
+        """
+        collection = self.collection
+        if isinstance(collection, ShardedCollection):
+            collection = collection.shards[0]
+        metadata = getattr(collection, 'metadata', None) or {}
+        params = {key: metadata[f"hnsw:{key}"] for key in HNSW_PARAMS if f"hnsw:{key}" in metadata}
+        ef_search = ((getattr(collection, 'configuration', None) or {}).get('hnsw') or {}).get('ef_search')
+        if ef_search is not None and ('search_ef' in params or 'search_ef' in self.hnsw):
+            params['search_ef'] = ef_search
+        return params
     
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store"""
@@ -359,7 +986,17 @@ class VectorStore:
                 'total_chunks': count,
                 'total_companies': len(companies),
                 'industries': list(industries),
-                'full_documents': len(self.full_documents)
+                'full_documents': len(self.full_documents),
+                'granularities': {f"{size}/{overlap}": collection.count()
+                                  for (size, overlap), collection in self.collections.items()},
+                'backend': self.backend.name,
+                'hnsw': self._built_hnsw(),
+                'shards': ([shard.count() for shard in self.collection.shards]
+                           if isinstance(self.collection, ShardedCollection) else [count]),
+                'shard_by': self.shard_by,
+                'read_only': self.read_only,
+                'generation': self.generation,
+                'version': self.version
             }
             
         except Exception as e:
@@ -371,99 +1008,322 @@ class VectorStore:
                 'error': str(e)
             }
     
-    def clear_store(self):
+    def clear_store(self, progress: Optional[ProgressCallback] = None):
         """Clear all data from the vector store"""
+        progress = get_progress(progress)
+        
+        with self._writing():
+            try:
+                # Delete and recreate every granularity's collection
+                for granularity in self.granularities:
+                    self._invalidate_quantized(self.collections[granularity])
+                    for name in self._backend_collection_names(granularity):
+                        self.backend.delete_collection(name)
+                    self.collections[granularity] = self._get_or_create_collection(granularity)
+                self.collection = self.collections[self.default_granularity]
+                self._views.clear()
+                
+                # Clear full documents
+                self.full_documents = {}
+                self._save_full_documents()
+                self._record_pending_write('clear', None)
+                
+                return True
+            except Exception as e:
+                progress.error(f"Error clearing vector store: {str(e)}")
+                return False
+    
+    def refresh_store(self, customer_stories: List[Dict[str, Any]], progress: Optional[ProgressCallback] = None):
+        """Replace the store's contents with new data, without readers ever seeing a partial index
+        
+        The stories are indexed into a new version of every collection,
+        which is validated and then switched in; until then searches use
+        the current version. Returns False (keeping the current version)
+        when the new one fails validation.
+        """
+        progress = get_progress(progress)
+        
+        def build(collections):
+            progress.info("Processing and storing customer stories in a new index version...")
+            full_documents = {}
+            documents_by_granularity = self._chunk_stories(customer_stories, full_documents, progress)
+            self._index_granularities(documents_by_granularity, progress, collections)
+            return full_documents, {granularity: len(documents)
+                                    for granularity, documents in documents_by_granularity.items()}
+        
         try:
-            # Delete the collection
-            self.client.delete_collection(name=self.collection_name)
-            
-            # Recreate the collection
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-            
-            # Clear full documents
-            self.full_documents = {}
-            self._save_full_documents()
-            
-            return True
-        except Exception as e:
-            st.error(f"Error clearing vector store: {str(e)}")
+            self._build_and_switch(build, progress)
+        except ValueError as e:
+            progress.error(f"The new index was discarded and the current one kept: {str(e)}")
             return False
+        return True
     
-    def refresh_store(self, customer_stories: List[Dict[str, Any]]):
-        """Clear and repopulate the vector store with new data"""
-        # Clear existing data
-        if self.clear_store():
-            # Repopulate with new data
-            self.populate_store(customer_stories)
-            return True
-        return False
+    def _build_and_switch(self, build, progress: Optional[ProgressCallback] = None) -> str:
+        """Build a new index version with build(collections), validate it, then make it the live one
+        
+        build fills the new version's collections and returns its full
+        documents and the chunk count expected in each granularity. Nothing
+        else touches a version while it is built, so only recording it and
+        the switch itself hold the writer lock; readers reloading carry on
+        meanwhile, and other writes go to the live version and are logged,
+        then replayed into the new one just before it is switched in. A
+        version that fails validation is dropped and ValueError raised.
+        Returns the new version.
+        """
+        progress = get_progress(progress)
+        version = uuid.uuid4().hex[:8]
+        
+        with self.write_lock:
+            state = read_active_index(self.persist_directory)
+            for abandoned in [entry for entry in state['building'] if owner_gone(entry)]:
+                # Left over from a build whose process died
+                self._drop_version(abandoned['version'])
+            building = [entry for entry in state['building'] if not owner_gone(entry)]
+            write_active_index(self.persist_directory, {
+                **state, 'building': building + [{'version': version, **owner()}]})
+        
+        collections = {granularity: self._get_or_create_collection(granularity, version)
+                       for granularity in self.granularities}
+        try:
+            full_documents, expected = build(collections)
+            with self._writing():
+                self._validate_version(collections, full_documents, expected)
+                replayed = self._replay_pending_writes(version, collections, full_documents)
+                if replayed:
+                    progress.info(f"Applied {replayed} writes made while the new index version was built")
+                
+                # Stage the documents, switch, then move them into place; a
+                # reader of the new version finds them either way
+                state = read_active_index(self.persist_directory)
+                self._save_full_documents(full_documents, version)
+                write_active_index(self.persist_directory, {
+                    'version': version,
+                    'building': [entry for entry in state['building'] if entry['version'] != version],
+                    'retired': state['retired'] + [{'version': state['version'], 'retired_at': time.time()}],
+                })
+                os.replace(self._full_documents_path(version), self._full_documents_path())
+                if os.path.exists(self._pending_writes_path(version)):
+                    os.remove(self._pending_writes_path(version))
+                
+                # Searches already running finish on the collections they started with
+                self.version = version
+                self.collections = collections
+                self.collection = collections[self.default_granularity]
+                self.full_documents = full_documents
+                progress.success(f"Switched to index version {version} "
+                                 f"with {self.collection.count()} document chunks")
+        except Exception:
+            with self.write_lock:
+                state = read_active_index(self.persist_directory)
+                if state['version'] == version:
+                    # Failed after going live; the version stays
+                    raise
+                self._drop_version(version)
+                write_active_index(self.persist_directory, {
+                    **state, 'building': [entry for entry in state['building'] if entry['version'] != version]})
+            raise
+        
+        # Readers elsewhere move to the new version within RELOAD_CHECK_SECONDS
+        timer = threading.Timer(RETIRED_GRACE_SECONDS, self._collect_garbage_later)
+        timer.daemon = True
+        timer.start()
+        return version
+    
+    def _validate_version(self, collections: Dict[Tuple[int, int], Any], full_documents: Dict[str, Any],
+                          expected: Dict[Tuple[int, int], int]):
+        """Raise ValueError unless a built version is complete and searchable"""
+        if not full_documents:
+            raise ValueError("no stories were indexed")
+        for granularity, collection in collections.items():
+            count = collection.count()
+            if count != expected.get(granularity, 0):
+                raise ValueError(f"{collection.name} has {count} chunks; "
+                                 f"expected {expected.get(granularity, 0)}")
+        default = collections[self.default_granularity]
+        if not default.count():
+            raise ValueError(f"{default.name} is empty")
+        sample = default.get(limit=1, include=['embeddings'])
+        found = default.query(query_embeddings=[sample['embeddings'][0]], n_results=1, include=[])
+        if not found['ids'][0]:
+            raise ValueError(f"{default.name} returned nothing for one of its own chunks")
+    
+    def _drop_version(self, version: str):
+        """Delete an index version's collections, quantized indexes, staged documents and logged writes"""
+        for granularity in self.granularities:
+            for name in self._backend_collection_names(granularity, version):
+                try:
+                    self.backend.delete_collection(name)
+                except Exception:
+                    # Never created, or already dropped
+                    pass
+            shutil.rmtree(os.path.join(self.persist_directory, "quantized",
+                                       collection_name(granularity, self.chunk_unit, version)), ignore_errors=True)
+            self._quantized.pop(collection_name(granularity, self.chunk_unit, version), None)
+        for path in (self._full_documents_path(version), self._pending_writes_path(version)):
+            if version and os.path.exists(path):
+                os.remove(path)
+    
+    def _collect_garbage_later(self):
+        if not os.path.isdir(self.persist_directory):
+            return
+        try:
+            self.collect_garbage()
+        except Exception as e:
+            logger.warning(f"Error dropping retired index versions: {str(e)}")
     
-    def add_or_update_stories(self, customer_stories: List[Dict[str, Any]]):
+    def collect_garbage(self, grace: float = RETIRED_GRACE_SECONDS) -> List[str]:
+        """Drop index versions retired more than grace seconds ago; returns the versions dropped"""
+        if self.read_only:
+            return []
+        with self.write_lock:
+            state = read_active_index(self.persist_directory)
+            now = time.time()
+            expired = [entry for entry in state['retired'] if now - entry['retired_at'] >= grace]
+            for entry in expired:
+                self._drop_version(entry['version'])
+            if expired:
+                write_active_index(self.persist_directory, {
+                    **state, 'retired': [entry for entry in state['retired'] if entry not in expired]})
+                logger.info(f"Dropped retired index versions {[entry['version'] for entry in expired]}")
+            return [entry['version'] for entry in expired]
+    
+    def add_or_update_stories(self, customer_stories: List[Dict[str, Any]], progress: Optional[ProgressCallback] = None):
         """Add new stories or update existing ones"""
-        st.info("Adding/updating customer stories...")
-        progress_bar = st.progress(0)
+        progress = get_progress(progress)
+        
+        with self._writing():
+            progress.info("Adding/updating customer stories...")
+            full_documents = dict(self.full_documents)
+            added_count, updated_count = self._upsert_stories(customer_stories, full_documents,
+                                                              self.collections, progress)
         
+            # Swap in the new documents and save them
+            self.full_documents = full_documents
+            self._save_full_documents()
+            self._record_pending_write('upsert', customer_stories)
+        
+            progress.success(f"Added {added_count} new stories, updated {updated_count} existing stories!")
+            return True
+
+    def _upsert_stories(self, customer_stories: List[Dict[str, Any]], full_documents: Dict[str, Any],
+                        collections: Dict[Tuple[int, int], Any],
+                        progress: Optional[ProgressCallback] = None) -> Tuple[int, int]:
+        """Index stories into collections, replacing any stored under the same URL; returns (added, updated)"""
+        progress = get_progress(progress)
         updated_count = 0
         added_count = 0
+        token_starts = self._token_starts(customer_stories)
         
         for i, story in enumerate(customer_stories):
             try:
-                doc_id_prefix = self._generate_doc_id(story['url'])
-                
-                # Check if this story already exists
-                existing = False
-                try:
-                    # Check if we have this URL in full_documents
-                    if story['url'] in self.full_documents:
-                        existing = True
-                except:
-                    pass
-                
-                # Create documents from the story
-                documents = self._create_documents_from_story(story)
+                # Create documents from the story at every granularity
+                documents_by_granularity = {
+                    granularity: self._create_documents_from_story(story, granularity, token_starts[i])
+                    for granularity in self.granularities
+                }
                 
-                if existing:
+                if story['url'] in full_documents:
                     # Delete old documents for this story
-                    self._delete_story_documents(story['url'])
+                    self._delete_story_documents(story['url'], progress,
+                                                 industry=full_documents[story['url']].get('industry', ''),
+                                                 collections=collections)
                     updated_count += 1
                 else:
                     added_count += 1
                 
                 # Add new documents
-                self._add_documents_to_collection(documents)
+                self._index_granularities(documents_by_granularity, progress, collections)
                 
                 # Store full document
-                self.full_documents[story['url']] = story
-                
-                progress_bar.progress((i + 1) / len(customer_stories))
+                full_documents[story['url']] = story
                 
+                progress.progress((i + 1) / len(customer_stories))
+            
             except Exception as e:
-                st.warning(f"Error processing story {story.get('title', 'Unknown')}: {str(e)}")
-        
-        # Save full documents
-        self._save_full_documents()
+                progress.warning(f"Error processing story {story.get('title', 'Unknown')}: {str(e)}")
         
-        st.success(f"Added {added_count} new stories, updated {updated_count} existing stories!")
-        return True
-    
-    def _delete_story_documents(self, url: str):
-        """Delete all documents associated with a story URL"""
+        return added_count, updated_count
+
+    def remove_stories(self, urls: Sequence[str], progress: Optional[ProgressCallback] = None) -> int:
+        """Remove stories and all their chunks; returns how many were stored"""
+        progress = get_progress(progress)
+
+        with self._writing():
+            full_documents = dict(self.full_documents)
+            removed = self._remove_from(urls, full_documents, self.collections, progress)
+
+            if removed:
+                self.full_documents = full_documents
+                self._save_full_documents()
+                self._record_pending_write('remove', removed)
+                progress.info(f"Removed {len(removed)} stories")
+            return len(removed)
+
+    def _remove_from(self, urls: Sequence[str], full_documents: Dict[str, Any],
+                     collections: Dict[Tuple[int, int], Any],
+                     progress: Optional[ProgressCallback] = None) -> List[str]:
+        """Delete stories from full_documents and their chunks from collections; returns those found"""
+        removed = [url for url in urls if url in full_documents]
+        for url in removed:
+            self._delete_story_documents(url, progress, industry=full_documents.pop(url).get('industry', ''),
+                                         collections=collections)
+        return removed
+
+    def _pending_writes_path(self, version: str) -> str:
+        return os.path.join(self.persist_directory, f"pending_writes.{version}.pkl")
+
+    def _record_pending_write(self, kind: str, payload: Any):
+        """Log a write for every index version being built, which started from older data
+
+        Called under the writer lock, so each write is either logged or made
+        after the version was switched in; the switch replays the log.
+        """
+        for entry in read_active_index(self.persist_directory)['building']:
+            with open(self._pending_writes_path(entry['version']), 'ab') as f:
+                pickle.dump((kind, payload), f)
+
+    def _replay_pending_writes(self, version: str, collections: Dict[Tuple[int, int], Any],
+                               full_documents: Dict[str, Any]) -> int:
+        """Apply the writes logged while version was built to it; returns how many there were"""
+        writes = []
         try:
-            # Get all documents
-            all_docs = self.collection.get()
-            
-            # Find IDs to delete
-            ids_to_delete = []
-            if all_docs['metadatas']:
-                for i, metadata in enumerate(all_docs['metadatas']):
-                    if metadata.get('source') == url:
-                        ids_to_delete.append(all_docs['ids'][i])
-            
-            # Delete the documents
-            if ids_to_delete:
-                self.collection.delete(ids=ids_to_delete)
-        except Exception as e:
-            st.warning(f"Error deleting old documents for {url}: {str(e)}")
+            with open(self._pending_writes_path(version), 'rb') as f:
+                while True:
+                    writes.append(pickle.load(f))
+        except FileNotFoundError:
+            pass
+        except (EOFError, pickle.UnpicklingError):
+            # The end of the log, or a write cut short by its process dying
+            pass
+        for kind, payload in writes:
+            if kind == 'upsert':
+                self._upsert_stories(payload, full_documents, collections)
+            elif kind == 'remove':
+                self._remove_from(payload, full_documents, collections)
+            elif kind == 'clear':
+                self._remove_from(list(full_documents), full_documents, collections)
+        return len(writes)
+
+    def _delete_story_documents(self, url: str, progress: Optional[ProgressCallback] = None,
+                                industry: Optional[str] = None,
+                                collections: Optional[Dict[Tuple[int, int], Any]] = None):
+        """Delete all documents associated with a story URL, at every granularity
+        
+        The story's industry, when known, narrows the filter so a store
+        sharded by industry only touches that industry's shard. Collections
+        default to the live ones.
+        """
+        progress = get_progress(progress)
+        collections = collections if collections is not None else self.collections
+        where = {'source': url} if industry is None else {'$and': [{'source': url}, {'industry': industry}]}
+        for collection in collections.values():
+            try:
+                # Find the story's IDs
+                ids_to_delete = collection.get(where=where, include=[])['ids']
+                
+                # Delete the documents
+                if ids_to_delete:
+                    collection.delete(ids=ids_to_delete, where=where)
+                    self._invalidate_quantized(collection)
+            except Exception as e:
+                progress.warning(f"Error deleting old documents for {url}: {str(e)}")